@@ -9,9 +9,13 @@ import sys
 import json
 import subprocess
 import logging
+import re
 import hashlib
+import sqlite3
 import redis
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from datetime import datetime, timedelta
 from flask import Flask, request, jsonify, Response
 from functools import wraps
@@ -35,6 +39,12 @@ leann_request_duration = Histogram('leann_request_duration_seconds', 'Request du
 # Configuration
 LEANN_COMMAND = "leann"
 DEFAULT_INDEX = "myvault"
+LEANN_INDEXES_DIR = os.getenv("LEANN_INDEXES_DIR", "/root/.leann/indexes")
+LEANN_STATE_DB = os.getenv("LEANN_STATE_DB", "/var/lib/leann/reindex-state.db")
+# Search backend: "cli" shells out to `leann search`; "mmap" answers in-process from the
+# vector export of the active generation (scripts/vector_index.py), falling back to the CLI
+SEARCH_BACKEND = os.getenv("LEANN_SEARCH_BACKEND", "cli")
+LEANN_SCRIPTS_DIR = os.getenv("LEANN_SCRIPTS_DIR", "/opt/leann")
 API_TOKEN = os.getenv("LEANN_API_TOKEN", "leann_api_2025")
 PORT = int(os.getenv("LEANN_API_PORT", "3001"))
 HOST = os.getenv("LEANN_API_HOST", "0.0.0.0")
@@ -42,10 +52,22 @@ HOST = os.getenv("LEANN_API_HOST", "0.0.0.0")
 # Redis Configuration - try host first, fallback to localhost
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")  # Use localhost since Redis is port-mapped
 REDIS_PORT = int(os.getenv("REDIS_PORT", "26379"))  # BillionMail Redis mapped port
-REDIS_PASSWORD = "zKLnZQr3riFpcS2lEy3MOtfncztaCGKp"  # From BillionMail .env
+REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", "zKLnZQr3riFpcS2lEy3MOtfncztaCGKp")  # From BillionMail .env; same default as scripts/cache_invalidation.py
 REDIS_DB = 1  # Use DB 1 to avoid conflict with BillionMail (uses DB 0)
 CACHE_TTL_SECONDS = 3600  # 1 hour cache
 CACHE_ENABLED = os.getenv("REDIS_CACHE_ENABLED", "true").lower() == "true"
+# Reverse index used by the reindexer for targeted invalidation (see scripts/cache_invalidation.py)
+SOURCE_INDEX_PREFIX = "leann-src:"
+UNCITED_KEY = "leann-uncited"
+LOAD_KEY_PREFIX = "leann-load:"  # search load signal read by the reindex daemons
+LOAD_BUCKET_SECONDS = 10
+SEARCH_MODES = ('vector', 'lexical', 'hybrid')
+FANOUT_TIMEOUT_SECONDS = float(os.getenv("LEANN_FANOUT_TIMEOUT", "10"))  # per-index deadline for list searches
+FANOUT_MAX_INDEXES = 8
+SHARD_REGISTRY_TTL = 30  # seconds a shard map read from the state DB is reused
+INDEX_LISTING_MAX_AGE = 300  # backstop refresh for legacy indexes rebuilt in place
+HYBRID_DEPTH_FACTOR = 4  # candidates per ranking fused by reciprocal-rank fusion = top_k * factor
+SOURCE_LINE_RE = re.compile(r"^[ \t]*Source:[ \t]*(\S.*?)[ \t]*$", re.MULTILINE)
 
 # Logging setup
 logging.basicConfig(
@@ -126,6 +148,499 @@ def set_cache(cache_key, data):
     except Exception as e:
         logger.error(f"Cache set error: {str(e)}")
 
+def get_index_generation(index_name):
+    """Return the active blue/green generation of an index (None for legacy indexes)"""
+    try:
+        target = os.readlink(os.path.join(LEANN_INDEXES_DIR, index_name))
+    except OSError:
+        return None
+    name = os.path.basename(target.rstrip('/'))
+    return int(name[4:]) if name.startswith('gen-') and name[4:].isdigit() else None
+
+def get_recent_builds(index_name, limit=1):
+    """Latest builds recorded by the reindex daemons (read-only, WAL readers never block them)"""
+    if not os.path.exists(LEANN_STATE_DB):
+        return []
+    
+    try:
+        conn = sqlite3.connect(f"file:{LEANN_STATE_DB}?mode=ro", uri=True, timeout=1)
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = conn.execute(
+                "SELECT id, daemon, started_at, finished_at, status, generation, embedding_mode, chunks, "
+                "embedded_chunks, hit_ratio, changed_files FROM builds WHERE index_name = ? "
+                "ORDER BY finished_at DESC LIMIT ?", (index_name, limit)
+            ).fetchall()
+            builds = []
+            for row in rows:
+                build = dict(row)
+                build['timings'] = dict(conn.execute(
+                    "SELECT phase, seconds FROM build_phases WHERE build_id = ?", (row['id'],)
+                ).fetchall())
+                builds.append(build)
+            return builds
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"Reindex state read error: {str(e)}")
+        return []
+
+# Index metadata served by /indexes, rebuilt only when an index entry changes
+_index_listing = {'version': None, 'loaded_at': 0, 'indexes': []}
+_index_listing_lock = threading.Lock()
+
+def index_listing_version():
+    """Cheap fingerprint of the indexes directory: symlink targets and legacy directory mtimes
+    
+    Promoting or rolling back a generation swaps the index symlink, so a new target
+    means the reindexer published a new generation.
+    """
+    version = []
+    if not os.path.isdir(LEANN_INDEXES_DIR):
+        return ()
+    with os.scandir(LEANN_INDEXES_DIR) as entries:
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_symlink():
+                version.append((entry.name, os.readlink(entry.path)))
+            elif entry.is_dir():
+                version.append((entry.name, entry.stat().st_mtime_ns))
+    return tuple(sorted(version))
+
+def read_json_file(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def describe_index(name):
+    """Metadata of one index: generation, size, chunk count, build time and embedding model"""
+    path = os.path.realpath(os.path.join(LEANN_INDEXES_DIR, name))
+    generation_info = read_json_file(os.path.join(path, 'generation.json'))
+    vectors_meta = read_json_file(os.path.join(path, 'vectors', 'meta.json'))
+    leann_meta = read_json_file(os.path.join(path, 'documents.leann.meta.json'))
+    
+    size_bytes, newest = 0, 0
+    for root, _, files in os.walk(path):
+        for file_name in files:
+            try:
+                stat = os.stat(os.path.join(root, file_name))
+            except OSError:
+                continue
+            size_bytes += stat.st_size
+            newest = max(newest, stat.st_mtime)
+    
+    chunks = (generation_info.get('report') or {}).get('chunks') or vectors_meta.get('count')
+    passages = os.path.join(path, 'documents.leann.passages.jsonl')
+    if chunks is None and os.path.exists(passages):
+        with open(passages, 'rb') as f:
+            chunks = sum(block.count(b'\n') for block in iter(lambda: f.read(1 << 20), b''))
+    built_at = generation_info.get('promoted_at') or vectors_meta.get('created_at') or newest or None
+    return {
+        'name': name,
+        'generation': get_index_generation(name),
+        'path': path,
+        'size_bytes': size_bytes,
+        'chunks': chunks,
+        'built_at': datetime.utcfromtimestamp(built_at).isoformat() if built_at else None,
+        'embedding_model': vectors_meta.get('embedding_model') or leann_meta.get('embedding_model'),
+        'embedding_mode': vectors_meta.get('embedding_mode') or leann_meta.get('embedding_mode'),
+        'shard_of': name.split('@', 1)[0] if '@' in name else None
+    }
+
+def get_index_listing(refresh=False):
+    """Metadata of all indexes from memory; returns (indexes, served from cache)"""
+    version = index_listing_version()
+    with _index_listing_lock:
+        if (not refresh and version == _index_listing['version']
+                and time.time() - _index_listing['loaded_at'] < INDEX_LISTING_MAX_AGE):
+            return _index_listing['indexes'], True
+        indexes = [describe_index(name) for name, _ in version]
+        _index_listing.update({'version': version, 'loaded_at': time.time(), 'indexes': indexes})
+        logger.info(f"Index listing refreshed ({len(indexes)} indexes)")
+        return indexes, False
+
+# Shard maps per logical index: (read at, {shard folder: shard index})
+_shard_maps = {}
+
+def get_index_shards(index_name):
+    """Shards of an index split by top-level vault folder (empty for unsharded indexes)"""
+    cached = _shard_maps.get(index_name)
+    if cached and time.time() - cached[0] < SHARD_REGISTRY_TTL:
+        return cached[1]
+    shards = {}
+    if os.path.exists(LEANN_STATE_DB):
+        try:
+            conn = sqlite3.connect(f"file:{LEANN_STATE_DB}?mode=ro", uri=True, timeout=1)
+            try:
+                shards = dict(conn.execute("SELECT shard, shard_index FROM shards WHERE index_name = ?",
+                                           (index_name,)).fetchall())
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            # State DB from before sharding has no shards table
+            logger.debug(f"Shard registry read error: {str(e)}")
+    _shard_maps[index_name] = (time.time(), shards)
+    return shards
+
+def route_shards(shards, filters=None):
+    """Shard indexes that can hold notes matching the filters (all of them without a path_prefix)"""
+    prefix = (filters or {}).get('path_prefix')
+    if not prefix:
+        return sorted(shards.values())
+    if '/' in prefix:
+        folder = prefix.split('/', 1)[0]
+        return [shards[folder]] if folder in shards else []
+    # A bare prefix may be a partial folder name or a note at the vault root
+    return sorted(index for shard, index in shards.items() if shard.startswith(prefix) or shard == '_root')
+
+def sharded_search(index_name, shards, query, top_k, mode='vector', filters=None, timeout=None):
+    """Route a search to the relevant shards and merge them as one index"""
+    targets = route_shards(shards, filters)
+    if not targets:
+        return {'success': True, 'query': query, 'index': index_name, 'top_k': top_k, 'generation': {},
+                'mode': mode, 'filters': filters, 'backend': 'sharded', 'shards': {}, 'partial': False,
+                'results': format_matches(query, []), 'matches': [], 'cached': False,
+                'timestamp': datetime.utcnow().isoformat()}
+    response_data = fanout_search([index_name], query, top_k, mode, filters, timeout, normalize=False)
+    status = response_data.pop('indexes')[index_name]
+    response_data.update({'success': status['status'] == 'ok', 'index': index_name, 'backend': 'sharded',
+                          'shards': status['shards']})
+    return response_data
+
+# Memory-mapped indexes per index name: (generation dir, VectorIndex, QueryEmbedder)
+_vector_indexes = {}
+_vector_lock = threading.Lock()
+# Shared pool for multi-index searches; timed-out searches finish in the background
+_fanout_executor = ThreadPoolExecutor(max_workers=FANOUT_MAX_INDEXES * 2, thread_name_prefix='fanout')
+# Lexical (BM25) index connections, one per request thread
+_lexical_local = threading.local()
+# Related-notes graphs per index: ((inode, mtime), RelatedGraph), reopened when the builder replaces the file
+_related_graphs = {}
+_related_lock = threading.Lock()
+
+def import_script(name):
+    """Import a module from the reindex scripts directory (/opt/leann)"""
+    if LEANN_SCRIPTS_DIR not in sys.path:
+        sys.path.insert(0, LEANN_SCRIPTS_DIR)
+    return __import__(name)
+
+def get_vector_index(index_name):
+    """Vector export of the active generation, reopened after each promotion
+    
+    The files are mapped read-only, so every worker process serving the API shares
+    the same page-cache pages instead of holding its own copy of the index.
+    """
+    generation_dir = os.path.realpath(os.path.join(LEANN_INDEXES_DIR, index_name))
+    with _vector_lock:
+        cached = _vector_indexes.get(index_name)
+        if cached and cached[0] == generation_dir:
+            return cached[1], cached[2]
+        
+        vector_index = import_script('vector_index')
+        index = vector_index.VectorIndex(generation_dir)
+        embedder = cached[2] if cached else None
+        if not embedder or (embedder.embedding_model, embedder.embedding_mode) != (
+                index.meta['embedding_model'], index.meta['embedding_mode']):
+            embedder = vector_index.QueryEmbedder(index.meta['embedding_model'], index.meta['embedding_mode'])
+        _vector_indexes[index_name] = (generation_dir, index, embedder)
+        logger.info(f"Loaded vector index {index_name} from {generation_dir} "
+                    f"({index.count} vectors, {index.quantization}, {index.ivf_lists} IVF lists)")
+        return index, embedder
+
+def parse_filters(raw):
+    """Validate /search filters: path_prefix, tags, modified_after/before (ISO or epoch), modified_within_days"""
+    if not raw:
+        return None
+    if not isinstance(raw, dict):
+        raise ValueError('filters must be an object')
+    unknown = set(raw) - {'path_prefix', 'tags', 'modified_after', 'modified_before', 'modified_within_days'}
+    if unknown:
+        raise ValueError(f"unknown filters: {', '.join(sorted(unknown))}")
+    
+    def timestamp(value):
+        if isinstance(value, (int, float)):
+            return float(value)
+        return datetime.fromisoformat(str(value)).timestamp()
+    
+    filters = {}
+    if raw.get('path_prefix'):
+        filters['path_prefix'] = str(raw['path_prefix']).lstrip('/')
+    if raw.get('tags'):
+        tags = raw['tags']
+        filters['tags'] = [tags] if isinstance(tags, str) else [str(tag) for tag in tags]
+    if raw.get('modified_after') is not None:
+        filters['modified_after'] = timestamp(raw['modified_after'])
+    if raw.get('modified_before') is not None:
+        filters['modified_before'] = timestamp(raw['modified_before'])
+    if raw.get('modified_within_days') is not None:
+        filters['modified_after'] = max(filters.get('modified_after', 0),
+                                        time.time() - float(raw['modified_within_days']) * 86400)
+    return filters or None
+
+def search_in_process(index_name, query, top_k, filters=None):
+    """k-NN search over the memory-mapped export, pre-filtered by note metadata"""
+    index, embedder = get_vector_index(index_name)
+    rows = index.filter_rows(**filters) if filters else None
+    if rows is not None and not len(rows):
+        return []
+    rows, scores = index.search(embedder.embed(query), top_k, rows=rows)
+    return index.results(rows, scores)
+
+def search_lexical(index_name, query, top_k, filters=None):
+    """BM25 search over the lexical index maintained by the builder (no embedding)"""
+    indexes = getattr(_lexical_local, 'indexes', None)
+    if indexes is None:
+        indexes = _lexical_local.indexes = {}
+    # The database lives in the active generation: reopen it after a promotion or rollback
+    lexical_index = import_script('lexical_index')
+    path = os.path.realpath(lexical_index.index_db_path(index_name))
+    cached = indexes.get(index_name)
+    if cached is None or cached.path != path:
+        if cached is not None:
+            cached.close()
+        cached = indexes[index_name] = lexical_index.LexicalIndex(index_name, path)
+    # Filters resolve to the allowed notes through the metadata index of the vector export
+    sources = get_vector_index(index_name)[0].filter_sources(**filters) if filters else None
+    return cached.search(query, top_k, sources=sources)
+
+def get_related_graph(index_name):
+    """Precomputed note k-NN graph of an index, memory-mapped and reloaded after each build"""
+    related_notes = import_script('related_notes')
+    # Resolved through the active generation: a promotion or rollback swaps the graph too
+    path = os.path.realpath(related_notes.graph_path(index_name))
+    stat = os.stat(path)
+    version = (path, stat.st_ino, stat.st_mtime_ns)
+    with _related_lock:
+        cached = _related_graphs.get(index_name)
+        if cached and cached[0] == version:
+            return cached[1]
+        graph = related_notes.RelatedGraph(path)
+        _related_graphs[index_name] = (version, graph)
+        logger.info(f"Loaded related-notes graph {index_name} ({len(graph.sources)} notes, k={graph.k})")
+        return graph
+
+def search_vector(index_name, query, top_k, filters=None):
+    """Vector search through the configured backend, falling back to the CLI"""
+    # Filters are applied before the scan, which only the in-process index can do
+    if SEARCH_BACKEND == 'mmap' or filters:
+        try:
+            matches = search_in_process(index_name, query, top_k, filters)
+            return {'success': True, 'backend': 'mmap', 'matches': matches,
+                    'stdout': format_matches(query, matches)}
+        except Exception as e:
+            if filters:
+                logger.error(f"Filtered search failed: {str(e)}")
+                return {'success': False, 'error': f'Filtered search requires the vector export: {str(e)}'}
+            logger.warning(f"In-process search failed, falling back to CLI: {str(e)}")
+    
+    # Run LEANN search command; pass the raw query and allow subprocess to handle spacing
+    cmd_args = ['search', index_name, query]
+    if top_k != 5:
+        cmd_args.extend(['--top-k', str(top_k)])
+    result = run_leann_command(cmd_args)
+    result.update({'backend': 'cli', 'matches': None})
+    return result
+
+def execute_search(index_name, query, top_k, mode='vector', filters=None):
+    """Run one search on one index; returns backend, matches (None for CLI text) and results text"""
+    if mode == 'lexical':
+        # Exact-term lookup: BM25 only, no embedding call
+        try:
+            matches = search_lexical(index_name, query, top_k, filters)
+        except Exception as e:
+            logger.error(f"Lexical search error: {str(e)}")
+            return {'success': False, 'status': 503, 'error': f'Lexical index not available: {str(e)}'}
+        return {'success': True, 'backend': 'lexical', 'matches': matches, 'results': format_matches(query, matches)}
+    
+    depth = top_k if mode == 'vector' else max(top_k * HYBRID_DEPTH_FACTOR, 20)
+    result = search_vector(index_name, query, depth, filters)
+    if not result['success']:
+        return {'success': False, 'status': 500, 'error': 'LEANN search failed', 'details': result}
+    backend, matches, results_text = result['backend'], result['matches'], result['stdout']
+    
+    if mode == 'hybrid':
+        try:
+            lexical_matches = search_lexical(index_name, query, depth, filters)
+        except Exception as e:
+            logger.warning(f"Lexical index unavailable, hybrid search uses vectors only: {str(e)}")
+            lexical_matches = []
+        if matches is not None:
+            key = lambda match: match['id']
+        else:
+            # CLI output only carries note paths: fuse both rankings per note
+            key = lambda match: match['metadata'].get('source')
+            matches = source_matches(results_text)
+        matches = import_script('lexical_index').reciprocal_rank_fusion(
+            [matches, lexical_matches], top_k, key=key)
+        backend = f"{backend}+lexical"
+        results_text = format_matches(query, matches)
+    
+    return {'success': True, 'backend': backend, 'matches': matches, 'results': results_text}
+
+def source_matches(search_output):
+    """Ranked note paths of CLI output as matches (score 1/rank, no text)"""
+    sources = dict.fromkeys(SOURCE_LINE_RE.findall(search_output or ''))
+    return [{'id': None, 'text': '', 'metadata': {'source': source}, 'score': 1.0 / rank}
+            for rank, source in enumerate(sources, 1)]
+
+def expand_indexes(index_names, filters=None):
+    """Map each requested index to the indexes actually searched: its routed shards, or itself"""
+    targets = {}
+    for name in index_names:
+        shards = get_index_shards(name)
+        targets[name] = route_shards(shards, filters) if shards else [name]
+    return targets
+
+def merge_shard_matches(shard_matches, mode='vector'):
+    """Merge the rankings of the shards of one logical index into one ranking"""
+    if mode == 'vector':
+        # Shards share one embedding model, so raw scores are comparable across them
+        return sorted((match for matches in shard_matches for match in matches),
+                      key=lambda match: match['score'], reverse=True)
+    # BM25 depends on each shard's own document statistics: merge by rank instead
+    return import_script('lexical_index').reciprocal_rank_fusion(
+        shard_matches, sum(len(matches) for matches in shard_matches),
+        key=lambda match: (match['index'], match['id'] or match['metadata'].get('source')))
+
+def fanout_search(index_names, query, top_k, mode='vector', filters=None, timeout=None, normalize=True):
+    """Search several indexes concurrently and merge one global top-k by normalized score
+    
+    Sharded indexes are expanded to the shards their filters route to and merged
+    as one index before normalization. Each searched index has its own deadline
+    (`timeout` as seconds or {index: seconds}, keyed by shard or logical name);
+    indexes that miss it or fail are reported and the rest is returned as partial.
+    """
+    index_names = list(dict.fromkeys(str(name) for name in index_names))
+    targets = expand_indexes(index_names, filters)
+    
+    def deadline(target, name):
+        if isinstance(timeout, dict):
+            return float(timeout.get(target) or timeout.get(name) or FANOUT_TIMEOUT_SECONDS)
+        return float(timeout or FANOUT_TIMEOUT_SECONDS)
+    
+    started = time.time()
+    futures = {(name, target): _fanout_executor.submit(execute_search, target, query, top_k, mode, filters)
+               for name in index_names for target in targets[name]}
+    
+    target_statuses = {}
+    results = {name: [] for name in index_names}
+    for (name, target), future in futures.items():
+        seconds = deadline(target, name)
+        try:
+            result = future.result(timeout=max(0.0, started + seconds - time.time()))
+        except FuturesTimeoutError:
+            logger.warning(f"Fan-out search: index {target} exceeded {seconds}s")
+            target_statuses[target] = {'status': 'timeout', 'timeout_seconds': seconds}
+            continue
+        except Exception as e:
+            target_statuses[target] = {'status': 'error', 'error': str(e)}
+            continue
+        if not result['success']:
+            target_statuses[target] = {'status': 'error', 'error': result['error']}
+            continue
+        
+        matches = result['matches'] if result['matches'] is not None else source_matches(result['results'])
+        results[name].append([{**match, 'index': target} for match in matches])
+        target_statuses[target] = {'status': 'ok', 'backend': result['backend'], 'results': len(matches),
+                                   'seconds': round(time.time() - started, 3)}
+    
+    statuses = {}
+    merged = []
+    for name in index_names:
+        sharded = targets[name] != [name]
+        matches = merge_shard_matches(results[name], mode) if sharded else (results[name] or [[]])[0]
+        scores = [match['score'] for match in matches]
+        low, high = (min(scores), max(scores)) if scores else (0.0, 0.0)
+        for match in matches:
+            # Min-max per index: cosine, BM25 and RRF scores live on different scales
+            if not normalize:
+                normalized = match['score']
+            elif high > low:
+                normalized = (match['score'] - low) / (high - low)
+            else:
+                normalized = 1.0
+            merged.append({**match, 'normalized_score': normalized})
+        
+        if sharded:
+            shard_statuses = {target: target_statuses[target] for target in targets[name]}
+            failed = [target for target, status in shard_statuses.items() if status['status'] != 'ok']
+            status = 'error' if shard_statuses and len(failed) == len(shard_statuses) else 'ok'
+            statuses[name] = {'status': status, 'backend': 'sharded', 'results': len(matches),
+                              'partial': bool(failed), 'shards': shard_statuses}
+        else:
+            statuses[name] = target_statuses[name]
+    
+    merged.sort(key=lambda match: (match['normalized_score'], match['score']), reverse=True)
+    merged = merged[:top_k]
+    succeeded = [name for name, status in statuses.items() if status['status'] == 'ok']
+    all_targets = [target for name in index_names for target in targets[name]]
+    return {
+        'success': bool(succeeded),
+        'query': query,
+        'index': index_names,
+        'top_k': top_k,
+        'generation': {target: get_index_generation(target) for target in all_targets},
+        'mode': mode,
+        'filters': filters,
+        'backend': 'fanout',
+        'indexes': statuses,
+        'partial': any(status['status'] != 'ok' for status in target_statuses.values()),
+        'results': format_matches(query, merged),
+        'matches': merged,
+        'cached': False,
+        'timestamp': datetime.utcnow().isoformat()
+    }
+
+def format_matches(query, matches):
+    """Render matches like `leann search` output, one Source: line per cited note"""
+    lines = [f"Search results for '{query}' ({len(matches)} results):", ""]
+    for rank, match in enumerate(matches, 1):
+        metadata = match['metadata']
+        lines.append(f"{rank}. Score: {match['score']:.3f}" + (f" [{match['index']}]" if 'index' in match else ""))
+        for source in metadata.get('sources') or [metadata.get('source')]:
+            if source:
+                lines.append(f"   Source: {source}")
+        if match.get('text'):
+            lines.append(f"   {match['text']}")
+        lines.append("")
+    return "\n".join(lines)
+
+def extract_sources(search_output):
+    """Note paths cited by `leann search` output"""
+    return sorted(set(SOURCE_LINE_RE.findall(search_output or '')))
+
+def index_cache_sources(cache_key, sources):
+    """Record which notes a cached result cites so reindexing can invalidate it selectively"""
+    if not redis_client:
+        return
+    
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        index_keys = [f"{SOURCE_INDEX_PREFIX}{source}" for source in sources] or [UNCITED_KEY]
+        for index_key in index_keys:
+            pipe.sadd(index_key, cache_key)
+            pipe.expire(index_key, CACHE_TTL_SECONDS)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"Cache source index error: {str(e)}")
+
+def record_search_load():
+    """Count a search in the current 10s bucket so running reindex builds can back off"""
+    if not redis_client:
+        return
+    
+    try:
+        key = f"{LOAD_KEY_PREFIX}{int(time.time() // LOAD_BUCKET_SECONDS)}"
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.incr(key)
+        pipe.expire(key, LOAD_BUCKET_SECONDS * 6)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"Load signal error: {str(e)}")
+
 def require_auth(f):
     """Simple token-based authentication decorator"""
     @wraps(f)
@@ -198,9 +713,74 @@ def health_check():
             'enabled': CACHE_ENABLED,
             'status': redis_status,
             'ttl_seconds': CACHE_TTL_SECONDS if CACHE_ENABLED else None
+        },
+        'search_backend': SEARCH_BACKEND,
+        'index': {
+            'name': DEFAULT_INDEX,
+            'generation': get_index_generation(DEFAULT_INDEX),
+            'last_build': next(iter(get_recent_builds(DEFAULT_INDEX)), None)
         }
     })
 
+@app.route('/reindex/status', methods=['GET'])
+@require_auth
+def reindex_status():
+    """Recent index builds with per-phase timings"""
+    index_name = request.args.get('index', DEFAULT_INDEX)
+    limit = min(int(request.args.get('limit', 10)), 100)
+    return jsonify({
+        'index': index_name,
+        'generation': get_index_generation(index_name),
+        'builds': get_recent_builds(index_name, limit),
+        'timestamp': datetime.utcnow().isoformat()
+    })
+
+@app.route('/related', methods=['GET'])
+@require_auth
+def related():
+    """Notes most similar to a note, served from the graph precomputed at build time"""
+    start_time = time.time()
+    note_path = request.args.get('path', '').strip()
+    index_name = request.args.get('index', DEFAULT_INDEX)
+    if not note_path:
+        return jsonify({'error': 'path parameter required'}), 400
+    try:
+        top_k = int(request.args.get('top_k', 5))
+    except ValueError:
+        return jsonify({'error': 'top_k must be an integer'}), 400
+    
+    # Sharded indexes keep one graph per shard; neighbors from the other shards are
+    # scored at request time against the note vectors stored in their graphs
+    shards = get_index_shards(index_name)
+    graph_indexes = sorted(shards.values()) if shards else [index_name]
+    graphs = []
+    for graph_index in graph_indexes:
+        try:
+            graphs.append(get_related_graph(graph_index))
+        except Exception as e:
+            if not shards:
+                logger.error(f"Related-notes graph error: {str(e)}")
+                return jsonify({'error': f'Related-notes graph not available: {str(e)}'}), 503
+            logger.warning(f"Related-notes graph of shard {graph_index} not available: {str(e)}")
+    if not graphs:
+        return jsonify({'error': f'Related-notes graphs not available for {index_name}'}), 503
+    try:
+        neighbors = import_script('related_notes').related_across(graphs, note_path, top_k)
+    except KeyError:
+        return jsonify({'error': f'Note not in index: {note_path}'}), 404
+    graph = next(graph for graph in graphs if note_path in graph.positions)
+    
+    leann_request_duration.labels(endpoint='related', cache_status='precomputed').observe(time.time() - start_time)
+    return jsonify({
+        'success': True,
+        'index': index_name,
+        'path': note_path,
+        'top_k': top_k,
+        'related': [{'path': neighbor['source'], 'score': neighbor['score']} for neighbor in neighbors],
+        'graph_updated_at': datetime.utcfromtimestamp(graph.header['created_at']).isoformat(),
+        'timestamp': datetime.utcnow().isoformat()
+    })
+
 @app.route('/cache/stats', methods=['GET'])
 @require_auth
 def cache_stats():
@@ -236,6 +816,7 @@ def clear_cache():
         keys = redis_client.keys("leann:*")
         if keys:
             deleted = redis_client.delete(*keys)
+            redis_client.delete(UNCITED_KEY, *redis_client.keys(f"{SOURCE_INDEX_PREFIX}*"))
             redis_cache_clears.inc()
             logger.info(f"Cleared {deleted} cache entries")
             return jsonify({
@@ -259,6 +840,7 @@ def search():
     """Search in LEANN index with caching"""
     start_time = time.time()
     cache_status = 'miss'
+    record_search_load()
     
     try:
         data = request.get_json()
@@ -268,12 +850,22 @@ def search():
         query = data.get('query', '').strip()
         index_name = data.get('index', DEFAULT_INDEX)
         top_k = data.get('top_k', 5)
+        mode = data.get('mode', 'vector')
         
         if not query:
             return jsonify({'error': 'query parameter required'}), 400
+        if isinstance(index_name, list) and not 0 < len(index_name) <= FANOUT_MAX_INDEXES:
+            return jsonify({'error': f'index list must have 1 to {FANOUT_MAX_INDEXES} indexes'}), 400
+        if mode not in SEARCH_MODES:
+            return jsonify({'error': f"mode must be one of: {', '.join(SEARCH_MODES)}"}), 400
+        try:
+            filters = parse_filters(data.get('filters'))
+        except (ValueError, TypeError) as e:
+            return jsonify({'error': f'Invalid filters: {str(e)}'}), 400
         
         # Check cache first
-        cache_key = generate_cache_key('search', index_name, query, top_k=top_k)
+        cache_key = generate_cache_key('search', index_name, query, top_k=top_k, backend=SEARCH_BACKEND, mode=mode,
+                                       filters=filters)
         cached_result = get_from_cache(cache_key)
         
         if cached_result:
@@ -283,31 +875,44 @@ def search():
             leann_request_duration.labels(endpoint='search', cache_status=cache_status).observe(time.time() - start_time)
             return jsonify(cached_result)
         
-        # Run LEANN search command; pass the raw query and allow subprocess to handle spacing
-        cmd_args = ['search', index_name, query]
-        if top_k != 5:
-            cmd_args.extend(['--top-k', str(top_k)])
-        
-        result = run_leann_command(cmd_args)
-        
-        if not result['success']:
-            return jsonify({
-                'error': 'LEANN search failed',
-                'details': result
-            }), 500
+        top_k = int(top_k)
+        shards = get_index_shards(index_name) if isinstance(index_name, str) else None
+        if isinstance(index_name, list) or shards:
+            if shards:
+                response_data = sharded_search(index_name, shards, query, top_k, mode, filters, data.get('timeout'))
+            else:
+                response_data = fanout_search(index_name, query, top_k, mode, filters, data.get('timeout'))
+            if not response_data['success']:
+                return jsonify(response_data), 502
+        else:
+            result = execute_search(index_name, query, top_k, mode, filters)
+            if not result['success']:
+                return jsonify({key: value for key, value in result.items() if key != 'status'}), result['status']
+            
+            response_data = {
+                'success': True,
+                'query': query,
+                'index': index_name,
+                'top_k': top_k,
+                'generation': get_index_generation(index_name),
+                'mode': mode,
+                'filters': filters,
+                'backend': result['backend'],
+                'results': result['results'],
+                'cached': False,
+                'timestamp': datetime.utcnow().isoformat()
+            }
+            if result['matches'] is not None:
+                response_data['matches'] = result['matches']
         
-        response_data = {
-            'success': True,
-            'query': query,
-            'index': index_name,
-            'top_k': top_k,
-            'results': result['stdout'],
-            'cached': False,
-            'timestamp': datetime.utcnow().isoformat()
-        }
+        if response_data.get('partial'):
+            # Partial fan-out results are returned but never cached
+            leann_request_duration.labels(endpoint='search', cache_status=cache_status).observe(time.time() - start_time)
+            return jsonify(response_data)
         
-        # Cache the result
+        # Cache the result and index it by the notes it cites
         set_cache(cache_key, response_data)
+        index_cache_sources(cache_key, extract_sources(response_data['results']))
         
         # Record metrics
         leann_request_duration.labels(endpoint='search', cache_status=cache_status).observe(time.time() - start_time)
@@ -325,6 +930,7 @@ def ask():
     """Ask question to LEANN index with caching"""
     start_time = time.time()
     cache_status = 'miss'
+    record_search_load()
     
     try:
         data = request.get_json()
@@ -337,6 +943,12 @@ def ask():
         if not question:
             return jsonify({'error': 'question parameter required'}), 400
         
+        # `leann ask` answers from a single index; a sharded index must be asked per shard
+        shards = get_index_shards(index_name) if isinstance(index_name, str) else None
+        if shards:
+            return jsonify({'error': f"Index {index_name} is sharded; ask one of its shards instead",
+                            'shards': sorted(shards.values())}), 400
+        
         # Check cache first
         cache_key = generate_cache_key('ask', index_name, question)
         cached_result = get_from_cache(cache_key)
@@ -362,13 +974,15 @@ def ask():
             'success': True,
             'question': question,
             'index': index_name,
+            'generation': get_index_generation(index_name),
             'answer': result['stdout'],
             'cached': False,
             'timestamp': datetime.utcnow().isoformat()
         }
         
-        # Cache the result
+        # Cache the result; answers carry no sources, so any reindex invalidates them
         set_cache(cache_key, response_data)
+        index_cache_sources(cache_key, [])
         
         # Record metrics
         leann_request_duration.labels(endpoint='ask', cache_status=cache_status).observe(time.time() - start_time)
@@ -383,19 +997,20 @@ def ask():
 @app.route('/indexes', methods=['GET'])
 @require_auth
 def list_indexes():
-    """List available LEANN indexes"""
+    """List available LEANN indexes with their metadata (served from memory between reindexes)"""
+    start_time = time.time()
     try:
-        result = run_leann_command(['list'])
-        
-        if not result['success']:
-            return jsonify({
-                'error': 'Failed to list indexes',
-                'details': result
-            }), 500
+        refresh = request.args.get('refresh', '').lower() in ('1', 'true')
+        indexes, cached = get_index_listing(refresh)
         
+        leann_request_duration.labels(endpoint='indexes', cache_status='hit' if cached else 'miss').observe(
+            time.time() - start_time)
         return jsonify({
             'success': True,
-            'indexes': result['stdout'],
+            'indexes': indexes,
+            'count': len(indexes),
+            'cached': cached,
+            'refreshed_at': datetime.utcfromtimestamp(_index_listing['loaded_at']).isoformat(),
             'timestamp': datetime.utcnow().isoformat()
         })
         
@@ -417,11 +1032,13 @@ def api_docs():
         },
         'endpoints': {
             'GET /health': 'Health check with cache status',
-            'GET /indexes': 'List available indexes (auth required)',
-            'POST /search': 'Search in index with caching (auth required)',
+            'GET /indexes': 'Indexes with generation, size, chunk count and build time; refreshed when an index changes, ?refresh=true forces it (auth required)',
+            'POST /search': 'Search one index or a list of indexes (merged top-k) with caching; mode: vector (default), lexical (BM25) or hybrid; optional metadata filters (auth required)',
             'POST /ask': 'Ask question to index with caching (auth required)',
+            'GET /related?path=': 'Notes most similar to a note, from the k-NN graph precomputed at build time (auth required)',
             'GET /cache/stats': 'Cache statistics (auth required)',
             'POST /cache/clear': 'Clear cache (auth required)',
+            'GET /reindex/status': 'Recent index builds with phase timings (auth required)',
             'GET /api/docs': 'This documentation'
         },
         'examples': {
@@ -432,7 +1049,9 @@ def api_docs():
                 'body': {
                     'query': 'n8n workflow automation',
                     'index': 'myvault',
-                    'top_k': 5
+                    'top_k': 5,
+                    'mode': 'hybrid',
+                    'filters': {'path_prefix': '01-PARA/Projects', 'tags': ['n8n'], 'modified_within_days': 7}
                 }
             },
             'ask': {
@@ -444,6 +1063,11 @@ def api_docs():
                     'index': 'myvault'
                 }
             },
+            'related': {
+                'method': 'GET',
+                'url': '/related?path=02-Zettelkasten/Permanent/n8n-webhooks.md&index=myvault&top_k=5',
+                'headers': {'Authorization': 'Bearer YOUR_TOKEN'}
+            },
             'cache_stats': {
                 'method': 'GET',
                 'url': '/cache/stats',
@@ -20,6 +20,7 @@ except ImportError:
 from pathlib import Path
 import logging
 from metrics_daemon import ActivityAgentMetrics
+from vault_catalog import VaultCatalog
 
 # Configuração de logging
 logging.basicConfig(
@@ -39,6 +40,7 @@ class ActivityAgent:
         self.smtp_port = 587
         self.email_from = "activity-agent@dpo2u.com"
         self.email_to = "admin@dpo2u.com"
+        self.catalog = VaultCatalog(self.obsidian_vault_path)
         
     def get_para_stats(self):
         """Coleta estatísticas do sistema PARA"""
@@ -47,10 +49,11 @@ class ActivityAgent:
             stats = {}
             
             if para_path.exists():
-                stats['projects'] = len(list((para_path / "Projects").glob("*.md"))) if (para_path / "Projects").exists() else 0
-                stats['areas'] = len(list((para_path / "Areas").glob("*.md"))) if (para_path / "Areas").exists() else 0
-                stats['resources'] = len(list((para_path / "Resources").glob("*.md"))) if (para_path / "Resources").exists() else 0
-                stats['archive'] = len(list((para_path / "Archive").glob("*.md"))) if (para_path / "Archive").exists() else 0
+                # Contagens do catálogo do vault compartilhado com o metrics_daemon
+                stats['projects'] = self.catalog.folder_stats("01-PARA/Projects")['notes']
+                stats['areas'] = self.catalog.folder_stats("01-PARA/Areas")['notes']
+                stats['resources'] = self.catalog.folder_stats("01-PARA/Resources")['notes']
+                stats['archive'] = self.catalog.folder_stats("01-PARA/Archive")['notes']
             else:
                 stats = {'projects': 0, 'areas': 0, 'resources': 0, 'archive': 0}
                 
@@ -69,9 +72,9 @@ class ActivityAgent:
             
             if zk_path.exists():
                 # Contar notas por categoria
-                permanent_notes = len(list((zk_path / "Permanent").glob("*.md"))) if (zk_path / "Permanent").exists() else 0
-                daily_notes = len(list((zk_path / "Daily").glob("*.md"))) if (zk_path / "Daily").exists() else 0
-                literature_notes = len(list((zk_path / "Literature").glob("*.md"))) if (zk_path / "Literature").exists() else 0
+                permanent_notes = self.catalog.folder_stats("02-Zettelkasten/Permanent")['notes']
+                daily_notes = self.catalog.folder_stats("02-Zettelkasten/Daily")['notes']
+                literature_notes = self.catalog.folder_stats("02-Zettelkasten/Literature")['notes']
                 
                 stats = {
                     'permanent_notes': permanent_notes,
@@ -90,26 +93,26 @@ class ActivityAgent:
             return {'permanent_notes': 0, 'daily_notes': 0, 'literature_notes': 0, 'total_notes': 0}
     
     def get_recent_activities(self):
-        """Lista atividades recentes"""
+        """Lista atividades recentes (últimas 24h) a partir do journal de mudanças do catálogo"""
         try:
-            activities = []
+            activities = {}
             
-            # Buscar notas criadas hoje
-            today = datetime.now().strftime("%Y-%m-%d")
-            zk_path = Path(self.obsidian_vault_path) / "02-Zettelkasten"
+            # Eventos do Zettelkasten nas últimas 24h (O(mudanças), sem listar as pastas)
+            since = datetime.now().timestamp() - 86400
+            for change in self.catalog.changes_since(since, folder="02-Zettelkasten"):
+                parts = change['path'].split("/")
+                activity = activities.setdefault(change['path'], {
+                    'type': parts[1] if len(parts) > 2 else "Zettelkasten",
+                    'name': Path(change['path']).stem,
+                    'event': change['event']
+                })
+                # Nota criada e depois editada no período continua aparecendo como criada
+                if activity['event'] != 'created' or change['event'] == 'deleted':
+                    activity['event'] = change['event']
+                activity['time'] = datetime.fromtimestamp(change['ts']).strftime("%H:%M")
+                activity['ts'] = change['ts']
             
-            if zk_path.exists():
-                # Buscar em todas as pastas
-                for folder in ["Permanent", "Daily", "Literature"]:
-                    folder_path = zk_path / folder
-                    if folder_path.exists():
-                        for note in folder_path.glob("*.md"):
-                            if note.stat().st_mtime > (datetime.now().timestamp() - 86400):  # Últimas 24h
-                                activities.append({
-                                    'type': folder,
-                                    'name': note.stem,
-                                    'created': datetime.fromtimestamp(note.stat().st_mtime).strftime("%H:%M")
-                                })
+            activities = sorted(activities.values(), key=lambda activity: activity['ts'], reverse=True)
             
             logger.info(f"Recent Activities: {len(activities)} items")
             return activities
@@ -195,7 +198,7 @@ class ActivityAgent:
         if activities:
             html += "<ul>"
             for activity in activities[:10]:  # Últimas 10 atividades
-                html += f"<li><strong>{activity['created']}</strong> - {activity['type']}: {activity['name']}</li>"
+                html += f"<li><strong>{activity['time']}</strong> - {activity['type']}: {activity['name']} ({activity['event']})</li>"
             html += "</ul>"
         else:
             html += "<p>No recent activities found.</p>"
@@ -250,6 +253,9 @@ class ActivityAgent:
         logger.info("Starting daily report generation")
         
         try:
+            # Sincronizar o catálogo do vault (só pastas alteradas são relistadas)
+            self.catalog.refresh()
+            
             # Coletar dados
             para_stats = self.get_para_stats()
             zk_stats = self.get_zettelkasten_stats()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+LEANN Build Checkpoint
+Checkpoints de builds de índice: chunks e progresso dos embeddings ficam em
+disco para que um build interrompido (OOM, deploy, queda da OpenAI) seja
+retomado no ciclo seguinte, desde que o manifesto do vault não tenha mudado
+
+Os vetores já calculados ficam no EmbeddingStore (gravados e sincronizados a
+cada lote); o checkpoint guarda a lista ordenada de chunks e a fase atingida.
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import logging
+
+from vault_chunker import iter_vault_files
+
+# Configurações
+CHECKPOINT_DIR = os.getenv("LEANN_CHECKPOINT_DIR", "/var/lib/leann/checkpoints")
+CHUNKED = "chunked"
+EMBEDDED = "embedded"
+
+logger = logging.getLogger(__name__)
+
+
+def manifest_fingerprint(vault_path, shard=None):
+    """Hash do manifesto (caminho, tamanho, mtime) das notas do vault (ou de um shard)"""
+    digest = hashlib.sha256()
+    for file_path in iter_vault_files(vault_path, shard=shard):
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            continue
+        digest.update(f"{os.path.relpath(file_path, vault_path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def _write_atomic(path, write):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class BuildCheckpoint:
+    """Checkpoint de um build identificado por índice, modelo e manifesto do vault"""
+
+    def __init__(self, index_name, fingerprint, embedding_model, root=CHECKPOINT_DIR):
+        self.index_name = index_name
+        self.fingerprint = fingerprint
+        self.embedding_model = embedding_model
+        self.index_dir = os.path.join(root, index_name)
+        self.slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", embedding_model)
+        self.path = os.path.join(self.index_dir, f"{fingerprint[:16]}-{self.slug}")
+        self.state_path = os.path.join(self.path, "state.json")
+        self.chunks_path = os.path.join(self.path, "chunks.jsonl")
+
+    def load(self):
+        """Estado do checkpoint compatível com este build, ou None"""
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get('fingerprint') != self.fingerprint or state.get('embedding_model') != self.embedding_model:
+            return None
+        if not os.path.exists(self.chunks_path):
+            return None
+        return state
+
+    def load_chunks(self):
+        """Chunks e chaves de conteúdo na ordem em que foram gravados"""
+        chunks = []
+        keys = []
+        with open(self.chunks_path, 'r') as f:
+            for line in f:
+                record = json.loads(line)
+                keys.append(record.pop('key'))
+                chunks.append(record)
+        return chunks, keys
+
+    def save_chunks(self, chunks, keys, phase=CHUNKED):
+        os.makedirs(self.path, exist_ok=True)
+        _write_atomic(self.chunks_path, lambda f: f.writelines(
+            json.dumps({**chunk, 'key': key}) + "\n" for chunk, key in zip(chunks, keys)
+        ))
+        self.mark(phase, chunks=len(chunks))
+
+    def mark(self, phase, **info):
+        """Registra a fase atingida (e contadores de progresso) de forma atômica"""
+        state = self.load() or {}
+        state.update(info, phase=phase, fingerprint=self.fingerprint, embedding_model=self.embedding_model,
+                     updated_at=time.time())
+        os.makedirs(self.path, exist_ok=True)
+        _write_atomic(self.state_path, lambda f: json.dump(state, f))
+
+    def discard_stale(self):
+        """Remove checkpoints deste índice e modelo feitos sobre manifestos anteriores
+
+        Checkpoints de outro modelo ficam: um build com o modelo de fallback não
+        apaga o progresso retomável do modelo principal.
+        """
+        if not os.path.isdir(self.index_dir):
+            return
+        for name in os.listdir(self.index_dir):
+            path = os.path.join(self.index_dir, name)
+            if path == self.path:
+                continue
+            try:
+                with open(os.path.join(path, "state.json"), 'r') as f:
+                    model = json.load(f).get('embedding_model')
+            except (OSError, ValueError):
+                # Checkpoint sem estado legível: o modelo vem do nome do diretório
+                model = self.embedding_model if name.partition("-")[2] == self.slug else None
+            if model == self.embedding_model:
+                shutil.rmtree(path, ignore_errors=True)
+                logger.info(f"Checkpoint obsoleto removido: {path}")
+
+    def clear(self):
+        """Remove todos os checkpoints do índice após uma promoção bem-sucedida"""
+        shutil.rmtree(self.index_dir, ignore_errors=True)
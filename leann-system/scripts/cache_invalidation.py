@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+LEANN Cache Invalidation
+Invalida no Redis apenas as respostas em cache que citam notas alteradas
+
+O wrapper HTTP mantém o índice reverso:
+    leann-src:<caminho da nota>  -> SET de chaves leann:<hash> cujos resultados citam a nota
+    leann-uncited                -> SET de chaves sem fontes identificáveis (ex.: /ask)
+"""
+
+import os
+import logging
+
+# Configurações
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "26379"))
+# Mesmo padrão do wrapper HTTP (api/leann_http_wrapper.py): o Redis do BillionMail exige senha
+REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", "zKLnZQr3riFpcS2lEy3MOtfncztaCGKp")
+REDIS_DB = 1
+CACHE_PREFIX = "leann:"
+SOURCE_INDEX_PREFIX = "leann-src:"
+UNCITED_KEY = "leann-uncited"
+
+logger = logging.getLogger(__name__)
+
+
+def diff_manifest(old_manifest, new_manifest):
+    """Caminhos criados, removidos ou modificados entre dois manifestos {caminho: assinatura}"""
+    changed = {path for path, signature in new_manifest.items() if old_manifest.get(path) != signature}
+    changed.update(path for path in old_manifest if path not in new_manifest)
+    return sorted(changed)
+
+
+def get_redis():
+    import redis
+    return redis.Redis(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASSWORD, db=REDIS_DB,
+                       decode_responses=True)
+
+
+def clear_all(r):
+    """Remove todo o cache LEANN e o índice reverso"""
+    keys = list(r.scan_iter(f"{CACHE_PREFIX}*")) + list(r.scan_iter(f"{SOURCE_INDEX_PREFIX}*")) + [UNCITED_KEY]
+    deleted = 0
+    for start in range(0, len(keys), 1000):
+        deleted += r.delete(*keys[start:start + 1000])
+    return deleted
+
+
+def invalidate_sources(changed_paths, r=None):
+    """Remove as chaves de cache ligadas às notas alteradas; retorna (invalidadas, mantidas)
+
+    Com changed_paths=None (sem manifesto anterior) o cache inteiro é limpo.
+    """
+    r = r or get_redis()
+    if changed_paths is None:
+        total = sum(1 for _ in r.scan_iter(f"{CACHE_PREFIX}*"))
+        clear_all(r)
+        return total, 0
+
+    index_keys = [f"{SOURCE_INDEX_PREFIX}{path}" for path in changed_paths]
+    stale = r.sunion(index_keys + [UNCITED_KEY]) if index_keys else r.smembers(UNCITED_KEY)
+    stale = list(stale)
+
+    pipe = r.pipeline(transaction=False)
+    for start in range(0, len(stale), 1000):
+        pipe.delete(*stale[start:start + 1000])
+    for start in range(0, len(index_keys), 1000):
+        pipe.delete(*index_keys[start:start + 1000])
+    pipe.delete(UNCITED_KEY)
+    results = pipe.execute()
+    invalidated = sum(results[:(len(stale) + 999) // 1000])
+
+    kept = sum(1 for _ in r.scan_iter(f"{CACHE_PREFIX}*"))
+    return invalidated, kept
+
+
+def invalidate_after_build(changed_paths, report=None):
+    """invalidate_sources após um build promovido; retorna (invalidadas, mantidas) ou None
+
+    Uma falha não derruba o daemon, mas vira aviso em report['warnings'] (gravado
+    no histórico de builds): respostas em cache continuam desatualizadas até o TTL.
+    """
+    try:
+        return invalidate_sources(changed_paths)
+    except Exception as e:
+        import redis
+        if isinstance(e, redis.exceptions.AuthenticationError) or "NOAUTH" in str(e) or "WRONGPASS" in str(e):
+            warning = f"Cache Redis não invalidado: autenticação recusada (REDIS_PASSWORD): {e}"
+        else:
+            warning = f"Cache Redis não invalidado: {e}"
+        logger.warning(f"⚠️ {warning}")
+        if report is not None:
+            report.setdefault('warnings', []).append(warning)
+        return None
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+LEANN Embedding Scheduler
+Agenda chamadas de embedding OpenAI em lotes por orçamento de tokens, com
+concorrência, respeito aos limites RPM/TPM e retry com jitter em 429
+
+Uso:
+    python3 embedding_scheduler.py serve-stub [--port 8765] [--rpm 60] [--tpm 40000]
+    python3 embedding_scheduler.py bench [--base-url http://127.0.0.1:8765/v1] [--chunks 2000]
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Configurações
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+EMBEDDING_RPM = int(os.getenv("OPENAI_EMBEDDING_RPM", "3000"))
+EMBEDDING_TPM = int(os.getenv("OPENAI_EMBEDDING_TPM", "1000000"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+MAX_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "50000"))
+MAX_BATCH_INPUTS = 2048  # limite da API por requisição
+MAX_RETRIES = 8
+PROGRESS_INTERVAL = 5  # segundos entre logs de throughput
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitError(Exception):
+    """Resposta 429 da API, com o tempo sugerido de espera"""
+
+    def __init__(self, retry_after=None):
+        super().__init__("rate limited")
+        self.retry_after = retry_after
+
+
+class TokenEstimator:
+    """Conta tokens com tiktoken quando disponível, senão estima por caracteres"""
+
+    def __init__(self, model):
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count(self, text):
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return len(text) // 4 + 1
+
+
+class RateLimiter:
+    """Dois token buckets (requisições e tokens por minuto) com reabastecimento contínuo"""
+
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def acquire(self, tokens):
+        """Bloqueia até haver orçamento para uma requisição de `tokens` tokens"""
+        tokens = min(tokens, self.tpm)
+        with self._cond:
+            while True:
+                self._refill()
+                now = time.monotonic()
+                if now >= self._blocked_until and self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                wait = max(
+                    self._blocked_until - now,
+                    (1 - self._requests) * 60 / self.rpm,
+                    (tokens - self._tokens) * 60 / self.tpm,
+                    0.01,
+                )
+                self._cond.wait(wait)
+
+    def penalize(self, seconds):
+        """Pausa todas as requisições após um 429 do servidor"""
+        with self._cond:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+
+class EmbeddingScheduler:
+    """Executa embeddings OpenAI em lotes concorrentes dentro dos limites da conta"""
+
+    def __init__(self, model, api_key=None, base_url=OPENAI_BASE_URL, rpm=EMBEDDING_RPM, tpm=EMBEDDING_TPM,
+                 concurrency=EMBEDDING_CONCURRENCY, max_batch_tokens=MAX_BATCH_TOKENS, timeout=120):
+        self.model = model
+        self.api_key = api_key if api_key is not None else os.getenv("OPENAI_API_KEY", "")
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.max_batch_tokens = max_batch_tokens
+        self.timeout = timeout
+        self.limiter = RateLimiter(rpm, tpm)
+        self.estimator = TokenEstimator(model)
+        self.stats = {'requests': 0, 'retries': 0, 'rate_limited': 0, 'chunks': 0, 'tokens': 0}
+        self._stats_lock = threading.Lock()
+        self._abort = threading.Event()
+
+    def plan_batches(self, texts):
+        """Agrupa índices de textos em lotes limitados por tokens e por número de entradas"""
+        batches = []
+        current = []
+        current_tokens = 0
+        for i, text in enumerate(texts):
+            tokens = self.estimator.count(text)
+            if current and (current_tokens + tokens > self.max_batch_tokens or len(current) >= MAX_BATCH_INPUTS):
+                batches.append((current, current_tokens))
+                current = []
+                current_tokens = 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append((current, current_tokens))
+        return batches
+
+    def _post(self, inputs):
+        body = json.dumps({'model': self.model, 'input': inputs}).encode()
+        req = urllib.request.Request(
+            f"{self.base_url}/embeddings",
+            data=body,
+            headers={'Authorization': f'Bearer {self.api_key}', 'Content-Type': 'application/json'}
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                payload = json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            if e.code == 429:
+                retry_after = e.headers.get('Retry-After')
+                raise RateLimitError(float(retry_after) if retry_after else None)
+            raise
+        data = sorted(payload['data'], key=lambda item: item['index'])
+        return np.asarray([item['embedding'] for item in data], dtype=np.float32)
+
+    def _run_batch(self, indices, tokens, texts):
+        inputs = [texts[i] for i in indices]
+        for attempt in range(MAX_RETRIES + 1):
+            self.limiter.acquire(tokens)
+            try:
+                vectors = self._post(inputs)
+                with self._stats_lock:
+                    self.stats['requests'] += 1
+                    self.stats['chunks'] += len(indices)
+                    self.stats['tokens'] += tokens
+                return indices, vectors
+            except RateLimitError as e:
+                with self._stats_lock:
+                    self.stats['rate_limited'] += 1
+                delay = e.retry_after if e.retry_after is not None else min(60, 2 ** attempt)
+                self.limiter.penalize(delay)
+            except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+                if isinstance(e, urllib.error.HTTPError) and e.code < 500:
+                    raise
+                delay = min(60, 2 ** attempt)
+            if attempt == MAX_RETRIES or self._abort.is_set():
+                break
+            with self._stats_lock:
+                self.stats['retries'] += 1
+            # Full jitter evita que os workers voltem todos no mesmo instante
+            time.sleep(random.uniform(0, delay))
+            if self._abort.is_set():
+                break
+        raise RuntimeError(f"Lote de {len(indices)} chunks falhou após {attempt + 1} tentativas")
+
+    def _report_progress(self, total, started, stop):
+        while not stop.wait(PROGRESS_INTERVAL):
+            self._log_progress(total, started)
+
+    def _log_progress(self, total, started):
+        elapsed = max(time.time() - started, 1e-6)
+        with self._stats_lock:
+            stats = dict(self.stats)
+        logger.info(
+            f"Embedding: {stats['chunks']}/{total} chunks, {stats['chunks'] / elapsed:.1f} chunks/s, "
+            f"{stats['tokens'] * 60 / elapsed:,.0f} tokens/min, {stats['requests']} requests, "
+            f"{stats['rate_limited']} 429s"
+        )
+
+    def embed_query(self, text):
+        """Embedding de um único texto (consultas), com os mesmos limites e retries"""
+        _, vectors = self._run_batch([0], self.estimator.count(text), [text])
+        return vectors[0]
+
+    def embed(self, texts, on_batch=None):
+        """Embeda todos os textos; on_batch(indices, vectors) é chamado a cada lote concluído"""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        batches = self.plan_batches(texts)
+        results = [None] * len(texts)
+        started = time.time()
+        stop = threading.Event()
+        reporter = threading.Thread(target=self._report_progress, args=(len(texts), started, stop), daemon=True)
+        reporter.start()
+        self._abort.clear()
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            futures = [executor.submit(self._run_batch, indices, tokens, texts) for indices, tokens in batches]
+            for future in as_completed(futures):
+                indices, vectors = future.result()
+                for i, vector in zip(indices, vectors):
+                    results[i] = vector
+                if on_batch is not None:
+                    on_batch(indices, vectors)
+        except BaseException:
+            # Primeira falha encerra o build: lotes na fila são cancelados e os em
+            # andamento não entram em novos ciclos de backoff
+            self._abort.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        finally:
+            executor.shutdown(wait=True)
+            stop.set()
+            reporter.join()
+        self._log_progress(len(texts), started)
+        return np.stack(results)
+
+
+class StubEmbeddingHandler(BaseHTTPRequestHandler):
+    """Simula POST /v1/embeddings com limites RPM/TPM por janela de um minuto"""
+
+    server_version = "EmbeddingStub/1.0"
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/embeddings"):
+            self.send_error(404)
+            return
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        inputs = payload['input'] if isinstance(payload['input'], list) else [payload['input']]
+        tokens = sum(len(text) // 4 + 1 for text in inputs)
+
+        stub = self.server
+        with stub.lock:
+            now = time.monotonic()
+            if now - stub.window_start >= 60:
+                stub.window_start = now
+                stub.window_requests = 0
+                stub.window_tokens = 0
+            if stub.window_requests + 1 > stub.rpm or stub.window_tokens + tokens > stub.tpm:
+                retry_after = 60 - (now - stub.window_start)
+                stub.rejected += 1
+                self._send_json(429, {'error': {'message': 'Rate limit reached', 'type': 'requests'}},
+                                {'Retry-After': f"{retry_after:.2f}"})
+                return
+            stub.window_requests += 1
+            stub.window_tokens += tokens
+
+        time.sleep(stub.latency)
+        data = []
+        for i, text in enumerate(inputs):
+            seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:4], 'little')
+            vector = np.random.default_rng(seed).standard_normal(stub.dim).astype(np.float32)
+            vector /= np.linalg.norm(vector)
+            data.append({'object': 'embedding', 'index': i, 'embedding': vector.tolist()})
+        self._send_json(200, {'object': 'list', 'data': data, 'model': payload.get('model'),
+                              'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}})
+
+    def _send_json(self, status, body, headers=None):
+        encoded = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(encoded)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def make_stub_server(host="127.0.0.1", port=8765, rpm=60, tpm=40000, dim=1536, latency=0.05):
+    """Cria o servidor stub (ThreadingHTTPServer) com os limites informados"""
+    server = ThreadingHTTPServer((host, port), StubEmbeddingHandler)
+    server.rpm = rpm
+    server.tpm = tpm
+    server.dim = dim
+    server.latency = latency
+    server.lock = threading.Lock()
+    server.window_start = time.monotonic()
+    server.window_requests = 0
+    server.window_tokens = 0
+    server.rejected = 0
+    return server
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Agendador de embeddings OpenAI")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    stub_parser = subparsers.add_parser("serve-stub", help="Servidor local que simula a API de embeddings")
+    stub_parser.add_argument("--port", type=int, default=8765)
+    stub_parser.add_argument("--rpm", type=int, default=60)
+    stub_parser.add_argument("--tpm", type=int, default=40000)
+    stub_parser.add_argument("--dim", type=int, default=1536)
+
+    bench_parser = subparsers.add_parser("bench", help="Mede throughput do agendador contra uma API")
+    bench_parser.add_argument("--base-url", default="http://127.0.0.1:8765/v1")
+    bench_parser.add_argument("--chunks", type=int, default=2000)
+    bench_parser.add_argument("--rpm", type=int, default=60)
+    bench_parser.add_argument("--tpm", type=int, default=40000)
+    bench_parser.add_argument("--concurrency", type=int, default=EMBEDDING_CONCURRENCY)
+    bench_parser.add_argument("--batch-tokens", type=int, default=4000)
+    args = parser.parse_args()
+
+    if args.command == "serve-stub":
+        server = make_stub_server(port=args.port, rpm=args.rpm, tpm=args.tpm, dim=args.dim)
+        logger.info(f"Stub de embeddings em http://127.0.0.1:{args.port}/v1 (RPM={args.rpm}, TPM={args.tpm})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info(f"Stub encerrado ({server.rejected} requisições rejeitadas com 429)")
+    elif args.command == "bench":
+        texts = [f"chunk {i} " + "lorem ipsum dolor sit amet " * 20 for i in range(args.chunks)]
+        scheduler = EmbeddingScheduler("text-embedding-3-small", api_key="stub", base_url=args.base_url,
+                                       rpm=args.rpm, tpm=args.tpm, concurrency=args.concurrency,
+                                       max_batch_tokens=args.batch_tokens)
+        started = time.time()
+        vectors = scheduler.embed(texts)
+        elapsed = time.time() - started
+        print(json.dumps({'chunks': len(vectors), 'seconds': round(elapsed, 2),
+                          'chunks_per_second': round(len(vectors) / elapsed, 1), **scheduler.stats}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+LEANN Embedding Store
+Cache persistente de embeddings endereçado por conteúdo (modelo + hash do chunk)
+"""
+
+import os
+import re
+import json
+import fcntl
+import hashlib
+import logging
+from contextlib import contextmanager
+
+import numpy as np
+
+from reindex_state import STATE_DB, connect
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_DIR = os.getenv("LEANN_EMBEDDING_CACHE_DIR", "/var/lib/leann/embedding-cache")
+KEY_LOOKUP_BATCH = 500  # keys per SELECT (SQLite variable limit)
+
+
+def content_hash(text):
+    """SHA-256 of the chunk text, the content address used by the store"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """Content-addressed vector store for a single embedding model.
+
+    Vectors live in an append-only float32 file that is memory-mapped for
+    reads; the key -> row index lives in the `embedding_keys` table of the
+    reindex state database. Vectors are always written before their keys,
+    so a crash mid-append only leaves unreferenced bytes that are ignored
+    on the next open. Builders running in parallel share the store of a
+    model: appends, key inserts and truncation happen under an flock on
+    `<model>.lock`, with rows numbered from the file size read under it.
+    """
+
+    def __init__(self, model, store_dir=DEFAULT_STORE_DIR, state_db=STATE_DB):
+        self.model = model
+        self.store_dir = store_dir
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model)
+        self.vectors_path = os.path.join(store_dir, f"{slug}.f32")
+        self.keys_path = os.path.join(store_dir, f"{slug}.keys")
+        self.meta_path = os.path.join(store_dir, f"{slug}.meta.json")
+        self.lock_path = os.path.join(store_dir, f"{slug}.lock")
+        self.dim = None
+        self._rows = {}
+        self._stored_rows = 0
+        self._mmap = None
+        os.makedirs(store_dir, exist_ok=True)
+        self.conn = connect(state_db)
+        self._load()
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock shared by every process using this model's store"""
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _complete_rows(self):
+        """Rows in the vector file, dropping a partial row from an interrupted append (lock held)"""
+        if not (self.dim and os.path.exists(self.vectors_path)):
+            return 0
+        size = os.path.getsize(self.vectors_path)
+        stored_rows = size // (self.dim * 4)
+        if size != stored_rows * self.dim * 4:
+            os.truncate(self.vectors_path, stored_rows * self.dim * 4)
+        return stored_rows
+
+    def _load(self):
+        """Load the key index and map the vector file"""
+        with self._locked():
+            if os.path.exists(self.meta_path):
+                with open(self.meta_path, 'r') as f:
+                    self.dim = json.load(f)["dim"]
+            if os.path.exists(self.keys_path):
+                self._migrate_keys_file()
+
+            stored_rows = self._complete_rows()
+            self._stored_rows = stored_rows
+
+            orphaned = self.conn.execute("SELECT COUNT(*) FROM embedding_keys WHERE model = ? AND row >= ?",
+                                         (self.model, stored_rows)).fetchone()[0]
+            if orphaned:
+                logger.warning(f"Embedding store {self.model} has {orphaned} keys without vectors, dropping them")
+                self.conn.execute("DELETE FROM embedding_keys WHERE model = ? AND row >= ?",
+                                  (self.model, stored_rows))
+
+            self._rows = dict(self.conn.execute("SELECT key, row FROM embedding_keys WHERE model = ?",
+                                                (self.model,)))
+        self._remap()
+
+    def _migrate_keys_file(self):
+        """Import the legacy one-key-per-line index into the state database"""
+        with open(self.keys_path, 'r') as f:
+            keys = [line.strip() for line in f if line.strip()]
+        self._insert_keys(keys, start=0)
+        os.replace(self.keys_path, f"{self.keys_path}.migrated")
+        logger.info(f"Embedding store {self.keys_path}: {len(keys)} keys migrated to the state database")
+
+    def _insert_keys(self, keys, start):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany("INSERT OR IGNORE INTO embedding_keys (model, key, row) VALUES (?, ?, ?)",
+                                  [(self.model, key, start + offset) for offset, key in enumerate(keys)])
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def _stored_keys(self, keys):
+        """Rows already recorded for keys, e.g. by another builder since this store was opened"""
+        rows = {}
+        for begin in range(0, len(keys), KEY_LOOKUP_BATCH):
+            batch = keys[begin:begin + KEY_LOOKUP_BATCH]
+            rows.update(self.conn.execute(
+                f"SELECT key, row FROM embedding_keys WHERE model = ? AND key IN ({','.join('?' * len(batch))})",
+                (self.model, *batch)))
+        return rows
+
+    def _remap(self):
+        if self._rows:
+            self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode='r',
+                                   shape=(self._stored_rows, self.dim))
+        else:
+            self._mmap = None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def get_many(self, keys):
+        """Return (vectors, missing) where vectors[i] is None for cache misses"""
+        vectors = []
+        missing = []
+        for i, key in enumerate(keys):
+            row = self._rows.get(key)
+            if row is None:
+                vectors.append(None)
+                missing.append(i)
+            else:
+                vectors.append(self._mmap[row])
+        return vectors, missing
+
+    def rows_for(self, keys):
+        """Row numbers of stored keys in the vector file (rows never move once written)"""
+        return np.asarray([self._rows[key] for key in keys], dtype=np.uint32)
+
+    def put_many(self, keys, vectors):
+        """Append vectors for keys not yet stored"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or len(keys) != vectors.shape[0]:
+            raise ValueError("keys and vectors must have matching lengths")
+
+        new_keys = []
+        new_rows = []
+        seen = set()
+        for key, vector in zip(keys, vectors):
+            if key in self._rows or key in seen:
+                continue
+            seen.add(key)
+            new_keys.append(key)
+            new_rows.append(vector)
+
+        if not new_keys:
+            return 0
+
+        with self._locked():
+            if self.dim is None and os.path.exists(self.meta_path):
+                with open(self.meta_path, 'r') as f:
+                    self.dim = json.load(f)["dim"]
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with open(self.meta_path, 'w') as f:
+                    json.dump({"model": self.model, "dim": self.dim}, f)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Dimension mismatch for {self.model}: expected {self.dim}, got {vectors.shape[1]}")
+
+            # Keys another builder stored meanwhile keep their rows
+            stored = self._stored_keys(new_keys)
+            self._rows.update(stored)
+            pending = [(key, vector) for key, vector in zip(new_keys, new_rows) if key not in stored]
+
+            # Rows are numbered by position in the vector file as read under the lock:
+            # it may hold rows appended by other builders or unreferenced vectors
+            # left by an earlier interrupted append
+            start = self._complete_rows()
+            if pending:
+                with open(self.vectors_path, 'ab') as f:
+                    f.write(np.stack([vector for _, vector in pending]).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._insert_keys([key for key, _ in pending], start)
+
+        for offset, (key, _) in enumerate(pending):
+            self._rows[key] = start + offset
+        self._stored_rows = start + len(pending)
+        self._remap()
+        return len(pending)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+LEANN Index Generations
+Builds blue/green: cada build vai para um diretório de geração (shadow) e é
+promovido trocando atomicamente o symlink ~/.leann/indexes/<índice>
+
+Uso:
+    python3 index_generations.py status <índice>
+    python3 index_generations.py rollback <índice>
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import logging
+
+# Configurações
+LEANN_INDEXES_DIR = os.getenv("LEANN_INDEXES_DIR", "/root/.leann/indexes")
+LEANN_GENERATIONS_DIR = os.getenv("LEANN_GENERATIONS_DIR", "/root/.leann/generations")
+KEEP_GENERATIONS = 2  # geração ativa + anterior para rollback instantâneo
+GENERATION_FILE = "generation.json"
+
+logger = logging.getLogger(__name__)
+
+_GEN_RE = re.compile(r"^gen-(\d{6})$")
+
+
+def generation_dirname(generation):
+    return f"gen-{generation:06d}"
+
+
+class GenerationManager:
+    """Gerencia as gerações de um índice e o ponteiro (symlink) para a geração ativa"""
+
+    def __init__(self, index_name, indexes_dir=LEANN_INDEXES_DIR, generations_dir=LEANN_GENERATIONS_DIR,
+                 keep=KEEP_GENERATIONS):
+        self.index_name = index_name
+        self.indexes_dir = indexes_dir
+        self.live_link = os.path.join(indexes_dir, index_name)
+        self.root = os.path.join(generations_dir, index_name)
+        self.keep = keep
+
+    def path(self, generation):
+        return os.path.join(self.root, generation_dirname(generation))
+
+    def index_path(self, generation):
+        """Caminho documents.leann dentro de uma geração"""
+        return os.path.join(self.path(generation), "documents.leann")
+
+    def list_generations(self):
+        if not os.path.isdir(self.root):
+            return []
+        generations = []
+        for name in os.listdir(self.root):
+            match = _GEN_RE.match(name)
+            if match:
+                generations.append(int(match.group(1)))
+        return sorted(generations)
+
+    def current_generation(self):
+        """Geração apontada pelo symlink ativo (None para índices legados ou ausentes)"""
+        if not os.path.islink(self.live_link):
+            return None
+        match = _GEN_RE.match(os.path.basename(os.readlink(self.live_link).rstrip("/")))
+        return int(match.group(1)) if match else None
+
+    def generation_info(self, generation):
+        try:
+            with open(os.path.join(self.path(generation), GENERATION_FILE), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'generation': generation}
+
+    def disk_usage(self, generation):
+        """Tamanho em bytes dos arquivos de uma geração"""
+        total = 0
+        for root, _, files in os.walk(self.path(generation)):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    continue
+        return total
+
+    def new_shadow(self):
+        """Reserva o diretório da próxima geração para um build"""
+        os.makedirs(self.root, exist_ok=True)
+        generation = max(self.list_generations() + [self.current_generation() or 0]) + 1
+        os.makedirs(self.path(generation))
+        return generation
+
+    def discard(self, generation):
+        """Remove uma geração shadow que falhou na validação"""
+        if generation == self.current_generation():
+            raise ValueError("Não é possível descartar a geração ativa")
+        shutil.rmtree(self.path(generation), ignore_errors=True)
+
+    def discard_stale_shadows(self):
+        """Remove gerações shadow deixadas por builds interrompidos antes da promoção
+
+        Só gerações promovidas (ou migradas) têm GENERATION_FILE; tudo acima da
+        maior delas e da ativa é shadow abandonado, inclusive quando o primeiro
+        build de um índice caiu antes de existir o symlink ativo.
+        """
+        generations = self.list_generations()
+        recorded = [generation for generation in generations
+                    if os.path.exists(os.path.join(self.path(generation), GENERATION_FILE))]
+        current = self.current_generation()
+        highest = max(recorded + ([current] if current is not None else []), default=-1)
+        for generation in generations:
+            if generation > highest:
+                shutil.rmtree(self.path(generation), ignore_errors=True)
+                logger.info(f"Índice {self.index_name}: geração shadow {generation} abandonada removida")
+
+    def _migrate_legacy(self):
+        """Move um índice legado (diretório real) para a geração 0"""
+        if os.path.isdir(self.live_link) and not os.path.islink(self.live_link):
+            os.makedirs(self.root, exist_ok=True)
+            legacy = self.path(0)
+            os.rename(self.live_link, legacy)
+            self._write_info(0, {'migrated_from': self.live_link})
+            os.symlink(legacy, self.live_link)
+            logger.info(f"Índice legado {self.index_name} migrado para {legacy}")
+
+    def _write_info(self, generation, extra=None):
+        info = {'generation': generation, 'index': self.index_name, 'promoted_at': time.time(), **(extra or {})}
+        tmp = os.path.join(self.path(generation), f".{GENERATION_FILE}.tmp")
+        with open(tmp, 'w') as f:
+            json.dump(info, f, indent=2)
+        os.replace(tmp, os.path.join(self.path(generation), GENERATION_FILE))
+
+    def _point_to(self, generation):
+        """Troca atômica do symlink ativo (symlink temporário + rename)"""
+        os.makedirs(self.indexes_dir, exist_ok=True)
+        tmp_link = os.path.join(self.indexes_dir, f".{self.index_name}.{os.getpid()}.tmp")
+        if os.path.lexists(tmp_link):
+            os.unlink(tmp_link)
+        os.symlink(self.path(generation), tmp_link)
+        os.replace(tmp_link, self.live_link)
+
+    def promote(self, generation, report=None):
+        """Promove uma geração validada e remove gerações antigas além do limite"""
+        self._migrate_legacy()
+        previous = self.current_generation()
+        self._write_info(generation, {'previous': previous, 'report': report})
+        self._point_to(generation)
+        logger.info(f"Índice {self.index_name}: geração {generation} promovida (anterior: {previous})")
+        self.prune()
+        return previous
+
+    def rollback(self):
+        """Volta o ponteiro para a geração anterior mantida em disco"""
+        current = self.current_generation()
+        older = [g for g in self.list_generations() if current is None or g < current]
+        if not older:
+            raise RuntimeError(f"Nenhuma geração anterior disponível para {self.index_name}")
+        self._point_to(older[-1])
+        logger.info(f"Índice {self.index_name}: rollback da geração {current} para {older[-1]}")
+        return older[-1]
+
+    def prune(self):
+        current = self.current_generation()
+        if current is None:
+            return
+        kept = [g for g in self.list_generations() if g <= current][-self.keep:]
+        for generation in self.list_generations():
+            if generation < current and generation not in kept:
+                shutil.rmtree(self.path(generation), ignore_errors=True)
+                logger.info(f"Índice {self.index_name}: geração {generation} removida")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if len(sys.argv) != 3 or sys.argv[1] not in ("status", "rollback"):
+        print("Uso: python3 index_generations.py [status|rollback] <índice>")
+        sys.exit(1)
+
+    manager = GenerationManager(sys.argv[2])
+    if sys.argv[1] == "rollback":
+        manager.rollback()
+    current = manager.current_generation()
+    print(f"Índice: {manager.index_name}")
+    print(f"Geração ativa: {current if current is not None else 'legado/ausente'}")
+    for generation in manager.list_generations():
+        marker = "*" if generation == current else " "
+        print(f" {marker} {generation_dirname(generation)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,20 +7,31 @@ Monitora modificações no MyVault e reindex automaticamente quando necessário
 import os
 import sys
 import time
+import signal
 import hashlib
-import subprocess
+import threading
 import json
-from datetime import datetime, timedelta
-from pathlib import Path
+from datetime import datetime
 import logging
+from reindex_scheduler import ReindexScheduler, describe
+from cache_invalidation import diff_manifest, invalidate_after_build, get_redis
+from reindex_metrics import ReindexMetrics
+from reindex_state import ReindexState, describe_builds
+from resource_governor import ResourceGovernor
 
 # Configurações
 VAULT_PATH = "/var/lib/docker/volumes/docker-compose_obsidian-vaults/_data/MyVault"
 INDEX_NAME = "myvault"
-METADATA_FILE = "/tmp/leann_reindex_metadata.json"
+METADATA_FILE = "/tmp/leann_reindex_metadata.json"  # legado, migrado para o banco de estado
 LOG_FILE = "/var/log/leann-reindex.log"
 CHECK_INTERVAL = 300  # 5 minutos
 MIN_REINDEX_INTERVAL = 3600  # 1 hora mínima entre reindexações
+QUIET_WINDOW = 600  # 10 minutos sem novas edições antes de reindexar
+MAX_REINDEX_LATENCY = 7200  # nenhuma mudança espera mais que 2 horas
+LEANN_PYTHON = os.getenv("LEANN_PYTHON", "/root/.local/share/uv/tools/leann-core/bin/python")
+METRICS_PORT = int(os.getenv("REINDEX_METRICS_PORT", "8001"))
+METRICS_TEXTFILE = os.getenv("REINDEX_METRICS_TEXTFILE")
+BUILDER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "leann_index_builder.py")
 
 # Setup logging
 logging.basicConfig(
@@ -72,28 +83,33 @@ def calculate_vault_hash():
     
     return hash_md5.hexdigest(), md_files
 
+_state = None
+
+def get_state():
+    """Estado durável (SQLite/WAL) compartilhado com o status e o wrapper HTTP"""
+    global _state
+    if _state is None:
+        _state = ReindexState("openai", legacy_metadata_file=METADATA_FILE, index_name=INDEX_NAME)
+    return _state
+
 def load_metadata():
     """Carrega metadata da última verificação"""
     try:
-        if os.path.exists(METADATA_FILE):
-            with open(METADATA_FILE, 'r') as f:
-                return json.load(f)
+        return get_state().load_metadata({
+            'last_hash': None,
+            'last_reindex': 0,
+            'last_check': 0,
+            'total_files': 0,
+            'reindex_count': 0
+        })
     except Exception as e:
         logger.warning(f"Erro ao carregar metadata: {e}")
-    
-    return {
-        'last_hash': None,
-        'last_reindex': 0,
-        'last_check': 0,
-        'total_files': 0,
-        'reindex_count': 0
-    }
+        return {}
 
 def save_metadata(metadata):
-    """Salva metadata da verificação atual"""
+    """Salva metadata da verificação atual (transação única)"""
     try:
-        with open(METADATA_FILE, 'w') as f:
-            json.dump(metadata, f, indent=2)
+        get_state().save_metadata(metadata)
     except Exception as e:
         logger.error(f"Erro ao salvar metadata: {e}")
 
@@ -111,24 +127,22 @@ def needs_reindex(current_hash, metadata):
     return False, "Nenhuma mudança detectada"
 
 def run_leann_reindex():
-    """Executa reindexação do LEANN"""
+    """Executa reindexação do LEANN reaproveitando o cache de embeddings"""
     try:
         logger.info("🔄 Iniciando reindexação LEANN...")
         
         cmd = [
-            "leann", "build", INDEX_NAME,
+            LEANN_PYTHON, BUILDER_SCRIPT, INDEX_NAME,
             "--docs", VAULT_PATH,
-            "--file-types", ".md",
             "--embedding-mode", "openai",
-            "--embedding-model", "text-embedding-3-small",
-            "--force"
+            "--embedding-model", "text-embedding-3-small"
         ]
         
-        # Executar comando
-        result = subprocess.run(
+        # Executar build com prioridade reduzida, pausando durante picos de busca
+        # (logs do builder em stderr, relatório JSON em stdout)
+        governor = ResourceGovernor(redis_factory=get_redis)
+        result = governor.run(
             cmd,
-            capture_output=True,
-            text=True,
             cwd="/root",
             env={**os.environ, 
                  "PATH": "/root/.local/bin:" + os.environ.get("PATH", ""),
@@ -136,32 +150,46 @@ def run_leann_reindex():
         )
         
         if result.returncode == 0:
+            report = json.loads(result.stdout.strip().splitlines()[-1])
+            report['timings']['throttled'] = governor.throttled_seconds
+            report['throttle_pauses'] = governor.pauses
+            if governor.pauses:
+                logger.info(f"⏸️ Build pausado {governor.pauses}x por carga de busca "
+                            f"({governor.throttled_seconds:.0f}s)")
+            logger.info(
+                f"📦 Cache de embeddings: {report['cache_hits']}/{report['cache_lookups']} hits "
+                f"({report['hit_ratio']:.1%}), {report['embedding_calls_saved']} chamadas economizadas"
+            )
+            if report.get('dedup'):
+                logger.info(f"🧬 Dedup: {report['dedup']['chunks_before']} -> {report['chunks']} chunks "
+                            f"({report['dedup_ratio']:.1%} quase duplicados)")
+            if report.get('resumed_from'):
+                logger.info(f"♻️ Build retomado do checkpoint ({report['resumed_from']})")
+            logger.info(f"🟢 Geração {report['generation']} promovida (anterior: {report['previous_generation']})")
             logger.info("✅ Reindexação LEANN concluída com sucesso")
-            return True
+            return report
         else:
             logger.error(f"❌ Erro na reindexação: {result.stderr}")
-            return False
+            return None
             
     except Exception as e:
         logger.error(f"❌ Erro ao executar reindexação: {e}")
-        return False
+        return None
 
-def clear_redis_cache():
-    """Limpa cache Redis após reindexação"""
-    try:
-        import redis
-        r = redis.Redis(host='localhost', port=26379, db=1, decode_responses=True)
-        
-        # Buscar chaves do cache LEANN
-        leann_keys = r.keys("leann:*")
-        if leann_keys:
-            deleted = r.delete(*leann_keys)
-            logger.info(f"🗑️ Cache Redis limpo: {deleted} chaves removidas")
-        else:
-            logger.info("🗑️ Cache Redis já vazio")
-            
-    except Exception as e:
-        logger.warning(f"⚠️ Erro ao limpar cache Redis: {e}")
+def clear_redis_cache(changed_paths=None, report=None):
+    """Invalida o cache Redis após reindexação (apenas notas alteradas, se conhecidas)
+
+    Falhas (ex.: senha do Redis recusada) entram como aviso no relatório do build.
+    """
+    invalidation = invalidate_after_build(changed_paths, report)
+    if invalidation is None:
+        return
+    invalidated, kept = invalidation
+    if changed_paths is None:
+        logger.info(f"🗑️ Cache Redis limpo: {invalidated} chaves removidas")
+    else:
+        logger.info(f"🗑️ Cache Redis: {invalidated} chaves invalidadas "
+                    f"({len(changed_paths)} notas alteradas), {kept} chaves mantidas")
 
 def monitor_vault():
     """Loop principal de monitoramento"""
@@ -169,70 +197,103 @@ def monitor_vault():
     logger.info(f"📁 Monitorando: {VAULT_PATH}")
     logger.info(f"⏰ Intervalo de verificação: {CHECK_INTERVAL}s")
     
-    while True:
+    stop = threading.Event()
+    wake = threading.Event()
+    
+    def handle_stop(signum, frame):
+        logger.info(f"🛑 Sinal {signum} recebido, encerrando...")
+        stop.set()
+        wake.set()
+    
+    # SIGUSR1 força uma verificação imediata sem esperar o próximo ciclo
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGUSR1, lambda signum, frame: wake.set())
+    
+    scheduler = ReindexScheduler.from_dict(load_metadata().get('scheduler'),
+                                           QUIET_WINDOW, MAX_REINDEX_LATENCY, MIN_REINDEX_INTERVAL)
+    scheduler.building_since = None  # build interrompido pelo fim do processo anterior
+    
+    metrics = ReindexMetrics(port=METRICS_PORT, textfile=METRICS_TEXTFILE)
+    metrics.start()
+    metrics.seed_last_success(INDEX_NAME, load_metadata().get('last_reindex'))
+    
+    while not stop.is_set():
         try:
-            # Carregar metadata
+            # Carregar metadata e o manifesto do último build
             metadata = load_metadata()
+            indexed_manifest = get_state().load_manifest(INDEX_NAME)
             
             # Calcular hash atual
+            scan_start = time.time()
             current_hash, file_list = calculate_vault_hash()
             total_files = len(file_list)
+            manifest = {f['path']: f['hash'] for f in file_list}
+            changed_files = diff_manifest(indexed_manifest, manifest)
+            metrics.observe_scan(INDEX_NAME, time.time() - scan_start, total_files, len(changed_files))
             
-            logger.info(f"📊 Verificação: {total_files} arquivos .md encontrados")
+            logger.info(f"📊 Verificação: {total_files} arquivos .md encontrados, {len(changed_files)} alterados")
             
-            # Verificar se precisa reindexar
+            # Verificar se precisa reindexar; rajadas de edições são coalescidas pelo scheduler
             should_reindex, reason = needs_reindex(current_hash, metadata)
-            
             if should_reindex:
-                # Verificar intervalo mínimo
-                last_reindex = metadata.get('last_reindex', 0)
-                time_since_last = time.time() - last_reindex
-                
-                if time_since_last < MIN_REINDEX_INTERVAL:
-                    wait_time = MIN_REINDEX_INTERVAL - time_since_last
-                    logger.info(f"⏳ Aguardando intervalo mínimo: {wait_time/60:.1f} min")
-                else:
-                    logger.info(f"🔄 Reindexação necessária: {reason}")
-                    
-                    # Executar reindexação
-                    if run_leann_reindex():
-                        # Limpar cache Redis
-                        clear_redis_cache()
-                        
-                        # Atualizar metadata
-                        metadata.update({
-                            'last_hash': current_hash,
-                            'last_reindex': time.time(),
-                            'last_check': time.time(),
-                            'total_files': total_files,
-                            'reindex_count': metadata.get('reindex_count', 0) + 1
-                        })
-                        
-                        logger.info(f"✅ Reindexação #{metadata['reindex_count']} concluída")
-                    else:
-                        logger.error("❌ Falha na reindexação")
+                scheduler.notify_change(current_hash, reason)
             else:
+                scheduler.clear_pending()
                 logger.info(f"✅ {reason}")
+            
+            metadata.update({
+                'last_check': time.time(),
+                'total_files': total_files
+            })
+            
+            if scheduler.due():
+                logger.info(f"🔄 Reindexação necessária: {scheduler.pending_reason}")
+                token = scheduler.start_build()
+                metadata['scheduler'] = scheduler.to_dict()
+                save_metadata(metadata)
                 
-                # Atualizar apenas timestamp da verificação
-                metadata.update({
-                    'last_check': time.time(),
-                    'total_files': total_files
-                })
+                # Executar reindexação
+                build_start = time.time()
+                report = run_leann_reindex()
+                scheduler.finish_build(bool(report), token)
+                metrics.observe_build(INDEX_NAME, report, time.time())
+                if report:
+                    # Invalidar só o cache das notas alteradas desde o último build
+                    clear_redis_cache(changed_files if indexed_manifest else None, report)
+                get_state().record_build(INDEX_NAME, build_start, time.time(), report, len(changed_files))
+                if report:
+                    get_state().replace_manifest(INDEX_NAME, manifest, indexed_manifest)
+                    
+                    # Atualizar metadata
+                    metadata.update({
+                        'last_hash': token,
+                        'last_reindex': time.time(),
+                        'reindex_count': metadata.get('reindex_count', 0) + 1
+                    })
+                    
+                    logger.info(f"✅ Reindexação #{metadata['reindex_count']} concluída")
+                else:
+                    logger.error("❌ Falha na reindexação")
+            elif scheduler.next_run_at():
+                wait_time = scheduler.next_run_at() - time.time()
+                logger.info(f"⏳ Reindexação agendada ({scheduler.state()}) em {wait_time/60:.1f} min")
             
             # Salvar metadata
+            metadata['scheduler'] = scheduler.to_dict()
             save_metadata(metadata)
             
-            # Aguardar próxima verificação
-            logger.info(f"😴 Próxima verificação em {CHECK_INTERVAL/60:.1f} min")
-            time.sleep(CHECK_INTERVAL)
+            # Aguardar próxima verificação ou o build planejado, o que vier primeiro
+            wait_time = scheduler.seconds_until_wake(CHECK_INTERVAL)
+            logger.info(f"😴 Próxima verificação em {wait_time/60:.1f} min")
+            wake.wait(wait_time)
+            wake.clear()
             
         except KeyboardInterrupt:
             logger.info("🛑 Monitoramento interrompido pelo usuário")
             break
         except Exception as e:
             logger.error(f"❌ Erro no loop principal: {e}")
-            time.sleep(60)  # Aguardar 1 min antes de tentar novamente
+            stop.wait(60)  # Aguardar 1 min antes de tentar novamente
 
 def show_status():
     """Mostra status atual do monitoramento"""
@@ -254,6 +315,15 @@ def show_status():
     
     if metadata.get('last_hash'):
         print(f"🔐 Hash atual: {metadata['last_hash'][:16]}...")
+    
+    for line in describe(metadata.get('scheduler'), QUIET_WINDOW, MAX_REINDEX_LATENCY, MIN_REINDEX_INTERVAL):
+        print(f"🗓️ {line}")
+    
+    builds = describe_builds(get_state().conn, INDEX_NAME)
+    if builds:
+        print("🏗️ Últimos builds:")
+        for line in builds:
+            print(f"   {line}")
 
 if __name__ == "__main__":
     if len(sys.argv) > 1:
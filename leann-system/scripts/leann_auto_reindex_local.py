@@ -7,23 +7,34 @@ Monitora modificações e usa embeddings locais por padrão
 import os
 import sys
 import time
+import signal
+import threading
 import hashlib
 import json
-from datetime import datetime, timedelta
-from pathlib import Path
+from datetime import datetime
 import logging
-
-# Add local-llm to path
-sys.path.insert(0, '/opt/local-llm')
-from leann_local_adapter import LEANNAdapter
+from reindex_scheduler import ReindexScheduler, describe
+from cache_invalidation import diff_manifest, invalidate_after_build, get_redis
+from reindex_metrics import ReindexMetrics
+from reindex_state import ReindexState, describe_builds
+from resource_governor import ResourceGovernor
 
 # Configurações
 VAULT_PATH = "/var/lib/docker/volumes/docker-compose_obsidian-vaults/_data/MyVault"
 INDEX_NAME = "myvault"
-METADATA_FILE = "/tmp/leann_reindex_metadata_local.json"
+METADATA_FILE = "/tmp/leann_reindex_metadata_local.json"  # legacy, migrated to the state database
 LOG_FILE = "/var/log/leann-reindex-local.log"
 CHECK_INTERVAL = 300  # 5 minutos
 MIN_REINDEX_INTERVAL = 3600  # 1 hora mínima entre reindexações
+QUIET_WINDOW = 600  # 10 minutos sem novas edições antes de reindexar
+MAX_REINDEX_LATENCY = 7200  # nenhuma mudança espera mais que 2 horas
+LEANN_PYTHON = os.getenv("LEANN_PYTHON", "/root/.local/share/uv/tools/leann-core/bin/python")
+METRICS_PORT = int(os.getenv("REINDEX_METRICS_PORT", "8002"))
+METRICS_TEXTFILE = os.getenv("REINDEX_METRICS_TEXTFILE")
+BUILDER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "leann_index_builder.py")
+LOCAL_EMBEDDING_MODE = "sentence-transformers"
+LOCAL_EMBEDDING_MODEL = os.getenv("LEANN_LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"
 
 # Setup logging
 logging.basicConfig(
@@ -40,7 +51,7 @@ def calculate_vault_hash():
     """Calcula hash MD5 de todos os arquivos .md no vault"""
     hash_md5 = hashlib.md5()
 
-    md_files = []
+    md_files = {}
     for root, dirs, files in os.walk(VAULT_PATH):
         # Ignorar diretórios ocultos
         dirs[:] = [d for d in dirs if not d.startswith('.')]
@@ -55,63 +66,108 @@ def calculate_vault_hash():
 
                     # Adicionar ao hash
                     hash_md5.update(f"{rel_path}:{mtime}".encode())
-                    md_files.append(rel_path)
+                    md_files[rel_path] = str(mtime)
 
                 except Exception as e:
                     logger.warning(f"Failed to process {file_path}: {e}")
 
-    return hash_md5.hexdigest(), len(md_files)
+    return hash_md5.hexdigest(), md_files
+
+_state = None
+
+def get_state():
+    """Estado durável (SQLite/WAL) compartilhado com o status e o wrapper HTTP"""
+    global _state
+    if _state is None:
+        _state = ReindexState("local", legacy_metadata_file=METADATA_FILE, index_name=INDEX_NAME)
+    return _state
 
 def load_metadata():
     """Carrega metadados salvos"""
-    if os.path.exists(METADATA_FILE):
-        try:
-            with open(METADATA_FILE, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            logger.error(f"Failed to load metadata: {e}")
-
-    return {
-        "last_hash": None,
-        "last_reindex": None,
-        "file_count": 0,
-        "mode": "local"
-    }
+    try:
+        return get_state().load_metadata({
+            "last_hash": None,
+            "last_reindex": None,
+            "file_count": 0,
+            "mode": "local"
+        })
+    except Exception as e:
+        logger.error(f"Failed to load metadata: {e}")
+        return {}
 
 def save_metadata(metadata):
     """Salva metadados"""
     try:
-        with open(METADATA_FILE, 'w') as f:
-            json.dump(metadata, f, indent=2)
+        get_state().save_metadata(metadata)
     except Exception as e:
         logger.error(f"Failed to save metadata: {e}")
 
-def perform_reindex(adapter, force=False):
-    """Executa reindexação com embeddings locais"""
+def invalidate_cache(changed_paths, report=None):
+    """Invalida no Redis apenas respostas que citam notas alteradas (falhas viram aviso no relatório)"""
+    invalidation = invalidate_after_build(changed_paths, report)
+    if invalidation:
+        scope = "all notes" if changed_paths is None else f"{len(changed_paths)} changed notes"
+        logger.info(f"Cache invalidation: {invalidation[0]} keys invalidated ({scope}), {invalidation[1]} keys kept")
+
+def run_index_build(embedding_mode, embedding_model):
+    """Executa o builder no ambiente leann-core e retorna o relatório do build"""
+    cmd = [
+        LEANN_PYTHON, BUILDER_SCRIPT, INDEX_NAME,
+        "--docs", VAULT_PATH,
+        "--embedding-mode", embedding_mode,
+        "--embedding-model", embedding_model
+    ]
+    # Prioridade reduzida de CPU/IO e pausa automática durante picos de busca
+    governor = ResourceGovernor(redis_factory=get_redis)
+    result = governor.run(cmd, cwd="/root")
+    if result.returncode != 0:
+        logger.error(f"Index build failed ({embedding_mode}): {result.stderr}")
+        return None
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report['timings']['throttled'] = governor.throttled_seconds
+    report['throttle_pauses'] = governor.pauses
+    if governor.pauses:
+        logger.info(f"Build paused {governor.pauses} times for search load ({governor.throttled_seconds:.0f}s)")
+    return report
+
+def perform_reindex(mode="auto"):
+    """Executa reindexação com embeddings locais (fallback OpenAI no modo auto)"""
     logger.info("Starting reindexation with LOCAL embeddings")
 
     start_time = time.time()
 
     try:
-        # Rebuild index
-        success = adapter.rebuild_leann_index(force=True)
-
-        if success:
+        report = None
+        if mode in ("auto", "local"):
+            report = run_index_build(LOCAL_EMBEDDING_MODE, LOCAL_EMBEDDING_MODEL)
+        if report is None and mode in ("auto", "openai"):
+            logger.warning("Falling back to OpenAI embeddings")
+            report = run_index_build("openai", OPENAI_EMBEDDING_MODEL)
+
+        if report:
             elapsed = time.time() - start_time
             logger.info(f"✅ Reindexation completed in {elapsed:.2f} seconds")
-
-            # Get stats
-            stats = adapter.get_stats()
-            logger.info(f"Adapter stats: {stats}")
-
-            return True
+            if report.get('dedup'):
+                logger.info(f"Dedup: {report['dedup']['chunks_before']} -> {report['chunks']} chunks "
+                            f"({report['dedup_ratio']:.1%} near-duplicates)")
+            if report.get('resumed_from'):
+                logger.info(f"Build resumed from checkpoint ({report['resumed_from']})")
+            logger.info(f"Generation {report['generation']} promoted (previous: {report['previous_generation']})")
+            logger.info(
+                f"Embedding cache: {report['cache_hits']}/{report['cache_lookups']} hits "
+                f"({report['hit_ratio']:.1%}), {report['embedding_calls_saved']} embedding calls saved"
+            )
+            for stage, stats in report.get('pipeline', {}).items():
+                logger.info(f"Pipeline {stage}: {stats['per_second']} {stats['unit']}/s ({stats['workers']} workers)")
+
+            return report
         else:
             logger.error("❌ Reindexation failed")
-            return False
+            return None
 
     except Exception as e:
         logger.error(f"Reindexation error: {e}")
-        return False
+        return None
 
 def monitor_loop():
     """Loop principal de monitoramento"""
@@ -120,68 +176,106 @@ def monitor_loop():
     logger.info(f"Check interval: {CHECK_INTERVAL} seconds")
     logger.info("Using LOCAL embeddings (zero cost, 100% privacy)")
 
-    # Initialize adapter in auto mode (local first, OpenAI fallback)
-    adapter = LEANNAdapter(mode="auto")
+    stop = threading.Event()
+    wake = threading.Event()
 
-    while True:
+    def handle_stop(signum, frame):
+        logger.info(f"Received signal {signum}, stopping")
+        stop.set()
+        wake.set()
+
+    # SIGUSR1 forces an immediate check instead of waiting for the next cycle
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGUSR1, lambda signum, frame: wake.set())
+
+    scheduler = ReindexScheduler.from_dict(load_metadata().get("scheduler"),
+                                           QUIET_WINDOW, MAX_REINDEX_LATENCY, MIN_REINDEX_INTERVAL)
+    scheduler.building_since = None  # build interrupted by the previous process exit
+
+    metrics = ReindexMetrics(port=METRICS_PORT, textfile=METRICS_TEXTFILE)
+    metrics.start()
+    last_reindex = load_metadata().get("last_reindex")
+    metrics.seed_last_success(INDEX_NAME, datetime.fromisoformat(last_reindex).timestamp() if last_reindex else None)
+
+    while not stop.is_set():
         try:
             # Calcular hash atual
-            current_hash, file_count = calculate_vault_hash()
+            scan_start = time.time()
+            current_hash, manifest = calculate_vault_hash()
+            file_count = len(manifest)
 
-            # Carregar metadados
+            # Carregar metadados e o manifesto do último build
             metadata = load_metadata()
+            indexed_manifest = get_state().load_manifest(INDEX_NAME)
+            changed_files = diff_manifest(indexed_manifest, manifest)
+            metrics.observe_scan(INDEX_NAME, time.time() - scan_start, file_count, len(changed_files))
 
-            # Verificar se houve mudança
+            # Verificar se houve mudança; rajadas de edições são coalescidas pelo scheduler
             if current_hash != metadata.get("last_hash"):
-                logger.info(f"Changes detected! Files: {file_count}, Hash: {current_hash[:8]}...")
-
-                # Verificar intervalo mínimo
-                last_reindex = metadata.get("last_reindex")
-                if last_reindex:
-                    last_time = datetime.fromisoformat(last_reindex)
-                    time_since = datetime.now() - last_time
+                if current_hash != scheduler.pending_token:
+                    logger.info(f"Changes detected! Files: {file_count}, Hash: {current_hash[:8]}...")
+                scheduler.notify_change(current_hash, "Vault modified")
+            else:
+                scheduler.clear_pending()
+                logger.debug(f"No changes detected. Files: {file_count}")
 
-                    if time_since < timedelta(seconds=MIN_REINDEX_INTERVAL):
-                        wait_time = MIN_REINDEX_INTERVAL - time_since.total_seconds()
-                        logger.info(f"Waiting {wait_time:.0f} seconds before next reindex")
-                        time.sleep(wait_time)
+            if scheduler.due():
+                token = scheduler.start_build()
+                metadata["scheduler"] = scheduler.to_dict()
+                save_metadata(metadata)
+
+                # Executar reindexação (local primeiro, fallback OpenAI)
+                build_start = time.time()
+                report = perform_reindex(mode="auto")
+                scheduler.finish_build(bool(report), token)
+                metrics.observe_build(INDEX_NAME, report, time.time())
+                if report:
+                    invalidate_cache(changed_files if indexed_manifest else None, report)
+                get_state().record_build(INDEX_NAME, build_start, time.time(), report, len(changed_files))
+                if report:
+                    get_state().replace_manifest(INDEX_NAME, manifest, indexed_manifest)
 
-                # Executar reindexação
-                if perform_reindex(adapter, force=True):
                     # Atualizar metadados
-                    metadata["last_hash"] = current_hash
+                    metadata["last_hash"] = token
                     metadata["last_reindex"] = datetime.now().isoformat()
                     metadata["file_count"] = file_count
                     metadata["mode"] = "local"
-                    save_metadata(metadata)
-
                     logger.info("✅ Metadata updated")
-            else:
-                logger.debug(f"No changes detected. Files: {file_count}")
+            elif scheduler.next_run_at():
+                wait_time = scheduler.next_run_at() - time.time()
+                logger.info(f"Reindex planned ({scheduler.state()}) in {wait_time:.0f} seconds")
+
+            metadata["scheduler"] = scheduler.to_dict()
+            save_metadata(metadata)
 
-            # Aguardar próximo check
-            time.sleep(CHECK_INTERVAL)
+            # Aguardar próximo check ou o build planejado, o que vier primeiro
+            wake.wait(scheduler.seconds_until_wake(CHECK_INTERVAL))
+            wake.clear()
 
         except KeyboardInterrupt:
             logger.info("Received stop signal")
             break
         except Exception as e:
             logger.error(f"Monitor loop error: {e}")
-            time.sleep(30)  # Wait before retry
+            stop.wait(30)  # Wait before retry
 
 def main():
     """Main function"""
     if len(sys.argv) > 1:
         if sys.argv[1] == "force":
             logger.info("Force reindexing...")
-            adapter = LEANNAdapter(mode="local")
-            perform_reindex(adapter, force=True)
+            if perform_reindex(mode="local"):
+                invalidate_cache(None)
         elif sys.argv[1] == "status":
             metadata = load_metadata()
             print(f"Last reindex: {metadata.get('last_reindex', 'Never')}")
             print(f"File count: {metadata.get('file_count', 0)}")
             print(f"Mode: {metadata.get('mode', 'unknown')}")
             print(f"Last hash: {metadata.get('last_hash', 'None')[:8] if metadata.get('last_hash') else 'None'}...")
+            for line in describe(metadata.get("scheduler"), QUIET_WINDOW, MAX_REINDEX_LATENCY, MIN_REINDEX_INTERVAL):
+                print(line)
+            for line in describe_builds(get_state().conn, INDEX_NAME):
+                print(f"Build: {line}")
     else:
         monitor_loop()
 
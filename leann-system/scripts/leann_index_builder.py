@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+LEANN Index Builder
+Constrói o índice LEANN reaproveitando embeddings já calculados (cache por conteúdo)
+
+Executado pelo Python do ambiente leann-core (LEANN_PYTHON) a partir dos daemons
+de reindexação. Logs vão para stderr; o relatório final do build é impresso como
+JSON na última linha de stdout.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import pickle
+import argparse
+import logging
+
+import numpy as np
+
+from embedding_store import EmbeddingStore, content_hash, DEFAULT_STORE_DIR
+from vault_chunker import iter_vault_chunks
+from embedding_scheduler import EmbeddingScheduler
+from local_embedding_pipeline import LocalEmbeddingPipeline, log_stage_report
+from index_generations import GenerationManager
+from build_checkpoint import BuildCheckpoint, manifest_fingerprint, EMBEDDED
+from near_duplicates import collapse_near_duplicates
+from vector_index import export_vectors
+from lexical_index import sync_chunks, index_db_path, LEXICAL_FILENAME
+from related_notes import update_graph, graph_path, GRAPH_FILENAME
+
+# Configurações
+EMBEDDING_BATCH_SIZE = 100
+DEDUP_ENABLED = os.getenv("LEANN_DEDUP_ENABLED", "true").lower() == "true"
+VECTOR_EXPORT_ENABLED = os.getenv("LEANN_VECTOR_EXPORT", "true").lower() == "true"
+LEXICAL_ENABLED = os.getenv("LEANN_LEXICAL_ENABLED", "true").lower() == "true"
+RELATED_ENABLED = os.getenv("LEANN_RELATED_ENABLED", "true").lower() == "true"
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stderr)]
+)
+logger = logging.getLogger(__name__)
+
+
+def embed_texts(texts, embedding_mode, embedding_model):
+    """Calcula embeddings via leann-core (openai, sentence-transformers, ...)"""
+    from leann.api import compute_embeddings
+    return compute_embeddings(texts, embedding_model, mode=embedding_mode, use_server=False, is_build=True)
+
+
+def smoke_query(index_path, chunks):
+    """Valida a geração shadow com uma busca real antes da promoção"""
+    from leann.api import LeannSearcher
+
+    probe = chunks[len(chunks) // 2]['text'][:200]
+    searcher = LeannSearcher(index_path)
+    try:
+        results = searcher.search(probe, top_k=1)
+    finally:
+        searcher.cleanup()
+    if not results:
+        raise RuntimeError(f"Smoke query sem resultados em {index_path}")
+
+
+def dedup_chunks(chunks, keys):
+    """Colapsa chunks quase duplicados (MinHash/LSH) antes de embedar/indexar"""
+    if not DEDUP_ENABLED:
+        return chunks, keys, None
+    chunks, keys, stats = collapse_near_duplicates(chunks, keys)
+    logger.info(f"Dedup: {stats['chunks_before']} -> {stats['chunks_after']} chunks "
+                f"({stats['ratio']:.1%} quase duplicados em {stats['groups']} grupos, {stats['seconds']:.1f}s)")
+    return chunks, keys, stats
+
+
+def build_index(vault_path, index_name, embedding_mode, embedding_model, store_dir=DEFAULT_STORE_DIR, shard=None):
+    """Constrói o índice completo (ou de um shard do vault), embedando apenas chunks ainda não vistos"""
+    from leann.api import LeannBuilder
+
+    start_time = time.time()
+    store = EmbeddingStore(embedding_model, store_dir)
+    pipeline_report = None
+
+    # Checkpoint do mesmo manifesto: retoma um build interrompido sem refazer chunking/embeddings
+    checkpoint = BuildCheckpoint(index_name, manifest_fingerprint(vault_path, shard), embedding_model)
+    checkpoint.discard_stale()
+    resumed = checkpoint.load()
+    if resumed:
+        chunks, keys = checkpoint.load_chunks()
+        logger.info(f"Retomando build do checkpoint ({resumed['phase']}, {len(chunks)} chunks)")
+
+    if embedding_mode == "sentence-transformers" and not resumed:
+        # Leitura, chunking, tokenização e inferência em estágios paralelos
+        pipeline = LocalEmbeddingPipeline(embedding_model)
+        chunks, keys, pipeline_report = pipeline.run(vault_path, store, shard)
+        if not chunks:
+            raise ValueError(f"Nenhum chunk encontrado em {vault_path}")
+        log_stage_report(pipeline_report)
+        chunking_seconds = embedding_seconds = pipeline_report['seconds']
+        cache_misses = pipeline_report['cache_misses']
+        embedded_chunks = pipeline_report['embedded_chunks']
+        embedding_calls = pipeline_report['batches']
+        embedding_tokens = pipeline_report['tokens']
+        calls_without_cache = math.ceil(len(set(keys)) / pipeline.batch_size)
+        checkpoint.save_chunks(chunks, keys, phase=EMBEDDED)
+        # Os vetores já foram calculados no pipeline; o dedup ainda reduz o índice
+        looked_up = len(chunks)
+        chunks, keys, dedup_stats = dedup_chunks(chunks, keys)
+    else:
+        # Modo local retomado cai aqui e embeda só o que faltou no store
+        if not resumed:
+            chunks = list(iter_vault_chunks(vault_path, shard=shard))
+            if not chunks:
+                raise ValueError(f"Nenhum chunk encontrado em {vault_path}")
+            keys = [content_hash(chunk['text']) for chunk in chunks]
+            checkpoint.save_chunks(chunks, keys)
+        chunking_seconds = time.time() - start_time
+        chunks, keys, dedup_stats = dedup_chunks(chunks, keys)
+        _, missing = store.get_many(keys)
+        looked_up = len(chunks)
+        cache_misses = len(missing)
+
+        # Embedar apenas conteúdos únicos ainda ausentes do store
+        pending = {}
+        for i in missing:
+            pending.setdefault(keys[i], chunks[i]['text'])
+        pending_keys = list(pending)
+        embedded_chunks = len(pending_keys)
+
+        embed_start = time.time()
+        if embedding_mode == "openai":
+            # Lotes por orçamento de tokens, concorrentes e dentro dos limites RPM/TPM
+            scheduler = EmbeddingScheduler(embedding_model)
+
+            def on_batch(indices, batch_vectors):
+                store.put_many([pending_keys[i] for i in indices], batch_vectors)
+                checkpoint.mark("embedding", embedded=scheduler.stats['chunks'], pending=len(pending_keys))
+
+            if pending_keys:
+                scheduler.embed([pending[k] for k in pending_keys], on_batch=on_batch)
+            embedding_calls = scheduler.stats['requests']
+            embedding_tokens = scheduler.stats['tokens']
+            calls_without_cache = len(scheduler.plan_batches([chunk['text'] for chunk in chunks]))
+        else:
+            embedding_calls = 0
+            embedding_tokens = 0
+            for start in range(0, len(pending_keys), EMBEDDING_BATCH_SIZE):
+                batch_keys = pending_keys[start:start + EMBEDDING_BATCH_SIZE]
+                batch_vectors = embed_texts([pending[k] for k in batch_keys], embedding_mode, embedding_model)
+                store.put_many(batch_keys, batch_vectors)
+                embedding_calls += 1
+                checkpoint.mark("embedding", embedded=start + len(batch_keys), pending=len(pending_keys))
+            calls_without_cache = math.ceil(len(set(keys)) / EMBEDDING_BATCH_SIZE)
+        embedding_seconds = time.time() - embed_start
+        checkpoint.mark(EMBEDDED)
+
+    vectors, still_missing = store.get_many(keys)
+    if still_missing:
+        raise RuntimeError(f"{len(still_missing)} chunks sem embedding após o build")
+    embeddings = np.stack(vectors).astype(np.float32)
+
+    build_start = time.time()
+    builder = LeannBuilder(
+        backend_name="hnsw",
+        embedding_model=embedding_model,
+        embedding_mode=embedding_mode,
+    )
+    for chunk in chunks:
+        builder.add_text(chunk['text'], metadata={'id': chunk['id'], **chunk['metadata']})
+
+    # Build na geração shadow; o índice ativo continua servindo até a promoção
+    generations = GenerationManager(index_name)
+    generations.discard_stale_shadows()
+    generation = generations.new_shadow()
+    index_path = generations.index_path(generation)
+    try:
+        # API documentada do leann-core: pickle (ids, embeddings) com os ids de add_text
+        embeddings_file = os.path.join(generations.path(generation), "embeddings.pkl")
+        with open(embeddings_file, 'wb') as f:
+            pickle.dump(([chunk['id'] for chunk in chunks], embeddings), f, protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            builder.build_index_from_embeddings(index_path, embeddings_file)
+        finally:
+            os.remove(embeddings_file)
+        smoke_query(index_path, chunks)
+        vectors_meta = None
+        if VECTOR_EXPORT_ENABLED:
+            # Vetores (int8 + escala) mapeáveis para busca em processo; rescoring lê o store float32
+            vectors_meta = export_vectors(generations.path(generation), chunks, embeddings,
+                                          embedding_model, embedding_mode, store=store, keys=keys,
+                                          vault_path=vault_path)
+    except Exception:
+        generations.discard(generation)
+        raise
+    index_seconds = time.time() - build_start
+
+    # BM25 e grafo vão na própria geração shadow, partindo dos da geração ativa:
+    # promoção e rollback trocam vetores, BM25 e grafo juntos
+    lexical_stats = None
+    if LEXICAL_ENABLED:
+        # Índice BM25 incremental: só chunks novos/removidos desde o último build
+        try:
+            lexical_stats = sync_chunks(os.path.join(generations.path(generation), LEXICAL_FILENAME), chunks,
+                                        seed_path=index_db_path(index_name))
+            logger.info(f"Índice léxico: +{lexical_stats['added']} -{lexical_stats['removed']} "
+                        f"~{lexical_stats['updated']} chunks ({lexical_stats['seconds']:.1f}s)")
+        except Exception as e:
+            logger.warning(f"Índice léxico não atualizado: {e}")
+
+    related_stats = None
+    if RELATED_ENABLED:
+        # Grafo k-NN entre notas para /related; só notas alteradas são recalculadas
+        try:
+            related_stats = update_graph(os.path.join(generations.path(generation), GRAPH_FILENAME), chunks, keys,
+                                         embeddings, embedding_model, previous_path=graph_path(index_name))
+            logger.info(f"Notas relacionadas: {related_stats['recomputed']}/{related_stats['notes']} notas "
+                        f"recalculadas ({related_stats['seconds']:.1f}s)")
+        except Exception as e:
+            logger.warning(f"Grafo de notas relacionadas não atualizado: {e}")
+
+    cache_hits = looked_up - cache_misses
+    report = {
+        'index': index_name,
+        'index_path': index_path,
+        'shard': shard,
+        'generation': generation,
+        'embedding_mode': embedding_mode,
+        'embedding_model': embedding_model,
+        'chunks': len(chunks),
+        'cache_lookups': looked_up,
+        'cache_hits': cache_hits,
+        'cache_misses': cache_misses,
+        'hit_ratio': cache_hits / looked_up,
+        'embedded_chunks': embedded_chunks,
+        'embedding_calls': embedding_calls,
+        'embedding_calls_saved': max(0, calls_without_cache - embedding_calls),
+        'embedding_tokens': int(embedding_tokens),
+        'index_size_bytes': generations.disk_usage(generation),
+        'store_size': len(store),
+        'resumed_from': resumed['phase'] if resumed else None,
+        'dedup_ratio': dedup_stats['ratio'] if dedup_stats else 0.0,
+        'dedup': dedup_stats,
+        'vector_quantization': vectors_meta['quantization'] if vectors_meta else None,
+        'lexical': lexical_stats,
+        'related': related_stats,
+        'timings': {
+            'chunking': chunking_seconds,
+            'embedding': embedding_seconds,
+            'dedup': dedup_stats['seconds'] if dedup_stats else 0.0,
+            'index': index_seconds,
+            'lexical': lexical_stats['seconds'] if lexical_stats else 0.0,
+            'related': related_stats['seconds'] if related_stats else 0.0,
+            'total': time.time() - start_time,
+        }
+    }
+    if pipeline_report:
+        report['pipeline'] = pipeline_report['stages']
+
+    report['previous_generation'] = generations.promote(generation, {'chunks': len(chunks)})
+    checkpoint.clear()
+    logger.info(
+        f"Embedding cache: {cache_hits}/{looked_up} hits ({report['hit_ratio']:.1%}), "
+        f"{embedded_chunks} chunks embedados, {report['embedding_calls_saved']} chamadas de embedding economizadas"
+    )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build de índice LEANN com cache de embeddings")
+    parser.add_argument("index_name")
+    parser.add_argument("--docs", required=True, help="Diretório do vault")
+    parser.add_argument("--embedding-mode", default="openai")
+    parser.add_argument("--embedding-model", default="text-embedding-3-small")
+    parser.add_argument("--cache-dir", default=DEFAULT_STORE_DIR)
+    parser.add_argument("--shard", help="Indexa só uma pasta de primeiro nível do vault")
+    args = parser.parse_args()
+
+    try:
+        report = build_index(args.docs, args.index_name, args.embedding_mode, args.embedding_model, args.cache_dir,
+                             args.shard)
+    except Exception as e:
+        logger.error(f"Build falhou: {e}")
+        sys.exit(1)
+
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+"""
+LEANN Reindex Daemon (multi-vault)
+Um único daemon para vários vaults/índices: cada entrada da configuração tem
+seu próprio scheduler, estado e métricas; os builds passam por uma fila de
+trabalho compartilhada com prioridade e fair share entre índices
+
+Configuração (JSON, LEANN_REINDEX_CONFIG):
+    {
+      "workers": 2,
+      "check_interval": 300,
+      "indexes": [
+        {"index": "myvault", "vault_path": "/path/MyVault",
+         "embedding_mode": "sentence-transformers",
+         "embedding_model": "sentence-transformers/all-MiniLM-L6-v2",
+         "fallback": {"embedding_mode": "openai", "embedding_model": "text-embedding-3-small"},
+         "priority": 0,
+         "shard_by": "top-level"}
+      ]
+    }
+
+Com "shard_by": "top-level" o índice é dividido em um índice por pasta de
+primeiro nível do vault (<índice>@<pasta>, notas da raiz em <índice>@_root):
+cada shard tem scheduler e builds próprios, só os shards com mudanças são
+reconstruídos e os builds rodam em paralelo nos workers. O registro de shards
+no banco de estado permite ao wrapper rotear ou distribuir as consultas.
+
+Uso:
+    python3 leann_reindex_daemon.py            # monitoramento contínuo
+    python3 leann_reindex_daemon.py status
+    python3 leann_reindex_daemon.py force <índice>
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import queue
+import signal
+import hashlib
+import itertools
+import threading
+import logging
+from datetime import datetime
+
+from vault_chunker import iter_vault_files, shard_of
+from reindex_scheduler import ReindexScheduler, describe
+from cache_invalidation import diff_manifest, invalidate_after_build, get_redis
+from reindex_metrics import ReindexMetrics
+from reindex_state import ReindexState, describe_builds, load_shards
+from resource_governor import ResourceGovernor
+
+# Configurações
+CONFIG_FILE = os.getenv("LEANN_REINDEX_CONFIG", "/etc/leann/reindex-indexes.json")
+LOG_FILE = "/var/log/leann-reindex-daemon.log"
+DEFAULT_WORKERS = 1
+CHECK_INTERVAL = 300  # 5 minutos
+MIN_REINDEX_INTERVAL = 3600  # 1 hora mínima entre reindexações do mesmo índice
+QUIET_WINDOW = 600  # 10 minutos sem novas edições antes de reindexar
+MAX_REINDEX_LATENCY = 7200  # nenhuma mudança espera mais que 2 horas
+SAFETY_REINDEX_INTERVAL = 86400  # reindexação diária de segurança
+USAGE_HALF_LIFE = 6 * 3600  # meia-vida do uso de workers no fair share
+LEANN_PYTHON = os.getenv("LEANN_PYTHON", "/root/.local/share/uv/tools/leann-core/bin/python")
+METRICS_PORT = int(os.getenv("REINDEX_METRICS_PORT", "8003"))
+METRICS_TEXTFILE = os.getenv("REINDEX_METRICS_TEXTFILE")
+BUILDER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "leann_index_builder.py")
+
+# Fallback quando não há arquivo de configuração: o vault padrão dos daemons antigos
+DEFAULT_INDEXES = [{
+    "index": "myvault",
+    "vault_path": "/var/lib/docker/volumes/docker-compose_obsidian-vaults/_data/MyVault",
+    "embedding_mode": "sentence-transformers",
+    "embedding_model": "sentence-transformers/all-MiniLM-L6-v2",
+    "fallback": {"embedding_mode": "openai", "embedding_model": "text-embedding-3-small"},
+}]
+
+logger = logging.getLogger(__name__)
+
+_SHARD_NAME_RE = re.compile(r"[^\w.-]+")
+
+
+def shard_index_name(index_name, shard):
+    """Nome do índice de um shard: <índice>@<pasta> (caracteres fora de [\\w.-] viram _)"""
+    return f"{index_name}@{_SHARD_NAME_RE.sub('_', shard)}"
+
+
+class IndexTarget:
+    """Uma entrada da configuração (ou um shard dela) com o estado de execução do índice"""
+
+    def __init__(self, entry, check_interval, shard=None):
+        self.parent = entry["index"]
+        self.shard = shard
+        self.name = shard_index_name(self.parent, shard) if shard else self.parent
+        self.vault_path = entry["vault_path"]
+        self.embedding_mode = entry.get("embedding_mode", "sentence-transformers")
+        self.embedding_model = entry.get("embedding_model", "sentence-transformers/all-MiniLM-L6-v2")
+        self.fallback = entry.get("fallback")
+        self.priority = int(entry.get("priority", 0))
+        self.check_interval = int(entry.get("check_interval", check_interval))
+        self.state = ReindexState(f"multi:{self.name}")
+        self.scheduler = ReindexScheduler.from_dict(self.load_metadata().get("scheduler"),
+                                                    QUIET_WINDOW, MAX_REINDEX_LATENCY, MIN_REINDEX_INTERVAL)
+        self.scheduler.building_since = None  # build interrompido pelo fim do processo anterior
+        self.next_scan = 0.0
+        self.in_flight = False
+
+    def load_metadata(self):
+        return self.state.load_metadata({
+            "last_hash": None,
+            "last_reindex": 0,
+            "last_check": 0,
+            "total_files": 0,
+            "reindex_count": 0,
+        })
+
+    def build_modes(self):
+        modes = [(self.embedding_mode, self.embedding_model)]
+        if self.fallback:
+            modes.append((self.fallback["embedding_mode"], self.fallback["embedding_model"]))
+        return modes
+
+
+def load_config(path=CONFIG_FILE):
+    if not os.path.exists(path):
+        logger.warning(f"⚠️ Configuração {path} não encontrada, usando o índice padrão")
+        return {"indexes": DEFAULT_INDEXES}
+    with open(path, 'r') as f:
+        config = json.load(f)
+    names = [entry["index"] for entry in config.get("indexes", [])]
+    if not names:
+        raise ValueError(f"Nenhum índice configurado em {path}")
+    if len(names) != len(set(names)):
+        raise ValueError(f"Índices duplicados em {path}")
+    return config
+
+
+class ShardGroup:
+    """Índice lógico dividido em shards por pasta de primeiro nível do vault
+
+    Uma única varredura do vault alimenta todos os shards; pastas novas viram
+    shards novos e pastas removidas saem do registro.
+    """
+
+    def __init__(self, entry, check_interval):
+        self.entry = entry
+        self.name = entry["index"]
+        self.vault_path = entry["vault_path"]
+        self.check_interval = int(entry.get("check_interval", check_interval))
+        self.state = ReindexState(f"multi:{self.name}")
+        self.shards = {}
+        self.next_scan = 0.0
+
+    def due(self, now):
+        return now >= self.next_scan or any(
+            not target.in_flight and (now >= target.next_scan or target.scheduler.due(now))
+            for target in self.shards.values()
+        )
+
+
+def manifest_hash(manifest):
+    digest = hashlib.sha256()
+    for path in sorted(manifest):
+        digest.update(f"{path}:{manifest[path]}\n".encode())
+    return digest.hexdigest()
+
+
+def split_manifest(manifest):
+    """{shard: manifesto do shard} a partir do manifesto do vault inteiro"""
+    shards = {}
+    for path, signature in manifest.items():
+        shards.setdefault(shard_of(path), {})[path] = signature
+    return shards
+
+
+def scan_vault(vault_path, shard=None):
+    """Manifesto {caminho relativo: mtime_ns:tamanho} e hash do vault (ou de um shard)"""
+    manifest = {}
+    for file_path in iter_vault_files(vault_path, shard=shard):
+        try:
+            stat = os.stat(file_path)
+        except OSError as e:
+            logger.warning(f"Erro ao processar {file_path}: {e}")
+            continue
+        manifest[os.path.relpath(file_path, vault_path)] = f"{stat.st_mtime_ns}:{stat.st_size}"
+    return manifest_hash(manifest), manifest
+
+
+class FairWorkQueue:
+    """Fila de builds ordenada por (prioridade maior primeiro, uso recente do índice, chegada)
+
+    O uso é o tempo de worker consumido por cada índice, com decaimento
+    exponencial: um vault enorme que acabou de ocupar um worker por uma hora
+    fica atrás dos vaults pequenos até o uso decair. Cada índice tem no máximo
+    um build na fila.
+    """
+
+    def __init__(self, half_life=USAGE_HALF_LIFE):
+        self.half_life = half_life
+        self._items = []
+        self._usage = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def _usage_of(self, key, now):
+        usage, updated = self._usage.get(key, (0.0, now))
+        return usage * 0.5 ** ((now - updated) / self.half_life)
+
+    def put(self, key, item, priority=0):
+        with self._cond:
+            if any(queued_key == key for _, _, queued_key, _ in self._items):
+                return False
+            self._items.append((priority, next(self._seq), key, item))
+            self._cond.notify()
+            return True
+
+    def get(self):
+        """Bloqueia até haver trabalho; retorna (chave, item) ou None após close()"""
+        with self._cond:
+            while not self._items and not self._closed:
+                self._cond.wait()
+            if not self._items:
+                return None
+            now = time.time()
+            chosen = min(self._items, key=lambda entry: (-entry[0], self._usage_of(entry[2], now), entry[1]))
+            self._items.remove(chosen)
+            return chosen[2], chosen[3]
+
+    def charge(self, key, seconds):
+        with self._cond:
+            now = time.time()
+            self._usage[key] = (self._usage_of(key, now) + seconds, now)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+
+def run_build(target):
+    """Executa o builder para o índice (com fallback de modo) e retorna o relatório"""
+    for embedding_mode, embedding_model in target.build_modes():
+        cmd = [
+            LEANN_PYTHON, BUILDER_SCRIPT, target.name,
+            "--docs", target.vault_path,
+            "--embedding-mode", embedding_mode,
+            "--embedding-model", embedding_model
+        ]
+        if target.shard:
+            cmd.extend(["--shard", target.shard])
+        governor = ResourceGovernor(redis_factory=get_redis)
+        result = governor.run(cmd, cwd="/root")
+        if result.returncode == 0:
+            report = json.loads(result.stdout.strip().splitlines()[-1])
+            report['timings']['throttled'] = governor.throttled_seconds
+            report['throttle_pauses'] = governor.pauses
+            return report
+        logger.error(f"❌ [{target.name}] Build falhou ({embedding_mode}): {result.stderr}")
+    return None
+
+
+def worker_loop(work_queue, results):
+    while True:
+        job = work_queue.get()
+        if job is None:
+            return
+        target, job = job[1]
+        started = time.time()
+        logger.info(f"🔄 [{target.name}] Build iniciado ({job['reason']})")
+        try:
+            report = run_build(target)
+        except Exception as e:
+            logger.error(f"❌ [{target.name}] Erro ao executar build: {e}")
+            report = None
+        finished = time.time()
+        work_queue.charge(target.name, finished - started)
+        results.put((target, job, report, started, finished))
+
+
+class ReindexDaemon:
+    """Loop principal: varre os vaults, agenda builds e aplica os resultados"""
+
+    def __init__(self, config):
+        check_interval = int(config.get("check_interval", CHECK_INTERVAL))
+        self.targets = [IndexTarget(entry, check_interval) for entry in config["indexes"]
+                        if not entry.get("shard_by")]
+        self.groups = [ShardGroup(entry, check_interval) for entry in config["indexes"] if entry.get("shard_by")]
+        self.workers = int(config.get("workers", DEFAULT_WORKERS))
+        self.work_queue = FairWorkQueue()
+        self.results = queue.Queue()
+        self.metrics = ReindexMetrics(port=METRICS_PORT, textfile=METRICS_TEXTFILE)
+        self.stop = threading.Event()
+
+    def all_targets(self):
+        return self.targets + [target for group in self.groups for target in group.shards.values()]
+
+    def scan_group(self, group, now):
+        """Varre o vault uma vez e agenda cada shard com o seu pedaço do manifesto"""
+        scan_start = time.time()
+        _, manifest = scan_vault(group.vault_path)
+        by_shard = split_manifest(manifest)
+        scan_seconds = time.time() - scan_start
+
+        for shard in by_shard:
+            if shard not in group.shards:
+                target = IndexTarget(group.entry, group.check_interval, shard)
+                group.shards[shard] = target
+                self.metrics.seed_last_success(target.name, target.load_metadata().get("last_reindex"))
+                logger.info(f"🧩 [{group.name}] Shard {shard} ({target.name})")
+        for shard, target in list(group.shards.items()):
+            if shard not in by_shard and not target.in_flight:
+                del group.shards[shard]
+                group.state.remove_shard(group.name, shard)
+                self.metrics.forget_index(target.name)
+                logger.info(f"🧩 [{group.name}] Shard {shard} removido do registro (pasta sem notas)")
+
+        for shard, target in group.shards.items():
+            if not target.in_flight and shard in by_shard:
+                shard_manifest = by_shard[shard]
+                self.scan(target, now, (manifest_hash(shard_manifest), shard_manifest, scan_seconds))
+        group.next_scan = now + group.check_interval
+
+    def scan(self, target, now, scanned=None):
+        metadata = target.load_metadata()
+        indexed_manifest = target.state.load_manifest(target.name)
+        if scanned is None:
+            scan_start = time.time()
+            current_hash, manifest = scan_vault(target.vault_path)
+            scan_seconds = time.time() - scan_start
+        else:
+            current_hash, manifest, scan_seconds = scanned
+        changed_files = diff_manifest(indexed_manifest, manifest)
+        self.metrics.observe_scan(target.name, scan_seconds, len(manifest), len(changed_files))
+
+        if current_hash != metadata.get("last_hash"):
+            if current_hash != target.scheduler.pending_token:
+                logger.info(f"📊 [{target.name}] {len(manifest)} arquivos, {len(changed_files)} alterados")
+            target.scheduler.notify_change(current_hash, "Conteúdo modificado")
+        elif now - (metadata.get("last_reindex") or 0) > SAFETY_REINDEX_INTERVAL:
+            target.scheduler.notify_change(current_hash, "Reindexação diária de segurança")
+        else:
+            target.scheduler.clear_pending()
+
+        metadata.update({"last_check": now, "total_files": len(manifest)})
+        if target.scheduler.due(now):
+            reason = target.scheduler.pending_reason
+            job = {
+                "token": target.scheduler.start_build(now),
+                "reason": reason,
+                "manifest": manifest,
+                "changed_files": changed_files if indexed_manifest else None,
+                "enqueued_at": now,
+            }
+            target.in_flight = True
+            self.work_queue.put(target.name, (target, job), target.priority)
+            logger.info(f"📥 [{target.name}] Build na fila ({reason}), {len(self.work_queue)} aguardando")
+        metadata["scheduler"] = target.scheduler.to_dict()
+        target.state.save_metadata(metadata)
+        target.next_scan = now + target.check_interval
+
+    def apply_result(self, target, job, report, started, finished):
+        """Aplica o resultado de um build no thread principal (estado SQLite e cache)"""
+        target.in_flight = False
+        target.next_scan = 0.0  # revarre logo: edições feitas durante o build entram no próximo
+        target.scheduler.finish_build(bool(report), job["token"], finished)
+        self.metrics.observe_queue(len(self.work_queue), target.name, started - job["enqueued_at"])
+        self.metrics.observe_build(target.name, report, finished)
+        changed_files = job["changed_files"]
+        if report:
+            # Antes de registrar o build: uma falha entra como aviso no relatório
+            invalidation = invalidate_after_build(changed_files, report)
+            if invalidation:
+                logger.info(f"🗑️ [{target.name}] Cache Redis: {invalidation[0]} chaves invalidadas, "
+                            f"{invalidation[1]} mantidas")
+        target.state.record_build(target.name, started, finished, report,
+                                  len(changed_files) if changed_files is not None else None)
+
+        metadata = target.load_metadata()
+        if report:
+            target.state.replace_manifest(target.name, job["manifest"])
+            if target.shard:
+                target.state.register_shard(target.parent, target.shard, target.name)
+            metadata.update({
+                "last_hash": job["token"],
+                "last_reindex": finished,
+                "reindex_count": metadata.get("reindex_count", 0) + 1,
+            })
+            logger.info(f"✅ [{target.name}] Geração {report['generation']} promovida em {finished - started:.0f}s "
+                        f"(fila: {started - job['enqueued_at']:.0f}s)")
+        else:
+            logger.error(f"❌ [{target.name}] Falha na reindexação")
+        metadata["scheduler"] = target.scheduler.to_dict()
+        target.state.save_metadata(metadata)
+
+    def seconds_until_wake(self, now):
+        waits = [group.next_scan - now for group in self.groups]
+        for target in self.all_targets():
+            if target.in_flight:
+                continue
+            waits.append(target.next_scan - now)
+            next_run = target.scheduler.next_run_at()
+            if next_run is not None:
+                waits.append(next_run - now)
+        return max(0.0, min(waits)) if waits else CHECK_INTERVAL
+
+    def run(self):
+        logger.info(f"🚀 Iniciando daemon LEANN multi-vault: {len(self.targets) + len(self.groups)} índices, "
+                    f"{self.workers} workers")
+        for target in self.targets:
+            logger.info(f"📁 {target.name}: {target.vault_path} ({target.embedding_mode}, prioridade {target.priority})")
+            self.metrics.seed_last_success(target.name, target.load_metadata().get("last_reindex"))
+        for group in self.groups:
+            logger.info(f"📁 {group.name}: {group.vault_path} (shards por pasta de primeiro nível)")
+        self.metrics.start()
+
+        workers = [threading.Thread(target=worker_loop, args=(self.work_queue, self.results),
+                                    name=f"reindex-worker-{i}", daemon=True) for i in range(self.workers)]
+        for worker in workers:
+            worker.start()
+
+        def handle_stop(signum, frame):
+            logger.info(f"🛑 Sinal {signum} recebido, encerrando...")
+            self.stop.set()
+            self.results.put(None)
+
+        def handle_wake(signum, frame):
+            # SIGUSR1 força uma verificação imediata de todos os vaults
+            for target in self.all_targets():
+                target.next_scan = 0.0
+            for group in self.groups:
+                group.next_scan = 0.0
+            self.results.put(None)
+
+        signal.signal(signal.SIGTERM, handle_stop)
+        signal.signal(signal.SIGUSR1, handle_wake)
+
+        while not self.stop.is_set():
+            try:
+                now = time.time()
+                for target in self.targets:
+                    if not target.in_flight and (now >= target.next_scan or target.scheduler.due(now)):
+                        self.scan(target, now)
+                for group in self.groups:
+                    if group.due(now):
+                        self.scan_group(group, now)
+                self.metrics.observe_queue(len(self.work_queue))
+
+                try:
+                    result = self.results.get(timeout=min(self.seconds_until_wake(time.time()), CHECK_INTERVAL))
+                    while True:
+                        if result is not None:
+                            self.apply_result(*result)
+                        result = self.results.get_nowait()
+                except queue.Empty:
+                    pass
+            except KeyboardInterrupt:
+                logger.info("🛑 Monitoramento interrompido pelo usuário")
+                break
+            except Exception as e:
+                logger.error(f"❌ Erro no loop principal: {e}")
+                self.stop.wait(60)
+
+        self.work_queue.close()
+
+
+def config_targets(entry):
+    """Alvos de uma entrada: o próprio índice ou os shards já registrados"""
+    if not entry.get("shard_by"):
+        return [IndexTarget(entry, CHECK_INTERVAL)]
+    state = ReindexState(f"multi:{entry['index']}")
+    return [IndexTarget(entry, CHECK_INTERVAL, shard) for shard in sorted(load_shards(state.conn, entry["index"]))]
+
+
+def show_status(config):
+    print("📊 LEANN Reindex Daemon Status")
+    print("=" * 40)
+    for target in [target for entry in config["indexes"] for target in config_targets(entry)]:
+        metadata = target.load_metadata()
+        print(f"\n📁 {target.name} ({target.vault_path})")
+        if metadata.get("last_reindex"):
+            print(f"🔄 Última reindexação: {datetime.fromtimestamp(metadata['last_reindex']).strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"📄 Arquivos: {metadata.get('total_files', 'N/A')}, reindexações: {metadata.get('reindex_count', 0)}")
+        for line in describe(metadata.get("scheduler"), QUIET_WINDOW, MAX_REINDEX_LATENCY, MIN_REINDEX_INTERVAL):
+            print(f"🗓️ {line}")
+        for line in describe_builds(target.state.conn, target.name, 3):
+            print(f"🏗️ {line}")
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(threadName)s - %(message)s',
+        handlers=[logging.FileHandler(LOG_FILE), logging.StreamHandler(sys.stdout)]
+    )
+    config = load_config()
+
+    if len(sys.argv) > 1 and sys.argv[1] == "status":
+        show_status(config)
+    elif len(sys.argv) > 2 and sys.argv[1] == "force":
+        entries = [entry for entry in config["indexes"] if entry["index"] == sys.argv[2]]
+        if not entries:
+            print(f"Índice não configurado: {sys.argv[2]}")
+            sys.exit(1)
+        daemon = ReindexDaemon({**config, "indexes": entries})
+        if daemon.groups:
+            # Índice shardado: reconstrói todos os shards atuais em sequência
+            group = daemon.groups[0]
+            _, manifest = scan_vault(group.vault_path)
+            scanned = {shard: (manifest_hash(part), part) for shard, part in split_manifest(manifest).items()}
+            targets = [IndexTarget(group.entry, CHECK_INTERVAL, shard) for shard in sorted(scanned)]
+        else:
+            target = daemon.targets[0]
+            targets = [target]
+            scanned = {None: scan_vault(target.vault_path)}
+        ok = True
+        for target in targets:
+            current_hash, manifest = scanned[target.shard]
+            job = {"token": current_hash, "reason": "Forçada", "manifest": manifest, "changed_files": None,
+                   "enqueued_at": time.time()}
+            started = time.time()
+            report = run_build(target)
+            daemon.apply_result(target, job, report, started, time.time())
+            ok = ok and bool(report)
+        sys.exit(0 if ok else 1)
+    elif len(sys.argv) > 1:
+        print("Uso: python3 leann_reindex_daemon.py [status|force <índice>]")
+    else:
+        ReindexDaemon(config).run()
+
+
+if __name__ == "__main__":
+    main()
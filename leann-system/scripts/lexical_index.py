@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+LEANN Lexical Index
+Índice invertido BM25 (SQLite FTS5) sobre os mesmos chunks do índice vetorial,
+atualizado incrementalmente pelo builder a cada geração promovida
+
+O banco fica dentro da geração (<geração>/lexical.db), copiado da geração ativa
+e sincronizado no shadow: um rollback volta vetores e BM25 do mesmo build.
+
+Consultas por termo exato (hostnames, códigos de erro, serviços do
+docker-compose) são respondidas sem embedding; o modo híbrido do wrapper
+funde este ranking com o vetorial por reciprocal-rank fusion.
+
+Uso:
+    python3 lexical_index.py search <índice> <consulta> [--k K]
+    python3 lexical_index.py stats <índice>
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import logging
+
+from index_generations import LEANN_INDEXES_DIR
+
+# Configurações
+LEXICAL_DIR = os.getenv("LEANN_LEXICAL_DIR", "/var/lib/leann/lexical")  # legado: um banco por índice, fora das gerações
+LEXICAL_FILENAME = "lexical.db"
+BUSY_TIMEOUT_MS = 10000
+BATCH_SIZE = 1000
+RRF_K = 60  # constante do reciprocal-rank fusion
+SECTION_WEIGHT = 2.0  # peso BM25 do título da seção em relação ao texto
+SCHEMA_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    source TEXT,
+    section TEXT,
+    text TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+    section, text, content='chunks', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN
+    INSERT INTO chunks_fts (rowid, section, text) VALUES (new.rowid, new.section, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN
+    INSERT INTO chunks_fts (chunks_fts, rowid, section, text) VALUES ('delete', old.rowid, old.section, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS chunks_au AFTER UPDATE ON chunks BEGIN
+    INSERT INTO chunks_fts (chunks_fts, rowid, section, text) VALUES ('delete', old.rowid, old.section, old.text);
+    INSERT INTO chunks_fts (rowid, section, text) VALUES (new.rowid, new.section, new.text);
+END;
+"""
+
+_TERM_RE = re.compile(r"\S+")
+
+
+def index_db_path(index_name, indexes_dir=LEANN_INDEXES_DIR, lexical_dir=LEXICAL_DIR):
+    """Banco da geração ativa; índices ainda sem ele usam o banco legado compartilhado"""
+    path = os.path.join(indexes_dir, index_name, LEXICAL_FILENAME)
+    return path if os.path.exists(path) else os.path.join(lexical_dir, f"{index_name}.db")
+
+
+def connect(path, readonly=False):
+    """Abre o banco FTS em modo WAL; o wrapper lê enquanto o builder atualiza"""
+    if readonly:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=BUSY_TIMEOUT_MS / 1000,
+                               check_same_thread=False)
+    else:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            conn.executescript(SCHEMA)
+            conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def match_expression(query):
+    """Cada termo da consulta vira uma frase FTS5 entre aspas, combinadas com OR
+
+    As aspas preservam termos como `docker-compose` ou `172.17.0.1`: o tokenizer
+    os divide em tokens adjacentes e a frase exige essa sequência exata.
+    """
+    terms = [term.strip('"\'') for term in _TERM_RE.findall(query)]
+    return " OR ".join('"{}"'.format(term.replace('"', '""')) for term in terms if term)
+
+
+def _seed(path, seed_path):
+    """Copia um banco existente (backup online do SQLite, consistente mesmo com leitores)"""
+    source = connect(seed_path, readonly=True)
+    target = sqlite3.connect(path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def sync_chunks(path, chunks, seed_path=None):
+    """Aplica ao banco em `path` só a diferença entre os chunks atuais e os já indexados
+
+    Um banco novo parte de uma cópia de `seed_path` (o da geração ativa), de
+    modo que o build só paga pelos chunks alterados.
+    """
+    started = time.time()
+    if seed_path and not os.path.exists(path) and os.path.exists(seed_path):
+        _seed(path, seed_path)
+    conn = connect(path)
+    try:
+        existing = {row['id']: row['metadata'] for row in conn.execute("SELECT id, metadata FROM chunks")}
+        current = {}
+        for chunk in chunks:
+            current.setdefault(chunk['id'], chunk)
+
+        removed = [(chunk_id,) for chunk_id in existing if chunk_id not in current]
+        added, updated = [], []
+        for chunk_id, chunk in current.items():
+            metadata = json.dumps(chunk['metadata'], sort_keys=True)
+            row = (chunk['metadata'].get('source'), chunk['metadata'].get('section'), chunk['text'],
+                   metadata, chunk_id)
+            if chunk_id not in existing:
+                added.append(row)
+            elif existing[chunk_id] != metadata:
+                # Mesmo conteúdo com metadados novos (fontes de duplicatas, frontmatter)
+                updated.append(row)
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for start in range(0, len(removed), BATCH_SIZE):
+                conn.executemany("DELETE FROM chunks WHERE id = ?", removed[start:start + BATCH_SIZE])
+            for start in range(0, len(updated), BATCH_SIZE):
+                conn.executemany("UPDATE chunks SET source = ?, section = ?, text = ?, metadata = ? WHERE id = ?",
+                                 updated[start:start + BATCH_SIZE])
+            for start in range(0, len(added), BATCH_SIZE):
+                conn.executemany("INSERT INTO chunks (source, section, text, metadata, id) VALUES (?, ?, ?, ?, ?)",
+                                 added[start:start + BATCH_SIZE])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if len(removed) > len(current) // 4:
+            conn.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('optimize')")
+    finally:
+        conn.close()
+
+    return {
+        'chunks': len(current),
+        'added': len(added),
+        'updated': len(updated),
+        'removed': len(removed),
+        'seconds': time.time() - started,
+    }
+
+
+class LexicalIndex:
+    """Busca BM25 somente leitura sobre o índice FTS5 de um índice LEANN"""
+
+    def __init__(self, index_name, path=None):
+        self.index_name = index_name
+        self.path = path or index_db_path(index_name)
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Índice léxico ausente: {self.path}")
+        self.conn = connect(self.path, readonly=True)
+
+    def close(self):
+        self.conn.close()
+
+    def search(self, query, k=5, sources=None):
+        """Top-k chunks por BM25; score maior é melhor (bm25() do SQLite é negativo)
+
+        `sources` (notas permitidas por um filtro) entra na própria consulta FTS;
+        um chunk colapsado pelo dedup passa se qualquer uma das suas `sources` passar.
+        """
+        expression = match_expression(query)
+        if not expression or (sources is not None and not sources):
+            return []
+        source_clause = ""
+        params = (SECTION_WEIGHT, expression)
+        if sources is not None:
+            source_clause = ("AND (c.source IN (SELECT value FROM json_each(?)) OR EXISTS ("
+                             "SELECT 1 FROM json_each(c.metadata, '$.sources') s "
+                             "WHERE s.value IN (SELECT value FROM json_each(?)))) ")
+            allowed = json.dumps(list(sources))
+            params += (allowed, allowed)
+        rows = self.conn.execute(
+            "SELECT c.id, c.text, c.metadata, -bm25(chunks_fts, ?, 1.0) AS score "
+            "FROM chunks_fts JOIN chunks c ON c.rowid = chunks_fts.rowid "
+            f"WHERE chunks_fts MATCH ? {source_clause}ORDER BY bm25(chunks_fts, ?, 1.0) LIMIT ?",
+            params + (SECTION_WEIGHT, k)
+        ).fetchall()
+        return [{'id': row['id'], 'text': row['text'], 'metadata': json.loads(row['metadata']),
+                 'score': row['score']} for row in rows]
+
+    def stats(self):
+        chunks = self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        return {'index': self.index_name, 'chunks': chunks, 'size_bytes': os.path.getsize(self.path)}
+
+
+def reciprocal_rank_fusion(rankings, k=5, key=lambda match: match['id'], rrf_k=RRF_K):
+    """Funde listas ranqueadas: score = soma de 1 / (rrf_k + posição) em cada lista"""
+    fused = {}
+    for ranking in rankings:
+        for position, match in enumerate(ranking, 1):
+            entry = fused.setdefault(key(match), {**match, 'score': 0.0})
+            entry['score'] += 1.0 / (rrf_k + position)
+    return sorted(fused.values(), key=lambda match: match['score'], reverse=True)[:k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Índice léxico BM25 dos chunks LEANN")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    search_parser = subparsers.add_parser("search", help="Busca BM25 no índice léxico")
+    search_parser.add_argument("index")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--k", type=int, default=5)
+    stats_parser = subparsers.add_parser("stats", help="Tamanho do índice léxico")
+    stats_parser.add_argument("index")
+    args = parser.parse_args()
+
+    index = LexicalIndex(args.index)
+    try:
+        if args.command == "search":
+            started = time.perf_counter()
+            matches = index.search(args.query, args.k)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            for rank, match in enumerate(matches, 1):
+                print(f"{rank}. {match['score']:.2f}  {match['metadata'].get('source')}  "
+                      f"[{match['metadata'].get('section') or ''}]")
+            print(f"{len(matches)} resultados em {elapsed_ms:.1f} ms")
+        elif args.command == "stats":
+            print(json.dumps(index.stats(), indent=2))
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+LEANN Local Embedding Pipeline
+Pipeline em estágios para embeddings locais usando todos os núcleos:
+leitura de arquivos -> chunking -> tokenização -> inferência em lote -> escrita dos vetores
+
+Os estágios de CPU (chunking, tokenização, inferência) rodam em processos; filas
+limitadas entre os estágios propagam backpressure até a leitura de arquivos.
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+import multiprocessing as mp
+
+import numpy as np
+
+from embedding_store import content_hash
+from vault_chunker import iter_vault_files, read_note, iter_note_chunks
+
+# Configurações
+# Respeita a afinidade de CPU imposta pelo resource governor
+CPU_COUNT = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+CHUNK_WORKERS = int(os.getenv("LOCAL_PIPELINE_CHUNK_WORKERS", str(max(1, CPU_COUNT // 4))))
+TOKENIZE_WORKERS = int(os.getenv("LOCAL_PIPELINE_TOKENIZE_WORKERS", str(max(1, CPU_COUNT // 4))))
+INFERENCE_WORKERS = int(os.getenv("LOCAL_PIPELINE_INFERENCE_WORKERS", str(max(1, CPU_COUNT // 2))))
+INFERENCE_BATCH_SIZE = int(os.getenv("LOCAL_PIPELINE_BATCH_SIZE", "64"))
+MAX_SEQ_LENGTH = 256
+QUEUE_SIZE = 64  # itens por fila entre estágios
+POLL_SECONDS = 1.0  # intervalo de verificação da saúde dos workers durante as esperas
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("read", "chunk", "tokenize", "inference", "write")
+
+
+def _chunk_worker(files_q, chunks_q, stats_q):
+    """Estágio de chunking: (índice, caminho relativo, caminho, texto) -> chunks"""
+    items = 0
+    busy = 0.0
+    while True:
+        item = files_q.get()
+        if item is None:
+            break
+        started = time.perf_counter()
+        file_index, rel_path, file_path, text = item
+        chunks = [
+            (file_index, ordinal, chunk)
+            for ordinal, chunk in enumerate(iter_note_chunks(rel_path, file_path, text.splitlines()))
+        ]
+        busy += time.perf_counter() - started
+        items += len(chunks)
+        chunks_q.put(chunks)
+    stats_q.put(("chunk", items, busy, 0))
+
+
+def _tokenize_worker(model_name, batches_q, tokens_q, stats_q):
+    """Estágio de tokenização: lote de (chave, texto) -> tensores numpy"""
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    items = 0
+    busy = 0.0
+    tokens = 0
+    while True:
+        batch = batches_q.get()
+        if batch is None:
+            break
+        started = time.perf_counter()
+        keys = [key for key, _ in batch]
+        encoded = tokenizer([text for _, text in batch], padding=True, truncation=True,
+                            max_length=MAX_SEQ_LENGTH, return_tensors="np")
+        busy += time.perf_counter() - started
+        items += len(batch)
+        tokens += int(encoded["attention_mask"].sum())
+        tokens_q.put((keys, dict(encoded)))
+    stats_q.put(("tokenize", items, busy, tokens))
+
+
+def _inference_worker(model_name, torch_threads, tokens_q, vectors_q, stats_q):
+    """Estágio de inferência: tensores -> embeddings normalizados"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(torch_threads)
+    model = SentenceTransformer(model_name, device="cpu")
+    model.eval()
+    items = 0
+    busy = 0.0
+    while True:
+        item = tokens_q.get()
+        if item is None:
+            break
+        started = time.perf_counter()
+        keys, encoded = item
+        features = {name: torch.from_numpy(value) for name, value in encoded.items()}
+        with torch.inference_mode():
+            embeddings = model(features)["sentence_embedding"]
+            embeddings = torch.nn.functional.normalize(embeddings, p=2, dim=1)
+        busy += time.perf_counter() - started
+        items += len(keys)
+        vectors_q.put((keys, embeddings.numpy().astype(np.float32)))
+    stats_q.put(("inference", items, busy, 0))
+
+
+class LocalEmbeddingPipeline:
+    """Orquestra os estágios e alimenta o EmbeddingStore apenas com chunks inéditos"""
+
+    def __init__(self, model_name, chunk_workers=CHUNK_WORKERS, tokenize_workers=TOKENIZE_WORKERS,
+                 inference_workers=INFERENCE_WORKERS, batch_size=INFERENCE_BATCH_SIZE):
+        self.model_name = model_name
+        self.workers = {
+            "read": 1,
+            "chunk": chunk_workers,
+            "tokenize": tokenize_workers,
+            "inference": inference_workers,
+            "write": 1,
+        }
+        self.batch_size = batch_size
+        # Chunking e tokenização ocupam um núcleo por worker; a inferência divide o resto
+        inference_cpus = max(inference_workers, CPU_COUNT - chunk_workers - tokenize_workers)
+        self.torch_threads = max(1, inference_cpus // inference_workers)
+        self._stats = {stage: [0, 0.0] for stage in STAGES}
+        self._stats_lock = threading.Lock()
+        self._errors = []
+        self.tokens = 0
+
+    def _record(self, stage, items, busy, tokens=0):
+        with self._stats_lock:
+            self._stats[stage][0] += items
+            self._stats[stage][1] += busy
+            self.tokens += tokens
+
+    def _read_files(self, vault_path, files_q, shard=None):
+        try:
+            for file_index, file_path in enumerate(iter_vault_files(vault_path, shard=shard)):
+                started = time.perf_counter()
+                text = read_note(file_path)
+                self._record("read", 1, time.perf_counter() - started)
+                if text is not None:
+                    files_q.put((file_index, os.path.relpath(file_path, vault_path), file_path, text))
+        except Exception as e:
+            self._errors.append(e)
+
+    def _dispatch(self, chunks_q, batches_q, store, collected):
+        """Registra todos os chunks e envia só os ausentes do store para tokenização"""
+        try:
+            self._dispatch_chunks(chunks_q, batches_q, store, collected)
+        except Exception as e:
+            self._errors.append(e)
+
+    def _dispatch_chunks(self, chunks_q, batches_q, store, collected):
+        seen = set()
+        misses = 0
+        batch = []
+        while True:
+            item = chunks_q.get()
+            if item is None:
+                break
+            for file_index, ordinal, chunk in item:
+                key = content_hash(chunk['text'])
+                collected.append((file_index, ordinal, key, chunk))
+                if key in store:
+                    continue
+                misses += 1
+                if key in seen:
+                    continue
+                seen.add(key)
+                batch.append((key, chunk['text']))
+                if len(batch) >= self.batch_size:
+                    batches_q.put(batch)
+                    batch = []
+        if batch:
+            batches_q.put(batch)
+        self.pending = len(seen)
+        self.misses = misses
+
+    def _write_vectors(self, vectors_q, store):
+        try:
+            while True:
+                item = vectors_q.get()
+                if item is None:
+                    break
+                started = time.perf_counter()
+                keys, vectors = item
+                store.put_many(keys, vectors)
+                self.batches += 1
+                self._record("write", len(keys), time.perf_counter() - started)
+        except Exception as e:
+            self._errors.append(e)
+
+    def _check(self, processes):
+        """Falha assim que uma thread registrou erro ou um worker morreu (exceção, OOM, sinal)"""
+        if self._errors:
+            raise self._errors[0]
+        failed = [p.name for p in processes if p.exitcode not in (None, 0)]
+        if failed:
+            raise RuntimeError(f"Workers do pipeline falharam: {', '.join(failed)}")
+
+    def _wait(self, waitables, processes):
+        """Aguarda threads/processos de um estágio verificando a saúde de todo o pipeline
+
+        Um estágio morto deixa os vizinhos bloqueados nas filas limitadas; a espera
+        com timeout detecta a falha em vez de travar o build.
+        """
+        for waitable in waitables:
+            while waitable.is_alive():
+                waitable.join(POLL_SECONDS)
+                self._check(processes)
+        self._check(processes)
+
+    def _send(self, q, item, processes):
+        """put com backpressure que não trava se os consumidores morreram"""
+        while True:
+            try:
+                q.put(item, timeout=POLL_SECONDS)
+                return
+            except queue.Full:
+                self._check(processes)
+
+    def run(self, vault_path, store, shard=None):
+        """Executa o pipeline e retorna (chunks ordenados, chaves de conteúdo, relatório)"""
+        started = time.time()
+        files_q = mp.Queue(QUEUE_SIZE)
+        chunks_q = mp.Queue(QUEUE_SIZE)
+        batches_q = mp.Queue(QUEUE_SIZE)
+        tokens_q = mp.Queue(QUEUE_SIZE)
+        vectors_q = mp.Queue(QUEUE_SIZE)
+        stats_q = mp.Queue()
+        collected = []
+        self.pending = 0
+        self.misses = 0
+        self.batches = 0
+
+        chunkers = [mp.Process(target=_chunk_worker, args=(files_q, chunks_q, stats_q), name=f"chunk-{i}")
+                    for i in range(self.workers["chunk"])]
+        tokenizers = [mp.Process(target=_tokenize_worker, args=(self.model_name, batches_q, tokens_q, stats_q),
+                                 name=f"tokenize-{i}") for i in range(self.workers["tokenize"])]
+        inferers = [mp.Process(target=_inference_worker,
+                               args=(self.model_name, self.torch_threads, tokens_q, vectors_q, stats_q),
+                               name=f"inference-{i}") for i in range(self.workers["inference"])]
+        processes = chunkers + tokenizers + inferers
+
+        # Daemon: após uma falha as threads podem ficar presas em filas que ninguém mais consome
+        reader = threading.Thread(target=self._read_files, args=(vault_path, files_q, shard), daemon=True)
+        dispatcher = threading.Thread(target=self._dispatch, args=(chunks_q, batches_q, store, collected),
+                                      daemon=True)
+        writer = threading.Thread(target=self._write_vectors, args=(vectors_q, store), daemon=True)
+
+        try:
+            for process in processes:
+                process.start()
+            for thread in (reader, dispatcher, writer):
+                thread.start()
+
+            # Encerramento em cascata: cada estágio só recebe sentinelas depois
+            # que todos os produtores do estágio anterior terminaram
+            self._wait([reader], processes)
+            for _ in chunkers:
+                self._send(files_q, None, processes)
+            self._wait(chunkers, processes)
+            self._send(chunks_q, None, processes)
+            self._wait([dispatcher], processes)
+            for _ in tokenizers:
+                self._send(batches_q, None, processes)
+            self._wait(tokenizers, processes)
+            for _ in inferers:
+                self._send(tokens_q, None, processes)
+            self._wait(inferers, processes)
+            self._send(vectors_q, None, processes)
+            self._wait([writer], processes)
+        except BaseException:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            for process in processes:
+                process.join(POLL_SECONDS)
+            # Dados ainda bufferizados para consumidores mortos travariam a saída do interpretador
+            for q in (files_q, chunks_q, batches_q, tokens_q, vectors_q, stats_q):
+                q.cancel_join_thread()
+            raise
+
+        for _ in processes:
+            self._record(*stats_q.get())
+
+        collected.sort(key=lambda item: (item[0], item[1]))
+        chunks = [chunk for _, _, _, chunk in collected]
+        keys = [key for _, _, key, _ in collected]
+        elapsed = time.time() - started
+        report = {
+            'chunks': len(chunks),
+            'cache_misses': self.misses,
+            'embedded_chunks': self.pending,
+            'batches': self.batches,
+            'tokens': self.tokens,
+            'seconds': elapsed,
+            'stages': self.stage_report(),
+        }
+        return chunks, keys, report
+
+    def stage_report(self):
+        """Throughput por estágio (itens/s por worker ocupado e capacidade total)"""
+        report = {}
+        for stage in STAGES:
+            items, busy = self._stats[stage]
+            workers = self.workers[stage]
+            rate = items / busy if busy > 0 else 0.0
+            report[stage] = {
+                'workers': workers,
+                'items': items,
+                'busy_seconds': round(busy, 3),
+                'per_second': round(rate * workers, 1),
+                'unit': 'files' if stage == 'read' else 'chunks',
+            }
+        return report
+
+
+def log_stage_report(report):
+    """Loga o throughput de cada estágio e o gargalo"""
+    stages = report['stages']
+    for stage, stats in stages.items():
+        logger.info(f"Pipeline {stage}: {stats['per_second']} {stats['unit']}/s "
+                    f"({stats['items']} {stats['unit']}, {stats['workers']} workers)")
+    measured = {stage: stats for stage, stats in stages.items() if stats['unit'] == 'chunks' and stats['items']}
+    if measured:
+        bottleneck = min(measured, key=lambda stage: measured[stage]['per_second'])
+        logger.info(f"Pipeline bottleneck: {bottleneck}")
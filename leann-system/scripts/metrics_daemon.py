@@ -9,10 +9,13 @@ import sys
 import time
 import signal
 import logging
+import threading
 from datetime import datetime
-from prometheus_client import Counter, Histogram, Gauge, start_http_server
+from prometheus_client import Counter, Histogram, start_http_server, REGISTRY
+from prometheus_client.core import GaugeMetricFamily
 import json
 from pathlib import Path
+from vault_catalog import VaultCatalog
 
 # Configuração de logging
 logging.basicConfig(
@@ -34,110 +37,148 @@ llm_processing_errors_total = Counter('llm_processing_errors_total', 'Failed LLM
 email_delivery_success_total = Counter('email_delivery_success_total', 'Successful email deliveries')
 email_delivery_failures_total = Counter('email_delivery_failures_total', 'Failed email deliveries')
 
-# PARA System Metrics
-para_projects_total = Gauge('para_projects_total', 'Number of PARA Projects')
-para_areas_total = Gauge('para_areas_total', 'Number of PARA Areas')
-para_resources_total = Gauge('para_resources_total', 'Number of PARA Resources')
-para_archive_total = Gauge('para_archive_total', 'Number of PARA Archive items')
+# Métricas do vault (PARA/Zettelkasten) calculadas no scrape por VaultMetricsCollector
+MIN_REFRESH_SECONDS = float(os.getenv("VAULT_METRICS_MIN_REFRESH", "60"))  # intervalo mínimo entre varreduras do vault
+MAX_CATEGORY_LABELS = int(os.getenv("ZETTELKASTEN_MAX_CATEGORIES", "20"))  # limite de séries de zettelkasten_concepts_by_category
 
-# Zettelkasten Metrics
-zettelkasten_notes_total = Gauge('zettelkasten_notes_total', 'Total number of Zettelkasten notes')
-zettelkasten_concepts_by_category = Gauge('zettelkasten_concepts_by_category', 'Number of concepts by category', ['category'])
+def bounded_categories(counts, limit=MAX_CATEGORY_LABELS):
+    """Mantém as `limit` categorias com mais notas e soma o restante em `other` (cardinalidade fixa no Prometheus)"""
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    bounded = dict(ranked[:limit])
+    if len(ranked) > limit:
+        bounded['other'] = bounded.get('other', 0) + sum(count for _, count in ranked[limit:])
+    return bounded
 
-# Activity Agent Metrics
-activity_agent_last_execution_timestamp = Gauge('activity_agent_last_execution_timestamp', 'Unix timestamp of last execution')
-activity_agent_execution_duration_seconds = Histogram('activity_agent_execution_duration_seconds', 'Duration of Activity Agent execution')
+class VaultMetricsCollector:
+    """Coletor customizado: métricas do vault calculadas sob demanda no scrape
+    
+    O resultado fica em cache por MIN_REFRESH_SECONDS; scrapes mais frequentes
+    (ou vários Prometheus) reutilizam o último snapshot, e sem scrapes o vault
+    não é varrido. Também publica a duração da própria coleta.
+    """
+    
+    def __init__(self, daemon, min_refresh=MIN_REFRESH_SECONDS):
+        self.daemon = daemon
+        self.min_refresh = min_refresh
+        self.snapshot = None
+        self.lock = threading.Lock()
+    
+    def get_snapshot(self):
+        """Snapshot em cache ou recalculado se mais velho que min_refresh (um scrape por vez recalcula)"""
+        with self.lock:
+            if self.snapshot is None or time.time() - self.snapshot['collected_at'] >= self.min_refresh:
+                try:
+                    self.snapshot = self.daemon.collect_metrics()
+                except Exception as e:
+                    # Mantém o último snapshot válido; o próximo scrape tenta de novo
+                    logger.error(f"Error collecting vault metrics: {e}")
+            return self.snapshot
+    
+    def describe(self):
+        # Sem describe() o registry chamaria collect() (e varreria o vault) no register
+        return list(self._families(None))
+    
+    def collect(self):
+        return self._families(self.get_snapshot())
+    
+    def _families(self, snapshot):
+        families = {
+            'para_projects_total': GaugeMetricFamily('para_projects_total', 'Number of PARA Projects'),
+            'para_areas_total': GaugeMetricFamily('para_areas_total', 'Number of PARA Areas'),
+            'para_resources_total': GaugeMetricFamily('para_resources_total', 'Number of PARA Resources'),
+            'para_archive_total': GaugeMetricFamily('para_archive_total', 'Number of PARA Archive items'),
+        }
+        notes = GaugeMetricFamily('zettelkasten_notes_total', 'Total number of Zettelkasten notes')
+        concepts = GaugeMetricFamily('zettelkasten_concepts_by_category', 'Number of concepts by category',
+                                     labels=['category'])
+        last_execution = GaugeMetricFamily('activity_agent_last_execution_timestamp',
+                                           'Unix timestamp of the last vault metrics collection')
+        duration = GaugeMetricFamily('vault_metrics_collection_duration_seconds',
+                                     'Duration of the last vault metrics collection')
+        age = GaugeMetricFamily('vault_metrics_cache_age_seconds', 'Age of the vault metrics served from cache')
+        
+        if snapshot is not None:
+            for key, value in (snapshot['para'] or {}).items():
+                families[f'para_{key}_total'].add_metric([], value)
+            if snapshot['zettelkasten'] is not None:
+                notes.add_metric([], snapshot['zettelkasten']['notes'])
+                for category, count in snapshot['zettelkasten']['concepts'].items():
+                    concepts.add_metric([category], count)
+            last_execution.add_metric([], snapshot['collected_at'])
+            duration.add_metric([], snapshot['duration'])
+            age.add_metric([], time.time() - snapshot['collected_at'])
+        
+        yield from families.values()
+        yield from (notes, concepts, last_execution, duration, age)
 
 class ActivityAgentMetrics:
     def __init__(self, port=8000):
         self.port = port
         self.obsidian_vault_path = "/var/lib/docker/volumes/docker-compose_obsidian-vaults/_data/MyVault"
         self.running = True
+        self.catalog = VaultCatalog(self.obsidian_vault_path)
         
-    def update_para_metrics(self):
-        """Atualiza métricas do sistema PARA"""
+    def get_para_metrics(self):
+        """Contagens do sistema PARA (None se o vault não tem 01-PARA)"""
         try:
             para_path = Path(self.obsidian_vault_path) / "01-PARA"
             
             if para_path.exists():
-                projects = len(list((para_path / "Projects").glob("*.md"))) if (para_path / "Projects").exists() else 0
-                areas = len(list((para_path / "Areas").glob("*.md"))) if (para_path / "Areas").exists() else 0
-                resources = len(list((para_path / "Resources").glob("*.md"))) if (para_path / "Resources").exists() else 0
-                archive = len(list((para_path / "Archive").glob("*.md"))) if (para_path / "Archive").exists() else 0
-                
-                para_projects_total.set(projects)
-                para_areas_total.set(areas)
-                para_resources_total.set(resources)
-                para_archive_total.set(archive)
+                # Contagens do catálogo do vault (atualizado uma vez por coleta em collect_metrics)
+                projects = self.catalog.folder_stats("01-PARA/Projects")['notes']
+                areas = self.catalog.folder_stats("01-PARA/Areas")['notes']
+                resources = self.catalog.folder_stats("01-PARA/Resources")['notes']
+                archive = self.catalog.folder_stats("01-PARA/Archive")['notes']
                 
                 logger.info(f"PARA Metrics - Projects: {projects}, Areas: {areas}, Resources: {resources}, Archive: {archive}")
+                return {'projects': projects, 'areas': areas, 'resources': resources, 'archive': archive}
             else:
                 logger.warning("PARA directory not found")
                 
         except Exception as e:
             logger.error(f"Error updating PARA metrics: {e}")
+        return None
     
-    def update_zettelkasten_metrics(self):
-        """Atualiza métricas do Zettelkasten"""
+    def get_zettelkasten_metrics(self):
+        """Notas e conceitos por categoria (frontmatter/tags) do Zettelkasten (None se não existe)"""
         try:
             zk_path = Path(self.obsidian_vault_path) / "02-Zettelkasten"
             
             if zk_path.exists():
-                # Contar notas permanentes
-                permanent_path = zk_path / "Permanent"
-                notes_count = len(list(permanent_path.glob("*.md"))) if permanent_path.exists() else 0
-                zettelkasten_notes_total.set(notes_count)
-                
-                # Simular conceitos por categoria (baseado nos dados da documentação)
-                concepts = {
-                    "Technology": 1,
-                    "Tools": 2, 
-                    "Architecture": 0,
-                    "Process": 0,
-                    "Problem_Solving": 0,
-                    "Security": 0
-                }
+                # Todas as notas do Zettelkasten (Permanent, Daily, Literature, ...)
+                notes_count = self.catalog.folder_stats("02-Zettelkasten", recursive=True)['notes']
                 
-                for category, count in concepts.items():
-                    zettelkasten_concepts_by_category.labels(category=category).set(count)
+                # Categorias do frontmatter; só notas alteradas desde a última coleta são relidas
+                counts, parse_stats = self.catalog.category_counts("02-Zettelkasten")
+                concepts = bounded_categories(counts)
                 
-                logger.info(f"Zettelkasten Metrics - Notes: {notes_count}, Concepts updated")
+                logger.info(f"Zettelkasten Metrics - Notes: {notes_count}, Categories: {len(counts)} "
+                            f"({parse_stats['parsed']} notes parsed)")
+                return {'notes': notes_count, 'concepts': concepts}
             else:
                 logger.warning("Zettelkasten directory not found")
                 
         except Exception as e:
             logger.error(f"Error updating Zettelkasten metrics: {e}")
-    
-    def simulate_activity_metrics(self):
-        """Simula métricas de atividade baseadas nos dados conhecidos"""
-        try:
-            # DESABILITADO: Não incrementar métricas falsas
-            # Métricas de email devem refletir apenas emails reais do BillionMail
-            # activities_processed_total.inc(10)
-            # llm_processing_success_total.inc(3)
-            # email_delivery_success_total.inc(1)  # REMOVIDO - não simular emails falsos
-            
-            # Apenas atualizar timestamp da última execução
-            activity_agent_last_execution_timestamp.set(time.time())
-            
-            # Simular duração da execução
-            with activity_agent_execution_duration_seconds.time():
-                time.sleep(0.1)  # Simular execução mínima
-            
-            logger.info("Activity metrics updated (email simulation disabled)")
-            
-        except Exception as e:
-            logger.error(f"Error updating activity metrics: {e}")
+        return None
     
     def collect_metrics(self):
-        """Coleta todas as métricas"""
+        """Coleta as métricas do vault; chamado pelo VaultMetricsCollector quando o cache expira"""
         logger.info("Starting metrics collection cycle")
+        started = time.time()
         
-        self.update_para_metrics()
-        self.update_zettelkasten_metrics()
-        self.simulate_activity_metrics()
+        # Relista só as pastas do vault alteradas desde a última coleta; as diferenças
+        # (criadas, editadas, movidas, removidas) alimentam o journal lido pelo relatório diário
+        self.catalog.refresh()
+        snapshot = {
+            'para': self.get_para_metrics(),
+            'zettelkasten': self.get_zettelkasten_metrics(),
+            'collected_at': time.time(),
+        }
+        snapshot['duration'] = snapshot['collected_at'] - started
         
-        logger.info("Metrics collection cycle completed")
+        logger.info(f"Metrics collection cycle completed ({snapshot['duration']:.3f}s)")
+        return snapshot
     
     def signal_handler(self, signum, frame):
         """Handler para sinais do sistema"""
@@ -152,24 +193,16 @@ class ActivityAgentMetrics:
         signal.signal(signal.SIGTERM, self.signal_handler)
         signal.signal(signal.SIGINT, self.signal_handler)
         
+        # Métricas do vault calculadas no scrape (com cache), sem varredura periódica
+        REGISTRY.register(VaultMetricsCollector(self))
+        
         # Iniciar servidor HTTP Prometheus
         start_http_server(self.port)
         logger.info(f"Prometheus metrics server started on port {self.port}")
         
-        # Loop principal
+        # Loop principal: o servidor HTTP roda em outra thread, aqui só aguardamos os sinais
         while self.running:
-            try:
-                self.collect_metrics()
-                
-                # Aguardar 60 segundos antes da próxima coleta
-                for _ in range(60):
-                    if not self.running:
-                        break
-                    time.sleep(1)
-                    
-            except Exception as e:
-                logger.error(f"Error in main loop: {e}")
-                time.sleep(30)  # Aguardar antes de tentar novamente
+            time.sleep(1)
         
         logger.info("Activity Agent Metrics Daemon stopped")
 
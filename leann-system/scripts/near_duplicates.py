@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+LEANN Near-Duplicate Detection
+Detecção de chunks quase idênticos (notas diárias de template, seções copiadas)
+com MinHash + LSH; cada grupo vira um único chunk com várias fontes
+
+Uso:
+    python3 near_duplicates.py bench [--notes N] [--copies N]
+"""
+
+import os
+import re
+import sys
+import time
+import zlib
+import random
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+# Configurações
+SHINGLE_SIZE = 5  # palavras por shingle
+NUM_PERM = 128
+LSH_BANDS = 16  # 16 bandas x 8 linhas: candidatos a partir de ~0.7 de similaridade
+DEDUP_THRESHOLD = 0.9  # Jaccard estimado mínimo para colapsar dois chunks
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, MAX_HASH, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, MAX_HASH, size=NUM_PERM, dtype=np.uint64)
+
+
+def shingles(text):
+    """Hashes (uint32) dos shingles de SHINGLE_SIZE palavras do texto normalizado"""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= SHINGLE_SIZE:
+        grams = [" ".join(words)]
+    else:
+        grams = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+    return np.fromiter({zlib.crc32(gram.encode("utf-8")) for gram in grams}, dtype=np.uint64)
+
+
+def minhash(text):
+    """Assinatura MinHash com NUM_PERM permutações (a*x + b) mod p"""
+    values = shingles(text)
+    hashed = (values[:, None] * _PERM_A[None, :] + _PERM_B[None, :]) % MERSENNE_PRIME
+    return (hashed & MAX_HASH).min(axis=0)
+
+
+def find_duplicate_groups(texts, threshold=DEDUP_THRESHOLD, bands=LSH_BANDS):
+    """Grupos (listas de posições, representante primeiro) com similaridade >= threshold
+
+    Cada membro é comparado com o representante do grupo (a menor posição, grupos
+    estáveis entre builds), nunca só com outro membro: A~B e B~C não juntam A e C
+    se A e C estiverem abaixo do threshold.
+    """
+    rows = NUM_PERM // bands
+    signatures = np.stack([minhash(text) for text in texts]) if texts else np.zeros((0, NUM_PERM), np.uint64)
+
+    band_keys = []
+    band_buckets = []
+    for band in range(bands):
+        keys = [signature.tobytes() for signature in signatures[:, band * rows:(band + 1) * rows]]
+        buckets = {}
+        for position, key in enumerate(keys):
+            buckets.setdefault(key, []).append(position)
+        band_keys.append(keys)
+        band_buckets.append(buckets)
+
+    assigned = np.zeros(len(texts), dtype=bool)
+    groups = []
+    for position in range(len(texts)):
+        if assigned[position]:
+            continue
+        candidates = set()
+        for keys, buckets in zip(band_keys, band_buckets):
+            candidates.update(buckets[keys[position]])
+        candidates = np.asarray(sorted(other for other in candidates
+                                       if other > position and not assigned[other]), dtype=np.int64)
+        if not len(candidates):
+            continue
+        similarity = (signatures[candidates] == signatures[position]).mean(axis=1)
+        members = candidates[similarity >= threshold]
+        if len(members):
+            assigned[members] = True
+            groups.append([position] + members.tolist())
+    return groups
+
+
+def collapse_near_duplicates(chunks, keys, threshold=DEDUP_THRESHOLD):
+    """Mantém um chunk por grupo de quase-duplicatas, com as fontes de todo o grupo
+
+    Retorna (chunks, chaves, estatísticas). O representante é o primeiro chunk
+    do grupo na ordem do vault e recebe `sources` e `duplicates` nos metadados;
+    quando o grupo cruza notas, `source_frontmatter` guarda o frontmatter de cada
+    fonte (tags e filtros por nota não herdam os do representante).
+    """
+    started = time.time()
+    groups = find_duplicate_groups([chunk['text'] for chunk in chunks], threshold)
+    dropped = set()
+    for members in groups:
+        representative = chunks[members[0]]
+        sources = []
+        source_frontmatter = {}
+        for position in members:
+            metadata = chunks[position]['metadata']
+            source = metadata.get('source')
+            if source and source not in sources:
+                sources.append(source)
+                source_frontmatter[source] = metadata.get('frontmatter') or {}
+        representative['metadata'] = {**representative['metadata'], 'sources': sources,
+                                      'duplicates': len(members) - 1}
+        if len(sources) > 1:
+            representative['metadata']['source_frontmatter'] = source_frontmatter
+        dropped.update(members[1:])
+
+    kept = [position for position in range(len(chunks)) if position not in dropped]
+    stats = {
+        'chunks_before': len(chunks),
+        'chunks_after': len(kept),
+        'groups': len(groups),
+        'ratio': len(dropped) / len(chunks) if chunks else 0.0,
+        'seconds': time.time() - started,
+    }
+    return [chunks[i] for i in kept], [keys[i] for i in kept], stats
+
+
+def bench(notes, copies):
+    from vault_chunker import write_synthetic_vault, iter_vault_chunks
+
+    vault_path = tempfile.mkdtemp(prefix="leann-dedup-bench-")
+    try:
+        write_synthetic_vault(vault_path, notes)
+        # Notas diárias de template: mesma estrutura com pequenas variações
+        rng = random.Random(3)
+        template = "\n\n".join(
+            f"## {section}\n\n- [ ] Revisar inbox\n- [ ] Planejar o dia\n- [ ] Atualizar projetos ativos\n"
+            f"Energia: alta. Foco: trabalho profundo pela manhã e reuniões à tarde." for section in
+            ("Manhã", "Tarde", "Noite")
+        )
+        os.makedirs(os.path.join(vault_path, "daily"), exist_ok=True)
+        for day in range(copies):
+            with open(os.path.join(vault_path, "daily", f"2025-{day:04d}.md"), 'w', encoding='utf-8') as f:
+                f.write(f"# Diário {day}\n\n{template}\n\nNota do dia: {rng.choice(['ok', 'cansado', 'produtivo'])}.\n")
+
+        chunks = list(iter_vault_chunks(vault_path))
+        keys = [chunk['id'] for chunk in chunks]
+        started = time.perf_counter()
+        kept, _, stats = collapse_near_duplicates(chunks, keys)
+        elapsed = time.perf_counter() - started
+        print(f"Chunks: {stats['chunks_before']} -> {stats['chunks_after']} "
+              f"({stats['ratio']:.1%} removidos, {stats['groups']} grupos)")
+        print(f"Tempo: {elapsed:.2f}s ({stats['chunks_before'] / elapsed:,.0f} chunks/s)")
+    finally:
+        shutil.rmtree(vault_path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detecção de chunks quase duplicados")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench_parser = subparsers.add_parser("bench", help="Dedup em um vault sintético com notas de template")
+    bench_parser.add_argument("--notes", type=int, default=2000)
+    bench_parser.add_argument("--copies", type=int, default=500)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        bench(args.notes, args.copies)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
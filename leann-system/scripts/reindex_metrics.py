@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+LEANN Reindex Metrics
+Métricas Prometheus do pipeline de reindexação (scan, build por fase, embeddings,
+tamanho do índice e último build bem-sucedido)
+
+Exposição via HTTP (REINDEX_METRICS_PORT) e/ou arquivo para o textfile collector
+do node-exporter (REINDEX_METRICS_TEXTFILE).
+"""
+
+import logging
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, start_http_server, write_to_textfile
+
+logger = logging.getLogger(__name__)
+
+BUILD_BUCKETS = (30, 60, 120, 300, 600, 900, 1800, 3600, 7200)
+SCAN_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 120)
+
+
+class ReindexMetrics:
+    """Registro dedicado com as métricas de um daemon de reindexação"""
+
+    def __init__(self, port=None, textfile=None):
+        self.port = port
+        self.textfile = textfile
+        self.registry = CollectorRegistry()
+        labels = ['index']
+
+        self.scan_duration = Histogram('leann_reindex_scan_duration_seconds', 'Duration of vault scans',
+                                       labels, buckets=SCAN_BUCKETS, registry=self.registry)
+        self.files_scanned = Gauge('leann_reindex_files_scanned', 'Markdown files found by the last scan',
+                                   labels, registry=self.registry)
+        self.changed_files = Gauge('leann_reindex_changed_files', 'Files changed since the last successful build',
+                                   labels, registry=self.registry)
+        self.build_duration = Histogram('leann_reindex_build_duration_seconds', 'Total duration of index builds',
+                                        labels, buckets=BUILD_BUCKETS, registry=self.registry)
+        self.build_phase_duration = Gauge('leann_reindex_build_phase_duration_seconds',
+                                          'Duration of each phase of the last build', labels + ['phase'],
+                                          registry=self.registry)
+        self.builds = Counter('leann_reindex_builds_total', 'Index builds by outcome', labels + ['status'],
+                              registry=self.registry)
+        self.chunks_embedded = Counter('leann_reindex_chunks_embedded_total', 'Chunks sent to the embedding model',
+                                       labels, registry=self.registry)
+        self.chunks_total = Gauge('leann_reindex_chunks', 'Chunks in the last built index', labels,
+                                  registry=self.registry)
+        self.embedding_tokens = Counter('leann_reindex_embedding_tokens_total', 'Tokens sent for embedding',
+                                        labels, registry=self.registry)
+        self.cache_hit_ratio = Gauge('leann_reindex_embedding_cache_hit_ratio',
+                                     'Embedding store hit ratio of the last build', labels, registry=self.registry)
+        self.index_size = Gauge('leann_reindex_index_size_bytes', 'Size on disk of the active index generation',
+                                labels, registry=self.registry)
+        self.generation = Gauge('leann_reindex_index_generation', 'Active blue/green generation', labels,
+                                registry=self.registry)
+        self.last_success = Gauge('leann_reindex_last_success_timestamp_seconds',
+                                  'Unix timestamp of the last successful build', labels, registry=self.registry)
+        self.dedup_ratio = Gauge('leann_reindex_dedup_ratio', 'Share of chunks collapsed as near-duplicates',
+                                 labels, registry=self.registry)
+        self.queue_depth = Gauge('leann_reindex_queue_depth', 'Builds waiting in the shared work queue',
+                                 registry=self.registry)
+        self.queue_wait = Histogram('leann_reindex_queue_wait_seconds', 'Time a build waited for a worker',
+                                    labels, buckets=SCAN_BUCKETS + (300, 600, 1800, 3600), registry=self.registry)
+
+    def start(self):
+        if self.port:
+            start_http_server(self.port, registry=self.registry)
+            logger.info(f"Reindex metrics exposed on port {self.port}")
+
+    def flush(self):
+        """Grava o arquivo do textfile collector (escrita atômica do prometheus_client)"""
+        if not self.textfile:
+            return
+        try:
+            write_to_textfile(self.textfile, self.registry)
+        except Exception as e:
+            logger.warning(f"Failed to write metrics textfile {self.textfile}: {e}")
+
+    def seed_last_success(self, index, timestamp):
+        """Restaura o último build bem-sucedido após um restart do daemon"""
+        if timestamp:
+            self.last_success.labels(index=index).set(timestamp)
+            self.flush()
+
+    def forget_index(self, index):
+        """Remove as séries de um índice que deixou de existir (ex.: shard sem notas)"""
+        metrics = [self.scan_duration, self.files_scanned, self.changed_files, self.build_duration,
+                   self.build_phase_duration, self.builds, self.chunks_embedded, self.chunks_total,
+                   self.embedding_tokens, self.cache_hit_ratio, self.index_size, self.generation,
+                   self.last_success, self.dedup_ratio, self.queue_wait]
+        for metric in metrics:
+            labelnames = metric._labelnames
+            # As séries com mais rótulos (phase, status) são descobertas pelas próprias amostras
+            labelsets = {tuple(sample.labels[name] for name in labelnames)
+                         for family in metric.collect() for sample in family.samples
+                         if sample.labels.get('index') == index}
+            for labelvalues in labelsets:
+                metric.remove(*labelvalues)
+        self.flush()
+
+    def observe_scan(self, index, seconds, files, changed):
+        self.scan_duration.labels(index=index).observe(seconds)
+        self.files_scanned.labels(index=index).set(files)
+        self.changed_files.labels(index=index).set(changed)
+        self.flush()
+
+    def observe_queue(self, depth, index=None, waited=None):
+        self.queue_depth.set(depth)
+        if index is not None and waited is not None:
+            self.queue_wait.labels(index=index).observe(waited)
+        self.flush()
+
+    def observe_build(self, index, report, finished_at):
+        """Registra um build; report é o relatório JSON do builder (None em caso de falha)"""
+        if not report:
+            self.builds.labels(index=index, status='failure').inc()
+            self.flush()
+            return
+
+        self.builds.labels(index=index, status='success').inc()
+        timings = report.get('timings', {})
+        if 'total' in timings:
+            self.build_duration.labels(index=index).observe(timings['total'])
+        for phase, seconds in timings.items():
+            self.build_phase_duration.labels(index=index, phase=phase).set(seconds)
+        self.chunks_embedded.labels(index=index).inc(report.get('embedded_chunks', 0))
+        self.embedding_tokens.labels(index=index).inc(report.get('embedding_tokens', 0))
+        self.chunks_total.labels(index=index).set(report.get('chunks', 0))
+        self.cache_hit_ratio.labels(index=index).set(report.get('hit_ratio', 0))
+        self.dedup_ratio.labels(index=index).set(report.get('dedup_ratio', 0))
+        if report.get('index_size_bytes') is not None:
+            self.index_size.labels(index=index).set(report['index_size_bytes'])
+        if report.get('generation') is not None:
+            self.generation.labels(index=index).set(report['generation'])
+        self.last_success.labels(index=index).set(finished_at)
+        self.flush()
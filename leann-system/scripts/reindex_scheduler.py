@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+LEANN Reindex Scheduler
+Agenda reindexações com debounce (janela de silêncio), latência máxima e
+intervalo mínimo entre builds, coalescendo mudanças pendentes no próximo build
+"""
+
+import time
+from datetime import datetime
+
+IDLE = "idle"
+PENDING = "pending"
+BUILDING = "building"
+COOLDOWN = "cooldown"
+
+
+class ReindexScheduler:
+    """Máquina de estados idle -> pending -> building -> cooldown
+
+    Cada rajada de edições reinicia a janela de silêncio, mas nenhuma mudança
+    espera mais que `max_latency` desde a primeira edição pendente (respeitando
+    sempre o cooldown de `min_interval` após um build).
+    """
+
+    def __init__(self, quiet_window, max_latency, min_interval):
+        self.quiet_window = quiet_window
+        self.max_latency = max_latency
+        self.min_interval = min_interval
+        self.pending_token = None
+        self.pending_reason = None
+        self.first_change_at = None
+        self.last_change_at = None
+        self.building_since = None
+        self.last_build_at = None
+        self.cooldown_until = 0.0
+        self._building_reason = None
+        self._building_first_change = None
+
+    def notify_change(self, token, reason, now=None):
+        """Registra o estado atual do vault como pendente; só tokens novos reiniciam o debounce"""
+        now = now if now is not None else time.time()
+        if token == self.pending_token:
+            return
+        self.pending_token = token
+        self.pending_reason = reason
+        self.last_change_at = now
+        if self.first_change_at is None:
+            self.first_change_at = now
+
+    def clear_pending(self):
+        """Descarta mudanças pendentes (ex.: o vault voltou ao estado indexado)"""
+        self.pending_token = None
+        self.pending_reason = None
+        self.first_change_at = None
+        self.last_change_at = None
+
+    def next_run_at(self):
+        """Horário planejado do próximo build, ou None se não há mudanças pendentes"""
+        if self.pending_token is None or self.building_since is not None:
+            return None
+        debounced = min(self.last_change_at + self.quiet_window, self.first_change_at + self.max_latency)
+        return max(debounced, self.cooldown_until)
+
+    def state(self, now=None):
+        now = now if now is not None else time.time()
+        if self.building_since is not None:
+            return BUILDING
+        if now < self.cooldown_until:
+            return COOLDOWN
+        if self.pending_token is not None:
+            return PENDING
+        return IDLE
+
+    def due(self, now=None):
+        now = now if now is not None else time.time()
+        next_run = self.next_run_at()
+        return next_run is not None and now >= next_run
+
+    def start_build(self, now=None):
+        """Inicia o build coalescendo todas as mudanças pendentes; retorna o token construído"""
+        self.building_since = now if now is not None else time.time()
+        token = self.pending_token
+        self._building_reason = self.pending_reason
+        self._building_first_change = self.first_change_at
+        self.clear_pending()
+        return token
+
+    def finish_build(self, success, token=None, now=None):
+        now = now if now is not None else time.time()
+        self.building_since = None
+        if success:
+            self.last_build_at = now
+            self.cooldown_until = now + self.min_interval
+        elif self.pending_token is None and token is not None:
+            # Build falhou: mantém a mudança pendente e tenta de novo após a janela de silêncio
+            self.pending_token = token
+            self.pending_reason = self._building_reason
+            self.first_change_at = self._building_first_change
+            self.last_change_at = now
+            self.cooldown_until = now + self.quiet_window
+
+    def seconds_until_wake(self, check_interval, now=None):
+        """Tempo até a próxima verificação do vault ou o próximo build planejado"""
+        now = now if now is not None else time.time()
+        next_run = self.next_run_at()
+        if next_run is None:
+            return check_interval
+        return max(0.0, min(check_interval, next_run - now))
+
+    def to_dict(self, now=None):
+        now = now if now is not None else time.time()
+        return {
+            'state': self.state(now),
+            'pending_token': self.pending_token,
+            'pending_reason': self.pending_reason,
+            'first_change_at': self.first_change_at,
+            'last_change_at': self.last_change_at,
+            'building_since': self.building_since,
+            'last_build_at': self.last_build_at,
+            'cooldown_until': self.cooldown_until,
+            'next_run_at': self.next_run_at(),
+            'updated_at': now,
+        }
+
+    @classmethod
+    def from_dict(cls, data, quiet_window, max_latency, min_interval):
+        scheduler = cls(quiet_window, max_latency, min_interval)
+        for field in ('pending_token', 'pending_reason', 'first_change_at', 'last_change_at',
+                      'building_since', 'last_build_at'):
+            setattr(scheduler, field, (data or {}).get(field))
+        scheduler.cooldown_until = (data or {}).get('cooldown_until') or 0.0
+        return scheduler
+
+
+def describe(data, quiet_window, max_latency, min_interval):
+    """Linhas de status legíveis a partir do estado persistido do scheduler"""
+    scheduler = ReindexScheduler.from_dict(data, quiet_window, max_latency, min_interval)
+    lines = [f"Scheduler state: {scheduler.state()}"]
+    if scheduler.pending_reason:
+        lines.append(f"Pending reason: {scheduler.pending_reason}")
+    if scheduler.building_since:
+        lines.append(f"Building since: {datetime.fromtimestamp(scheduler.building_since).strftime('%Y-%m-%d %H:%M:%S')}")
+    next_run = scheduler.next_run_at()
+    if next_run:
+        lines.append(f"Next planned run: {datetime.fromtimestamp(next_run).strftime('%Y-%m-%d %H:%M:%S')}")
+    elif scheduler.cooldown_until > time.time():
+        lines.append(f"Cooldown until: {datetime.fromtimestamp(scheduler.cooldown_until).strftime('%Y-%m-%d %H:%M:%S')}")
+    return lines
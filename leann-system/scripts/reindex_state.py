@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+LEANN Reindex State
+Estado durável da reindexação em SQLite (modo WAL): metadados dos daemons,
+manifesto por arquivo, histórico de builds com tempos por fase e o índice do
+cache de embeddings
+
+Uso:
+    python3 reindex_state.py builds [índice] [limite]
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+
+# Configurações
+STATE_DB = os.getenv("LEANN_STATE_DB", "/var/lib/leann/reindex-state.db")
+BUSY_TIMEOUT_MS = 10000
+BATCH_SIZE = 1000  # linhas por executemany
+SCHEMA_VERSION = 2
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS daemon_metadata (
+    daemon TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (daemon, key)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS manifest (
+    index_name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    PRIMARY KEY (index_name, path)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS builds (
+    id INTEGER PRIMARY KEY,
+    index_name TEXT NOT NULL,
+    daemon TEXT,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    status TEXT NOT NULL,
+    generation INTEGER,
+    embedding_mode TEXT,
+    chunks INTEGER,
+    embedded_chunks INTEGER,
+    hit_ratio REAL,
+    changed_files INTEGER,
+    report TEXT
+);
+CREATE INDEX IF NOT EXISTS builds_by_index ON builds (index_name, finished_at);
+
+CREATE TABLE IF NOT EXISTS build_phases (
+    build_id INTEGER NOT NULL REFERENCES builds (id) ON DELETE CASCADE,
+    phase TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    PRIMARY KEY (build_id, phase)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS embedding_keys (
+    model TEXT NOT NULL,
+    key TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    PRIMARY KEY (model, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS embedding_keys_by_row ON embedding_keys (model, row);
+
+CREATE TABLE IF NOT EXISTS shards (
+    index_name TEXT NOT NULL,
+    shard TEXT NOT NULL,
+    shard_index TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (index_name, shard)
+) WITHOUT ROWID;
+"""
+
+
+def connect(path=STATE_DB, readonly=False):
+    """Abre o banco em modo WAL; leitores (status, wrapper HTTP) não bloqueiam o daemon"""
+    if readonly:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=BUSY_TIMEOUT_MS / 1000)
+    else:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            conn.executescript(SCHEMA)
+            conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _batches(rows, size=BATCH_SIZE):
+    rows = list(rows)
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+class ReindexState:
+    """Estado de um daemon de reindexação; cada escrita é uma transação"""
+
+    def __init__(self, daemon, path=STATE_DB, legacy_metadata_file=None, index_name=None):
+        self.daemon = daemon
+        self.path = path
+        self.conn = connect(path)
+        if legacy_metadata_file:
+            self._migrate_legacy(legacy_metadata_file, index_name)
+
+    @contextmanager
+    def transaction(self):
+        """BEGIN IMMEDIATE ... COMMIT, com rollback em caso de erro"""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def close(self):
+        self.conn.close()
+
+    # Metadados do daemon (substituem o antigo JSON em /tmp)
+
+    def load_metadata(self, defaults=None):
+        metadata = dict(defaults or {})
+        for row in self.conn.execute("SELECT key, value FROM daemon_metadata WHERE daemon = ?", (self.daemon,)):
+            metadata[row['key']] = json.loads(row['value'])
+        return metadata
+
+    def save_metadata(self, metadata):
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO daemon_metadata (daemon, key, value) VALUES (?, ?, ?) "
+                "ON CONFLICT (daemon, key) DO UPDATE SET value = excluded.value",
+                [(self.daemon, key, json.dumps(value)) for key, value in metadata.items()]
+            )
+
+    # Manifesto por arquivo do último build bem-sucedido
+
+    def load_manifest(self, index_name):
+        return {row['path']: row['signature'] for row in
+                self.conn.execute("SELECT path, signature FROM manifest WHERE index_name = ?", (index_name,))}
+
+    def has_manifest(self, index_name):
+        return self.conn.execute("SELECT 1 FROM manifest WHERE index_name = ? LIMIT 1",
+                                 (index_name,)).fetchone() is not None
+
+    def replace_manifest(self, index_name, manifest, previous=None):
+        """Grava o manifesto aplicando só a diferença em relação ao anterior"""
+        previous = self.load_manifest(index_name) if previous is None else previous
+        upserts = [(index_name, path, str(signature)) for path, signature in manifest.items()
+                   if previous.get(path) != str(signature)]
+        removed = [(index_name, path) for path in previous if path not in manifest]
+        with self.transaction() as conn:
+            for batch in _batches(removed):
+                conn.executemany("DELETE FROM manifest WHERE index_name = ? AND path = ?", batch)
+            for batch in _batches(upserts):
+                conn.executemany(
+                    "INSERT INTO manifest (index_name, path, signature) VALUES (?, ?, ?) "
+                    "ON CONFLICT (index_name, path) DO UPDATE SET signature = excluded.signature",
+                    batch
+                )
+        return len(upserts), len(removed)
+
+    # Histórico de builds
+
+    def record_build(self, index_name, started_at, finished_at, report, changed_files=None):
+        """Registra um build (report=None para falhas) com os tempos de cada fase"""
+        report = report or {}
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO builds (index_name, daemon, started_at, finished_at, status, generation, "
+                "embedding_mode, chunks, embedded_chunks, hit_ratio, changed_files, report) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (index_name, self.daemon, started_at, finished_at, 'success' if report else 'failure',
+                 report.get('generation'), report.get('embedding_mode'), report.get('chunks'),
+                 report.get('embedded_chunks'), report.get('hit_ratio'), changed_files,
+                 json.dumps(report) if report else None)
+            )
+            conn.executemany("INSERT INTO build_phases (build_id, phase, seconds) VALUES (?, ?, ?)",
+                             [(cursor.lastrowid, phase, seconds)
+                              for phase, seconds in report.get('timings', {}).items()])
+        return cursor.lastrowid
+
+    # Registro de shards (índice lógico -> índices por pasta de primeiro nível)
+
+    def register_shard(self, index_name, shard, shard_index):
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO shards (index_name, shard, shard_index, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (index_name, shard) DO UPDATE SET shard_index = excluded.shard_index, "
+                "updated_at = excluded.updated_at",
+                (index_name, shard, shard_index, datetime.now().timestamp())
+            )
+
+    def remove_shard(self, index_name, shard):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM shards WHERE index_name = ? AND shard = ?", (index_name, shard))
+
+    def _migrate_legacy(self, metadata_file, index_name):
+        """Importa o JSON legado de /tmp na primeira execução com o banco vazio"""
+        if not os.path.exists(metadata_file) or self.load_metadata():
+            return
+        try:
+            with open(metadata_file, 'r') as f:
+                metadata = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Legacy metadata {metadata_file} ignored: {e}")
+            return
+        manifest = metadata.pop('manifest', None)
+        self.save_metadata(metadata)
+        if manifest and index_name:
+            self.replace_manifest(index_name, manifest, previous={})
+        os.replace(metadata_file, f"{metadata_file}.migrated")
+        logger.info(f"Legacy metadata {metadata_file} migrated to {self.path}")
+
+
+def recent_builds(conn, index_name=None, limit=10):
+    """Últimos builds (mais recentes primeiro) com os tempos por fase"""
+    if index_name:
+        rows = conn.execute("SELECT * FROM builds WHERE index_name = ? ORDER BY finished_at DESC LIMIT ?",
+                            (index_name, limit)).fetchall()
+    else:
+        rows = conn.execute("SELECT * FROM builds ORDER BY finished_at DESC LIMIT ?", (limit,)).fetchall()
+
+    builds = []
+    for row in rows:
+        build = {key: row[key] for key in row.keys() if key != 'report'}
+        build['warnings'] = json.loads(row['report']).get('warnings', []) if row['report'] else []
+        build['timings'] = {phase['phase']: phase['seconds'] for phase in
+                            conn.execute("SELECT phase, seconds FROM build_phases WHERE build_id = ?", (row['id'],))}
+        builds.append(build)
+    return builds
+
+
+def load_shards(conn, index_name):
+    """{shard: índice do shard} de um índice lógico (vazio se não for shardado)"""
+    return {row['shard']: row['shard_index'] for row in
+            conn.execute("SELECT shard, shard_index FROM shards WHERE index_name = ?", (index_name,))}
+
+
+def describe_builds(conn, index_name=None, limit=5):
+    """Linhas de status legíveis do histórico de builds"""
+    lines = []
+    for build in recent_builds(conn, index_name, limit):
+        finished = datetime.fromtimestamp(build['finished_at'] or build['started_at']).strftime('%Y-%m-%d %H:%M:%S')
+        phases = ", ".join(f"{phase} {seconds:.1f}s" for phase, seconds in build['timings'].items())
+        generation = f" gen {build['generation']}" if build['generation'] is not None else ""
+        lines.append(f"{finished} {build['index_name']}{generation} {build['status']}"
+                     + (f" ({phases})" if phases else ""))
+        lines.extend(f"    ⚠️ {warning}" for warning in build['warnings'])
+    return lines
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != "builds":
+        print("Uso: python3 reindex_state.py builds [índice] [limite]")
+        sys.exit(1)
+    if not os.path.exists(STATE_DB):
+        print(f"Banco de estado não encontrado: {STATE_DB}")
+        sys.exit(1)
+
+    index_name = sys.argv[2] if len(sys.argv) > 2 else None
+    limit = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    conn = connect(STATE_DB, readonly=True)
+    for line in describe_builds(conn, index_name, limit):
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+LEANN Related Notes
+Grafo k-NN entre notas (vizinhos mais próximos de cada nota) pré-calculado
+pelo builder a partir de embeddings por nota (média dos chunks da nota)
+
+Os agentes do n8n pedem "notas relacionadas" a uma nota inteira; com o grafo
+pronto a resposta é uma consulta O(1) por caminho, sem embedar a nota de novo.
+A cada build só as notas alteradas (e as que tinham uma delas como vizinha)
+são recalculadas; as demais apenas fundem seus vizinhos com as notas novas.
+Índices com shards têm um grafo por shard; os vetores das notas guardados no
+grafo permitem completar os vizinhos com as notas dos outros shards na consulta.
+
+Arquivo <geração>/related.graph, gravado no shadow a partir do grafo da geração
+ativa (um rollback volta vetores e grafo do mesmo build):
+    magic "LRNG", versão (uint32), tamanho do cabeçalho (uint64)
+    cabeçalho JSON   notas, fingerprints, k, dimensão, modelo
+    neighbors.u32    posições dos vizinhos (notas x k, NO_NEIGHBOR = vazio)
+    scores.f32       similaridade de cosseno de cada vizinho (notas x k)
+    vectors.f32      vetor normalizado de cada nota (notas x dimensão)
+
+Uso:
+    python3 related_notes.py related <índice> <nota> [--k K]
+    python3 related_notes.py stats <índice>
+    python3 related_notes.py bench [--notes N] [--dim D] [--changed F]
+"""
+
+import os
+import sys
+import json
+import time
+import struct
+import hashlib
+import argparse
+import logging
+
+import numpy as np
+
+from index_generations import LEANN_INDEXES_DIR
+
+# Configurações
+RELATED_DIR = os.getenv("LEANN_RELATED_DIR", "/var/lib/leann/related")  # legado: grafos fora das gerações
+GRAPH_FILENAME = "related.graph"
+RELATED_K = int(os.getenv("LEANN_RELATED_K", "10"))  # vizinhos guardados por nota
+FULL_REBUILD_RATIO = 0.5  # acima dessa fração de notas alteradas recalcula tudo
+BLOCK_ROWS = 2048  # notas comparadas por vez (bloco x notas em float32)
+NO_NEIGHBOR = np.iinfo(np.uint32).max
+GRAPH_MAGIC = b"LRNG"
+GRAPH_VERSION = 2  # v1: sem vectors.f32
+
+logger = logging.getLogger(__name__)
+
+_PREAMBLE = struct.Struct("<4sIQ")
+
+
+def graph_path(index_name, indexes_dir=LEANN_INDEXES_DIR, related_dir=RELATED_DIR):
+    """Grafo da geração ativa; índices ainda sem ele usam o grafo legado"""
+    path = os.path.join(indexes_dir, index_name, GRAPH_FILENAME)
+    return path if os.path.exists(path) else os.path.join(related_dir, f"{index_name}.graph")
+
+
+def note_vectors(chunks, keys, embeddings):
+    """(notas, fingerprints, vetores) com a média normalizada dos chunks de cada nota
+
+    O fingerprint é o hash dos conteúdos dos chunks da nota: muda exatamente
+    quando o vetor da nota muda. Chunks colapsados pelo dedup contam para
+    todas as suas fontes.
+    """
+    members = {}
+    for row, chunk in enumerate(chunks):
+        metadata = chunk['metadata']
+        for source in metadata.get('sources') or [metadata.get('source')]:
+            if source is not None:
+                members.setdefault(source, []).append(row)
+
+    sources = sorted(members)
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    vectors = np.empty((len(sources), embeddings.shape[1]), dtype=np.float32)
+    fingerprints = []
+    for position, source in enumerate(sources):
+        rows = members[source]
+        vectors[position] = embeddings[rows].mean(axis=0)
+        fingerprints.append(hashlib.sha1("\n".join(sorted(keys[row] for row in rows)).encode()).hexdigest()[:16])
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return sources, fingerprints, vectors / np.maximum(norms, 1e-12)
+
+
+def _top_k(scores, ids, k):
+    """Top-k de cada linha de (scores, ids), ordenado por score decrescente"""
+    if scores.shape[1] > k:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, part, axis=1)
+        ids = np.take_along_axis(ids, part, axis=1)
+    order = np.argsort(-scores, axis=1, kind='stable')
+    scores = np.take_along_axis(scores, order, axis=1)
+    ids = np.take_along_axis(ids, order, axis=1)
+    if scores.shape[1] < k:
+        pad = k - scores.shape[1]
+        scores = np.pad(scores, ((0, 0), (0, pad)), constant_values=-np.inf)
+        ids = np.pad(ids, ((0, 0), (0, pad)), constant_values=NO_NEIGHBOR)
+    ids = np.where(np.isneginf(scores), NO_NEIGHBOR, ids)
+    return ids.astype(np.uint32), scores.astype(np.float32)
+
+
+def nearest_notes(vectors, positions, k):
+    """Vizinhos exatos (sem a própria nota) das notas em `positions` contra todas as notas"""
+    positions = np.asarray(positions, dtype=np.int64)
+    neighbors = np.empty((len(positions), k), dtype=np.uint32)
+    scores = np.empty((len(positions), k), dtype=np.float32)
+    all_ids = np.arange(len(vectors), dtype=np.int64)
+    for start in range(0, len(positions), BLOCK_ROWS):
+        block = positions[start:start + BLOCK_ROWS]
+        sims = vectors[block] @ vectors.T
+        sims[np.arange(len(block)), block] = -np.inf
+        ids = np.broadcast_to(all_ids, sims.shape)
+        neighbors[start:start + len(block)], scores[start:start + len(block)] = _top_k(sims, ids, k)
+    return neighbors, scores
+
+
+def write_graph(path, header, neighbors, scores, vectors):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    payload = json.dumps(header).encode()
+    payload += b" " * (-(len(payload) + _PREAMBLE.size) % 8)  # arrays alinhados para o mmap
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(_PREAMBLE.pack(GRAPH_MAGIC, GRAPH_VERSION, len(payload)))
+        f.write(payload)
+        f.write(np.ascontiguousarray(neighbors, dtype=np.uint32).tobytes())
+        f.write(np.ascontiguousarray(scores, dtype=np.float32).tobytes())
+        f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class RelatedGraph:
+    """Leitura somente leitura (mmap) do grafo de notas relacionadas de um índice"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version, header_size = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+            if magic != GRAPH_MAGIC or version not in (1, GRAPH_VERSION):
+                raise ValueError(f"Grafo de notas relacionadas inválido: {path}")
+            self.header = json.loads(f.read(header_size))
+        self.sources = self.header['sources']
+        self.k = self.header['k']
+        self.positions = {source: position for position, source in enumerate(self.sources)}
+        offset = _PREAMBLE.size + header_size
+        shape = (len(self.sources), self.k)
+        self.vectors = None
+        if self.sources:
+            self.neighbors = np.memmap(path, dtype=np.uint32, mode='r', offset=offset, shape=shape)
+            self.scores = np.memmap(path, dtype=np.float32, mode='r', offset=offset + self.neighbors.nbytes,
+                                    shape=shape)
+            if version >= 2:
+                self.vectors = np.memmap(path, dtype=np.float32, mode='r',
+                                         offset=offset + self.neighbors.nbytes + self.scores.nbytes,
+                                         shape=(len(self.sources), self.header['dim']))
+        else:
+            self.neighbors = np.zeros(shape, dtype=np.uint32)
+            self.scores = np.zeros(shape, dtype=np.float32)
+
+    def related(self, source, k=None):
+        """Notas mais próximas de `source` (KeyError se a nota não está no índice)"""
+        position = self.positions[source]
+        limit = min(k or self.k, self.k)
+        return [{'source': self.sources[neighbor], 'score': float(score)}
+                for neighbor, score in zip(self.neighbors[position][:limit], self.scores[position][:limit])
+                if neighbor != NO_NEIGHBOR]
+
+    def nearest(self, vector, k):
+        """Notas deste grafo mais próximas de um vetor de nota (requer grafo v2)"""
+        if self.vectors is None or not len(self.sources):
+            return []
+        sims = np.asarray(self.vectors @ np.asarray(vector, dtype=np.float32))
+        top = np.argsort(-sims, kind='stable')[:k]
+        return [{'source': self.sources[position], 'score': float(sims[position])} for position in top]
+
+    def stats(self):
+        return {'notes': len(self.sources), 'k': self.k, 'embedding_model': self.header.get('embedding_model'),
+                'updated_at': self.header.get('created_at'), 'size_bytes': os.path.getsize(self.path),
+                'last_update': self.header.get('stats')}
+
+
+def related_across(graphs, source, k=None):
+    """Notas relacionadas a `source` no conjunto dos grafos dos shards de um índice
+
+    Os vizinhos do próprio shard vêm do grafo pré-calculado; os dos demais
+    shards são calculados na hora contra os vetores de nota guardados em cada
+    grafo. KeyError se a nota não está em nenhum grafo.
+    """
+    home = next((graph for graph in graphs if source in graph.positions), None)
+    if home is None:
+        raise KeyError(source)
+    limit = min(k or home.k, home.k)
+    related = home.related(source, limit)
+    if home.vectors is not None:
+        vector = home.vectors[home.positions[source]]
+        for graph in graphs:
+            if graph is not home:
+                related += graph.nearest(vector, limit)
+    related.sort(key=lambda neighbor: neighbor['score'], reverse=True)
+    return related[:limit]
+
+
+def _load_previous(path, embedding_model, dim, k):
+    """Grafo anterior reaproveitável (mesmo modelo, dimensão e k) ou None"""
+    if not os.path.exists(path):
+        return None
+    try:
+        graph = RelatedGraph(path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Grafo anterior ignorado: {e}")
+        return None
+    if graph.vectors is None and graph.sources:
+        return None  # grafo v1: regravado por completo para incluir os vetores
+    if (graph.header.get('embedding_model'), graph.header.get('dim'), graph.k) != (embedding_model, dim, k):
+        return None
+    return graph
+
+
+def compute_graph(sources, fingerprints, vectors, k, previous=None):
+    """Vizinhos de todas as notas, reaproveitando o grafo anterior quando possível
+
+    Uma nota inalterada cujos vizinhos também não mudaram mantém a lista
+    antiga (os scores entre notas inalteradas continuam válidos) e só a funde
+    com as notas alteradas/novas. Notas alteradas e notas que perderam um
+    vizinho (removido ou alterado) são recalculadas contra todas as notas.
+    """
+    count = len(sources)
+    stats = {'notes': count, 'full': True, 'recomputed': count, 'merged': 0, 'removed': 0}
+    if previous is None or count == 0:
+        neighbors, scores = nearest_notes(vectors, np.arange(count), k)
+        return neighbors, scores, stats
+
+    old_fingerprints = previous.header['fingerprints']
+    old_to_new = np.full(len(previous.sources) + 1, -1, dtype=np.int64)  # última posição: NO_NEIGHBOR
+    changed = []
+    for position, source in enumerate(sources):
+        old = previous.positions.get(source)
+        if old is None or old_fingerprints[old] != fingerprints[position]:
+            changed.append(position)
+        else:
+            old_to_new[old] = position
+    unchanged_old = np.flatnonzero(old_to_new[:-1] >= 0)
+    current = set(sources)
+    stats['removed'] = sum(1 for source in previous.sources if source not in current)
+    if len(changed) + stats['removed'] > FULL_REBUILD_RATIO * count:
+        neighbors, scores = nearest_notes(vectors, np.arange(count), k)
+        return neighbors, scores, stats
+
+    # Vizinhos antigos das notas inalteradas, em posições novas (-1: vizinho removido/alterado)
+    old_neighbors = np.asarray(previous.neighbors[unchanged_old]).astype(np.int64)
+    old_neighbors[old_neighbors == NO_NEIGHBOR] = len(previous.sources)
+    mapped = old_to_new[old_neighbors]
+    old_scores = np.asarray(previous.scores[unchanged_old])
+    present = np.asarray(previous.neighbors[unchanged_old]) != NO_NEIGHBOR
+    dirty = (present & (mapped < 0)).any(axis=1)
+    clean_rows = old_to_new[unchanged_old[~dirty]]
+    recompute = np.concatenate([np.asarray(changed, dtype=np.int64), old_to_new[unchanged_old[dirty]]])
+
+    neighbors = np.empty((count, k), dtype=np.uint32)
+    scores = np.empty((count, k), dtype=np.float32)
+    if len(clean_rows):
+        kept_ids = np.where(mapped[~dirty] < 0, NO_NEIGHBOR, mapped[~dirty])
+        kept_scores = np.where(present[~dirty], old_scores[~dirty], -np.inf).astype(np.float32)
+        changed_ids = np.asarray(changed, dtype=np.int64)
+        for start in range(0, len(clean_rows), BLOCK_ROWS):
+            block = slice(start, start + BLOCK_ROWS)
+            rows = clean_rows[block]
+            candidate_scores = np.concatenate([kept_scores[block], vectors[rows] @ vectors[changed_ids].T], axis=1)
+            candidate_ids = np.concatenate([kept_ids[block],
+                                            np.broadcast_to(changed_ids, (len(rows), len(changed_ids)))], axis=1)
+            neighbors[rows], scores[rows] = _top_k(candidate_scores, candidate_ids, k)
+    if len(recompute):
+        neighbors[recompute], scores[recompute] = nearest_notes(vectors, recompute, k)
+    stats.update({'full': False, 'recomputed': int(len(recompute)), 'merged': int(len(clean_rows))})
+    return neighbors, scores, stats
+
+
+def update_graph(path, chunks, keys, embeddings, embedding_model, previous_path=None, k=RELATED_K):
+    """Grava em `path` o grafo de notas relacionadas de um build, reaproveitando `previous_path`"""
+    started = time.time()
+    sources, fingerprints, vectors = note_vectors(chunks, keys, embeddings)
+    previous = _load_previous(previous_path, embedding_model, int(vectors.shape[1]), k) if previous_path else None
+    neighbors, scores, stats = compute_graph(sources, fingerprints, vectors, k, previous)
+    stats['seconds'] = time.time() - started
+    header = {
+        'sources': sources,
+        'fingerprints': fingerprints,
+        'k': k,
+        'dim': int(vectors.shape[1]),
+        'embedding_model': embedding_model,
+        'created_at': time.time(),
+        'stats': stats,
+    }
+    write_graph(path, header, neighbors, scores, vectors)
+    return stats
+
+
+def bench(notes, dim, changed_fraction, k=RELATED_K, seed=0):
+    """Atualização incremental contra recálculo completo em notas sintéticas"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(8, notes // 200), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), notes)] + 0.8 * rng.standard_normal((notes, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    sources = [f"note-{i:06d}.md" for i in range(notes)]
+    fingerprints = [f"v0-{i}" for i in range(notes)]
+
+    started = time.perf_counter()
+    neighbors, scores, _ = compute_graph(sources, fingerprints, vectors, k)
+    full_seconds = time.perf_counter() - started
+
+    class _Previous:
+        header = {'fingerprints': fingerprints}
+    _Previous.sources = sources
+    _Previous.positions = {source: i for i, source in enumerate(sources)}
+    _Previous.k = k
+    _Previous.neighbors = neighbors
+    _Previous.scores = scores
+
+    # Altera uma fração das notas e remove algumas
+    edited = rng.choice(notes, max(1, int(notes * changed_fraction)), replace=False)
+    vectors = vectors.copy()
+    vectors[edited] = vectors[edited] + 0.5 * rng.standard_normal((len(edited), dim)).astype(np.float32)
+    vectors[edited] /= np.linalg.norm(vectors[edited], axis=1, keepdims=True)
+    new_fingerprints = list(fingerprints)
+    for i in edited:
+        new_fingerprints[i] = f"v1-{i}"
+    keep = np.ones(notes, dtype=bool)
+    keep[rng.choice(notes, max(1, notes // 1000), replace=False)] = False
+    new_sources = [s for s, kept in zip(sources, keep) if kept]
+    new_fingerprints = [f for f, kept in zip(new_fingerprints, keep) if kept]
+    vectors = vectors[keep]
+
+    started = time.perf_counter()
+    incremental, incremental_scores, stats = compute_graph(new_sources, new_fingerprints, vectors, k, _Previous)
+    incremental_seconds = time.perf_counter() - started
+    exact, exact_scores, _ = compute_graph(new_sources, new_fingerprints, vectors, k)
+    agreement = np.mean(np.isclose(incremental_scores, exact_scores, atol=1e-5))
+
+    print(f"Notas: {notes} x {dim}, k={k}, {len(edited)} alteradas, {notes - len(new_sources)} removidas")
+    print(f"Grafo completo:      {full_seconds * 1000:.0f} ms")
+    print(f"Incremental:         {incremental_seconds * 1000:.0f} ms "
+          f"({stats['recomputed']} recalculadas, {stats['merged']} fundidas)")
+    print(f"Scores iguais ao recálculo completo: {agreement:.2%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grafo de notas relacionadas (k-NN por nota)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    related_parser = subparsers.add_parser("related", help="Notas relacionadas a uma nota")
+    related_parser.add_argument("index")
+    related_parser.add_argument("note", help="Caminho da nota relativo ao vault")
+    related_parser.add_argument("--k", type=int)
+    stats_parser = subparsers.add_parser("stats", help="Tamanho e última atualização do grafo")
+    stats_parser.add_argument("index")
+    bench_parser = subparsers.add_parser("bench", help="Incremental contra recálculo completo")
+    bench_parser.add_argument("--notes", type=int, default=20000)
+    bench_parser.add_argument("--dim", type=int, default=384)
+    bench_parser.add_argument("--changed", type=float, default=0.01, help="Fração de notas alteradas")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        bench(args.notes, args.dim, args.changed)
+        return
+
+    graph = RelatedGraph(graph_path(args.index))
+    if args.command == "related":
+        try:
+            neighbors = graph.related(args.note, args.k)
+        except KeyError:
+            print(f"Nota fora do grafo: {args.note}")
+            return 1
+        for rank, neighbor in enumerate(neighbors, 1):
+            print(f"{rank}. {neighbor['score']:.3f}  {neighbor['source']}")
+    elif args.command == "stats":
+        print(json.dumps(graph.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+LEANN Resource Governor
+Executa o builder de índice com prioridade baixa de CPU/IO, limite de núcleos e
+pausa automática enquanto o wrapper HTTP reporta buscas em andamento
+
+Sinal de carga: o wrapper incrementa leann-load:<janela de 10s> no Redis a cada
+/search ou /ask; o governor soma as janelas recentes. Com carga alta o grupo de
+processos do builder recebe SIGSTOP e volta com SIGCONT quando o tráfego cai.
+"""
+
+import os
+import time
+import shutil
+import signal
+import logging
+import subprocess
+
+# Configurações
+REINDEX_NICE = int(os.getenv("REINDEX_NICE", "10"))
+REINDEX_IONICE_CLASS = os.getenv("REINDEX_IONICE_CLASS", "idle")  # idle | best-effort
+REINDEX_MAX_CPUS = int(os.getenv("REINDEX_MAX_CPUS", str(max(1, (os.cpu_count() or 2) // 2))))
+REINDEX_MAX_CONCURRENCY = int(os.getenv("REINDEX_MAX_CONCURRENCY", "2"))  # requisições de embedding simultâneas
+THROTTLE_ENABLED = os.getenv("REINDEX_THROTTLE_ENABLED", "true").lower() == "true"
+THROTTLE_HIGH_RPS = float(os.getenv("REINDEX_THROTTLE_HIGH_RPS", "0.5"))  # pausa acima disso
+THROTTLE_LOW_RPS = float(os.getenv("REINDEX_THROTTLE_LOW_RPS", "0.1"))  # retoma abaixo disso
+MAX_PAUSE_SECONDS = 120  # pausa contínua máxima, garante progresso do build
+MIN_RUN_SECONDS = 10  # tempo mínimo rodando entre duas pausas
+POLL_INTERVAL = 1.0
+LOAD_KEY_PREFIX = "leann-load:"
+LOAD_BUCKET_SECONDS = 10
+LOAD_WINDOW_BUCKETS = 3
+
+logger = logging.getLogger(__name__)
+
+IONICE_CLASSES = {"idle": "3", "best-effort": "2"}
+
+
+def allowed_cpus():
+    """Núcleos do builder: os últimos REINDEX_MAX_CPUS da afinidade atual (None sem suporte)"""
+    if not hasattr(os, "sched_getaffinity"):
+        return None
+    return sorted(os.sched_getaffinity(0))[-REINDEX_MAX_CPUS:]
+
+
+def governed_command(cmd):
+    """Prefixa o comando com taskset/ionice/nice quando disponíveis"""
+    prefix = []
+    cpus = allowed_cpus()
+    if cpus and shutil.which("taskset"):
+        prefix += ["taskset", "-c", ",".join(str(cpu) for cpu in cpus)]
+    if REINDEX_IONICE_CLASS in IONICE_CLASSES and shutil.which("ionice"):
+        prefix += ["ionice", "-c", IONICE_CLASSES[REINDEX_IONICE_CLASS]]
+        if REINDEX_IONICE_CLASS == "best-effort":
+            prefix += ["-n", "7"]
+    if REINDEX_NICE and shutil.which("nice"):
+        prefix += ["nice", "-n", str(REINDEX_NICE)]
+    return prefix + list(cmd)
+
+
+def governed_env(env=None):
+    """Limita os pools de threads/workers do builder ao número de núcleos permitido"""
+    env = dict(env if env is not None else os.environ)
+    cpus = str(REINDEX_MAX_CPUS)
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "RAYON_NUM_THREADS"):
+        env.setdefault(name, cpus)
+    env.setdefault("EMBEDDING_CONCURRENCY", str(REINDEX_MAX_CONCURRENCY))
+    return env
+
+
+def search_load(r):
+    """Buscas por segundo no wrapper nas últimas janelas de LOAD_BUCKET_SECONDS"""
+    bucket = int(time.time() // LOAD_BUCKET_SECONDS)
+    keys = [f"{LOAD_KEY_PREFIX}{bucket - offset}" for offset in range(LOAD_WINDOW_BUCKETS)]
+    total = sum(int(value or 0) for value in r.mget(keys))
+    return total / (LOAD_WINDOW_BUCKETS * LOAD_BUCKET_SECONDS)
+
+
+class ResourceGovernor:
+    """Roda o builder e pausa/retoma seu grupo de processos conforme a carga de busca"""
+
+    def __init__(self, redis_factory=None):
+        self.redis_factory = redis_factory
+        self._redis = None
+        self.throttled_seconds = 0.0
+        self.pauses = 0
+
+    def _load(self):
+        if not THROTTLE_ENABLED or self.redis_factory is None:
+            return 0.0
+        try:
+            if self._redis is None:
+                self._redis = self.redis_factory()
+            return search_load(self._redis)
+        except Exception as e:
+            logger.debug(f"Load signal unavailable: {e}")
+            self._redis = None
+            return 0.0
+
+    def run(self, cmd, **kwargs):
+        """Equivalente a subprocess.run(capture_output=True, text=True) sob o governor"""
+        self.throttled_seconds = 0.0
+        self.pauses = 0
+        kwargs['env'] = governed_env(kwargs.get('env'))
+        command = governed_command(cmd)
+        # Sem preexec_fn: run() é chamado de várias threads de worker e o fork não é seguro
+        # com código Python entre fork e exec; a sessão própria é criada pelo próprio subprocess
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   text=True, start_new_session=True, **kwargs)
+        cpus = allowed_cpus()
+        if cpus and command[0] != "taskset":
+            try:
+                os.sched_setaffinity(process.pid, cpus)
+            except OSError as e:
+                logger.debug(f"CPU affinity not applied: {e}")
+        paused_since = None
+        running_since = time.time()
+        try:
+            while True:
+                try:
+                    stdout, stderr = process.communicate(timeout=POLL_INTERVAL)
+                    break
+                except subprocess.TimeoutExpired:
+                    pass
+
+                now = time.time()
+                load = self._load()
+                if paused_since is None:
+                    if load >= THROTTLE_HIGH_RPS and now - running_since >= MIN_RUN_SECONDS:
+                        os.killpg(process.pid, signal.SIGSTOP)
+                        paused_since = now
+                        self.pauses += 1
+                        logger.info(f"Reindex paused: search load {load:.2f} req/s")
+                elif load <= THROTTLE_LOW_RPS or now - paused_since >= MAX_PAUSE_SECONDS:
+                    os.killpg(process.pid, signal.SIGCONT)
+                    self.throttled_seconds += now - paused_since
+                    paused_since = None
+                    running_since = now
+                    logger.info(f"Reindex resumed: search load {load:.2f} req/s")
+        except BaseException:
+            if process.poll() is None:
+                os.killpg(process.pid, signal.SIGCONT)
+                os.killpg(process.pid, signal.SIGTERM)
+            raise
+
+        return subprocess.CompletedProcess(process.args, process.returncode, stdout, stderr)
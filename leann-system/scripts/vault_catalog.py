@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+Vault Catalog
+Catálogo incremental do vault (pastas e notas .md) compartilhado pelo
+activity_agent e pelo metrics_daemon
+
+Cada pasta guarda o mtime do diretório, a contagem, o tamanho e o mtime mais
+recente das suas notas. Um refresh faz um stat por pasta conhecida e só relista
+(os.scandir) as pastas cujo mtime mudou: notas criadas, removidas ou renomeadas.
+Com o vault crescendo, as listagens completas (Path.glob) deixam de se repetir
+a cada ciclo de métricas.
+
+As categorias de cada nota (frontmatter `categories`/`category`, ou as tags)
+ficam em cache pelo mtime: só notas alteradas têm o frontmatter relido.
+
+Cada refresh também compara o vault com o catálogo anterior e registra num
+journal append-only as notas criadas, editadas, movidas (mesmo inode em outro
+caminho) e removidas. O relatório diário lê só o intervalo de tempo pedido.
+
+Uso:
+    python3 vault_catalog.py refresh [--vault CAMINHO]
+    python3 vault_catalog.py stats <pasta> [--recursive] [--vault CAMINHO]
+    python3 vault_catalog.py categories <pasta> [--vault CAMINHO]
+    python3 vault_catalog.py changes [--hours H] [--folder PASTA] [--vault CAMINHO]
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import logging
+
+# Configurações
+VAULT_PATH = os.getenv("OBSIDIAN_VAULT_PATH", "/var/lib/docker/volumes/docker-compose_obsidian-vaults/_data/MyVault")
+CATALOG_DB = os.getenv("VAULT_CATALOG_DB", "/var/lib/activity-agent/vault-catalog.db")
+NOTE_SUFFIX = ".md"
+MAX_FRONTMATTER_LINES = 200  # frontmatter sem `---` de fechamento é ignorado depois disso
+JOURNAL_RETENTION_DAYS = int(os.getenv("VAULT_JOURNAL_RETENTION_DAYS", "90"))
+BUSY_TIMEOUT_MS = 10000
+SCHEMA_VERSION = 3
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalog (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER NOT NULL,
+    notes INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    newest_mtime REAL,
+    scanned_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    inode INTEGER
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+
+CREATE TABLE IF NOT EXISTS note_meta (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    categories TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS changes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    detected_at REAL NOT NULL,
+    event TEXT NOT NULL,
+    path TEXT NOT NULL,
+    old_path TEXT
+);
+CREATE INDEX IF NOT EXISTS changes_ts ON changes (ts);
+"""
+
+
+def _join(parent, name):
+    return f"{parent}/{name}" if parent else name
+
+
+def _subtree(column, rel):
+    """Cláusula SQL (e parâmetros) da pasta `rel` e de tudo abaixo dela; sem LIKE, que trata `_` como curinga"""
+    if not rel:
+        return "1", ()
+    return f"({column} = ? OR substr({column}, 1, ?) = ?)", (rel, len(rel) + 1, f"{rel}/")
+
+
+def read_frontmatter(file_path):
+    """Frontmatter de uma nota lendo só as linhas entre os `---` iniciais"""
+    from vault_chunker import parse_frontmatter
+
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+        if f.readline().strip() != "---":
+            return {}
+        lines = []
+        for line in f:
+            if line.strip() == "---":
+                return parse_frontmatter(lines)
+            lines.append(line)
+            if len(lines) > MAX_FRONTMATTER_LINES:
+                break
+    return {}
+
+
+def note_categories(frontmatter):
+    """Categorias da nota: `categories`/`category` do frontmatter ou, na falta delas, as tags
+
+    Valores normalizados (minúsculas, `_` no lugar de espaços, links `[[...]]`
+    sem colchetes) e tags hierárquicas reduzidas ao primeiro nível (`tech/ai` -> `tech`).
+    """
+    from vault_chunker import frontmatter_tags
+
+    values = frontmatter.get('categories') or frontmatter.get('category')
+    if isinstance(values, str):
+        values = values.split(",")
+    if not values:
+        values = frontmatter_tags(frontmatter)
+    categories = []
+    for value in values:
+        category = str(value).strip().strip("[]\"'").lstrip("#").split("/")[0].strip().lower().replace(" ", "_")
+        if category and category not in categories:
+            categories.append(category)
+    return categories
+
+
+class VaultCatalog:
+    """Contagens por pasta do vault mantidas em SQLite (WAL), atualizadas por diretório alterado"""
+
+    def __init__(self, vault_path=VAULT_PATH, db_path=CATALOG_DB):
+        self.vault_path = vault_path
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        # Conexão compartilhada entre threads (scrapes do metrics_daemon); o chamador serializa o uso
+        self.conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None,
+                                    check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < SCHEMA_VERSION:
+            self.conn.executescript(SCHEMA)
+            if 0 < version < 3:
+                # Catálogos anteriores ao journal não guardavam o inode (detecção de notas movidas)
+                self.conn.execute("ALTER TABLE files ADD COLUMN inode INTEGER")
+            self.conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        self.conn.row_factory = sqlite3.Row
+
+    def close(self):
+        self.conn.close()
+
+    def _remove_tree(self, rel):
+        """Remove uma pasta (e subpastas) que sumiu do vault; retorna as notas removidas (caminho, inode, mtime)"""
+        files_clause, files_params = _subtree("dir", rel)
+        dirs_clause, dirs_params = _subtree("path", rel)
+        removed = [(row['path'], row['inode'], row['mtime']) for row in
+                   self.conn.execute(f"SELECT path, inode, mtime FROM files WHERE {files_clause}", files_params)]
+        self.conn.execute(f"DELETE FROM files WHERE {files_clause}", files_params)
+        self.conn.execute(f"DELETE FROM dirs WHERE {dirs_clause}", dirs_params)
+        return removed
+
+    def _rescan(self, rel, parent, mtime_ns):
+        """Relista uma pasta alterada e atualiza suas notas
+
+        Retorna (subpastas, criadas, removidas, editadas): criadas e removidas
+        como (caminho, inode, mtime) e editadas como (caminho, mtime).
+        """
+        notes, subdirs = {}, []
+        with os.scandir(os.path.join(self.vault_path, rel)) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue  # .obsidian, .trash, arquivos temporários
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(_join(rel, entry.name))
+                elif entry.name.endswith(NOTE_SUFFIX) and entry.is_file():
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    notes[_join(rel, entry.name)] = (stat.st_size, stat.st_mtime, entry.inode())
+
+        known = {row['path']: row for row in
+                 self.conn.execute("SELECT path, size, mtime, inode FROM files WHERE dir = ?", (rel,))}
+        gone = [(path, row['inode'], row['mtime']) for path, row in known.items() if path not in notes]
+        created = [(path, inode, mtime) for path, (_, mtime, inode) in notes.items() if path not in known]
+        edited = [(path, mtime) for path, (size, mtime, _) in notes.items()
+                  if path in known and (known[path]['size'], known[path]['mtime']) != (size, mtime)]
+        self.conn.executemany("DELETE FROM files WHERE path = ?", [(path,) for path, _, _ in gone])
+        self.conn.executemany("INSERT OR REPLACE INTO files (path, dir, size, mtime, inode) VALUES (?, ?, ?, ?, ?)",
+                              [(path, rel, size, mtime, inode) for path, (size, mtime, inode) in notes.items()])
+        self.conn.execute(
+            "INSERT OR REPLACE INTO dirs (path, parent, mtime_ns, notes, bytes, newest_mtime, scanned_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (rel, parent, mtime_ns, len(notes), sum(size for size, _, _ in notes.values()),
+             max((mtime for _, mtime, _ in notes.values()), default=None), time.time())
+        )
+        return subdirs, created, gone, edited
+
+    def _check_edits(self, rel, notes):
+        """Notas editadas no lugar (o mtime da pasta não muda): um stat por nota, sem relistar"""
+        edited = []
+        for row in notes:
+            try:
+                stat = os.stat(os.path.join(self.vault_path, row['path']))
+            except OSError:
+                continue  # removida agora; aparece na próxima listagem da pasta
+            if (stat.st_size, stat.st_mtime) != (row['size'], row['mtime']) or row['inode'] is None:
+                self.conn.execute("UPDATE files SET size = ?, mtime = ?, inode = ? WHERE path = ?",
+                                  (stat.st_size, stat.st_mtime, stat.st_ino, row['path']))
+            if (stat.st_size, stat.st_mtime) != (row['size'], row['mtime']):
+                edited.append((row['path'], stat.st_mtime))
+        if edited:
+            self.conn.execute(
+                "UPDATE dirs SET bytes = (SELECT COALESCE(SUM(size), 0) FROM files WHERE dir = ?), "
+                "newest_mtime = (SELECT MAX(mtime) FROM files WHERE dir = ?) WHERE path = ?", (rel, rel, rel)
+            )
+        return edited
+
+    def _journal(self, created, removed, edited, detected_at):
+        """Grava os eventos do refresh; criada + removida com o mesmo inode vira `moved`"""
+        removed_by_inode = {inode: (path, mtime) for path, inode, mtime in removed if inode is not None}
+        events, moved_from = [], set()
+        for path, inode, mtime in created:
+            old_path, old_mtime = removed_by_inode.pop(inode, (None, None))
+            if old_path is not None:
+                moved_from.add(old_path)
+                events.append((detected_at, detected_at, 'moved', path, old_path))
+                if mtime != old_mtime:
+                    events.append((mtime, detected_at, 'modified', path, None))
+            else:
+                events.append((mtime, detected_at, 'created', path, None))
+        events.extend((mtime, detected_at, 'modified', path, None) for path, mtime in edited)
+        events.extend((detected_at, detected_at, 'deleted', path, None)
+                      for path, _, _ in removed if path not in moved_from)
+        self.conn.executemany("INSERT INTO changes (ts, detected_at, event, path, old_path) VALUES (?, ?, ?, ?, ?)",
+                              events)
+        return events
+
+    def refresh(self, track_edits=True):
+        """Sincroniza o catálogo com o vault visitando só as pastas alteradas desde o último refresh
+
+        Com track_edits as notas das pastas inalteradas recebem um stat cada,
+        para registrar edições feitas no lugar. O primeiro refresh (catálogo
+        vazio) só estabelece a base e não gera eventos no journal.
+        """
+        started = time.time()
+        stats = {'dirs': 0, 'rescanned': 0, 'created': 0, 'modified': 0, 'moved': 0, 'deleted': 0}
+        created, removed, edited = [], [], []
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            vault = self.conn.execute("SELECT value FROM catalog WHERE key = 'vault_path'").fetchone()
+            if vault is None or vault['value'] != self.vault_path:
+                # Catálogo de outro vault: recomeça do zero
+                self._remove_tree("")
+                self.conn.execute("INSERT OR REPLACE INTO catalog (key, value) VALUES ('vault_path', ?)",
+                                  (self.vault_path,))
+
+            known, children = {}, {}
+            for row in self.conn.execute("SELECT path, parent, mtime_ns FROM dirs"):
+                known[row['path']] = row['mtime_ns']
+                children.setdefault(row['parent'], []).append(row['path'])
+            baseline = not known
+            notes_by_dir = {}
+            if track_edits and not baseline:
+                for row in self.conn.execute("SELECT path, dir, size, mtime, inode FROM files"):
+                    notes_by_dir.setdefault(row['dir'], []).append(row)
+
+            pending = [("", None)]
+            while pending:
+                rel, parent = pending.pop()
+                try:
+                    mtime_ns = os.stat(os.path.join(self.vault_path, rel)).st_mtime_ns
+                except OSError:
+                    removed.extend(self._remove_tree(rel))
+                    continue
+                stats['dirs'] += 1
+                if known.get(rel) == mtime_ns:
+                    subdirs = children.get(rel, [])
+                    edited.extend(self._check_edits(rel, notes_by_dir.get(rel, [])))
+                else:
+                    subdirs, dir_created, dir_removed, dir_edited = self._rescan(rel, parent, mtime_ns)
+                    stats['rescanned'] += 1
+                    created.extend(dir_created)
+                    removed.extend(dir_removed)
+                    edited.extend(dir_edited)
+                    # Subpastas que saíram da listagem (removidas ou renomeadas)
+                    for vanished in set(children.get(rel, [])) - set(subdirs):
+                        removed.extend(self._remove_tree(vanished))
+                pending.extend((subdir, rel) for subdir in subdirs)
+
+            if not baseline:
+                for event in self._journal(created, removed, edited, time.time()):
+                    stats[event[2]] += 1
+            self.conn.execute("DELETE FROM changes WHERE ts < ?", (time.time() - JOURNAL_RETENTION_DAYS * 86400,))
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        stats['seconds'] = time.time() - started
+        if stats['rescanned'] or edited:
+            logger.info(f"Catálogo do vault: {stats['rescanned']}/{stats['dirs']} pastas relistadas, "
+                        f"+{stats['created']} ~{stats['modified']} >{stats['moved']} -{stats['deleted']} notas "
+                        f"({stats['seconds']:.2f}s)")
+        return stats
+
+    def changes_since(self, since, until=None, folder=None):
+        """Eventos do journal no intervalo [since, until), do mais antigo ao mais recente"""
+        clause, params = _subtree("path", folder.strip('/')) if folder else ("1", ())
+        rows = self.conn.execute(
+            f"SELECT ts, event, path, old_path FROM changes WHERE ts >= ? AND ts < ? AND {clause} ORDER BY ts, id",
+            (since, until if until is not None else float('inf')) + params
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def folder_stats(self, folder, recursive=False):
+        """Notas, bytes e mtime mais recente de uma pasta (relativa ao vault); zeros se não existe"""
+        folder = folder.strip('/')
+        if recursive:
+            clause, params = _subtree("path", folder)
+            row = self.conn.execute(
+                "SELECT COUNT(*) AS dirs, SUM(notes) AS notes, SUM(bytes) AS bytes, MAX(newest_mtime) AS newest_mtime "
+                f"FROM dirs WHERE {clause}", params
+            ).fetchone()
+            if not row['dirs']:
+                row = None
+        else:
+            row = self.conn.execute("SELECT notes, bytes, newest_mtime FROM dirs WHERE path = ?", (folder,)).fetchone()
+        if row is None:
+            return {'notes': 0, 'bytes': 0, 'newest_mtime': None}
+        return {'notes': row['notes'], 'bytes': row['bytes'], 'newest_mtime': row['newest_mtime']}
+
+    def category_counts(self, folder):
+        """Notas por categoria sob uma pasta (recursivo); só notas com mtime/tamanho novo são relidas
+
+        Retorna ({categoria: notas}, estatísticas); notas sem categoria contam em
+        `uncategorized`. Usa as notas e os mtimes do último refresh().
+        """
+        started = time.time()
+        clause, params = _subtree("f.dir", folder.strip('/'))
+        rows = self.conn.execute(
+            "SELECT f.path, f.mtime, f.size, m.mtime AS parsed_mtime, m.size AS parsed_size, m.categories "
+            f"FROM files f LEFT JOIN note_meta m ON m.path = f.path WHERE {clause}", params
+        ).fetchall()
+
+        counts, updates = {}, []
+        for row in rows:
+            categories = json.loads(row['categories']) if row['categories'] is not None else None
+            if categories is None or (row['parsed_mtime'], row['parsed_size']) != (row['mtime'], row['size']):
+                try:
+                    categories = note_categories(read_frontmatter(os.path.join(self.vault_path, row['path'])))
+                except OSError as e:
+                    logger.warning(f"Erro ao ler {row['path']}: {e}")
+                    continue
+                updates.append((row['path'], row['mtime'], row['size'], json.dumps(categories)))
+            for category in categories or ["uncategorized"]:
+                counts[category] = counts.get(category, 0) + 1
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany("INSERT OR REPLACE INTO note_meta (path, mtime, size, categories) "
+                                  "VALUES (?, ?, ?, ?)", updates)
+            self.conn.execute("DELETE FROM note_meta WHERE path NOT IN (SELECT path FROM files)")
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return counts, {'notes': len(rows), 'parsed': len(updates), 'seconds': time.time() - started}
+
+    def count_notes(self, folders, recursive=False):
+        """Contagem de notas de várias pastas: {pasta: notas}"""
+        return {folder: self.folder_stats(folder, recursive)['notes'] for folder in folders}
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Catálogo incremental de pastas e notas do vault")
+    parser.add_argument("--vault", default=VAULT_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("refresh", help="Sincroniza o catálogo com o vault")
+    stats_parser = subparsers.add_parser("stats", help="Contagens de uma pasta")
+    stats_parser.add_argument("folder")
+    stats_parser.add_argument("--recursive", action="store_true")
+    categories_parser = subparsers.add_parser("categories", help="Notas por categoria do frontmatter")
+    categories_parser.add_argument("folder")
+    changes_parser = subparsers.add_parser("changes", help="Eventos recentes do journal")
+    changes_parser.add_argument("--hours", type=float, default=24)
+    changes_parser.add_argument("--folder")
+    args = parser.parse_args()
+
+    catalog = VaultCatalog(args.vault)
+    try:
+        if args.command == "refresh":
+            print(json.dumps(catalog.refresh(), indent=2))
+        elif args.command == "stats":
+            print(json.dumps(catalog.folder_stats(args.folder, args.recursive), indent=2))
+        elif args.command == "categories":
+            catalog.refresh()
+            counts, stats = catalog.category_counts(args.folder)
+            print(json.dumps({'categories': counts, **stats}, indent=2))
+        elif args.command == "changes":
+            catalog.refresh()
+            for change in catalog.changes_since(time.time() - args.hours * 3600, folder=args.folder):
+                moved = f" (de {change['old_path']})" if change['old_path'] else ""
+                print(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(change['ts']))}  "
+                      f"{change['event']:<8}  {change['path']}{moved}")
+    finally:
+        catalog.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+LEANN Vault Chunker
+Chunking em streaming das notas Obsidian respeitando frontmatter, títulos e
+blocos de código, com IDs de chunk estáveis derivados do conteúdo
+
+Cada seção (título) é fechada em chunks próprios e, dentro da seção, os limites
+são definidos pelo conteúdo (parágrafos "âncora"), então uma edição pequena só
+altera os chunks vizinhos a ela. Arquivos são lidos linha a linha.
+
+Uso:
+    python3 vault_chunker.py bench [--notes N] [--edits N]
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import hashlib
+import logging
+import argparse
+import tempfile
+
+from embedding_store import content_hash
+
+# Configurações
+CHUNK_SIZE = 1024  # caracteres por chunk
+CHUNK_OVERLAP = 128  # sobreposição ao dividir blocos maiores que CHUNK_SIZE
+MIN_ANCHOR_SIZE = CHUNK_SIZE // 2  # tamanho mínimo antes de um corte por âncora
+ANCHOR_MODULUS = 4  # ~1 em cada 4 parágrafos encerra o chunk (quando já tem MIN_ANCHOR_SIZE)
+ROOT_SHARD = "_root"  # shard das notas soltas na raiz do vault
+
+logger = logging.getLogger(__name__)
+
+FENCES = ("```", "~~~")
+
+
+def shard_of(rel_path):
+    """Shard de uma nota: a pasta de primeiro nível do caminho relativo (ROOT_SHARD na raiz)"""
+    parts = rel_path.replace(os.sep, "/").split("/", 1)
+    return parts[0] if len(parts) > 1 else ROOT_SHARD
+
+
+def iter_vault_files(vault_path, file_types=(".md",), shard=None):
+    """Percorre o vault em ordem estável, ignorando diretórios ocultos
+
+    `shard` restringe a busca a uma pasta de primeiro nível (ROOT_SHARD: só as
+    notas da raiz); os caminhos continuam relativos à raiz do vault.
+    """
+    if shard == ROOT_SHARD:
+        for file in sorted(os.listdir(vault_path)):
+            if file.endswith(tuple(file_types)) and os.path.isfile(os.path.join(vault_path, file)):
+                yield os.path.join(vault_path, file)
+        return
+    for root, dirs, files in os.walk(os.path.join(vault_path, shard) if shard else vault_path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for file in sorted(files):
+            if file.endswith(tuple(file_types)):
+                yield os.path.join(root, file)
+
+
+def _parse_value(value):
+    value = value.strip()
+    if value.startswith("[") and value.endswith("]"):
+        return [_parse_value(item) for item in value[1:-1].split(",") if item.strip()]
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+        return value[1:-1]
+    return value
+
+
+def parse_frontmatter(lines):
+    """Subconjunto de YAML usado no vault: `chave: valor`, listas inline e listas `- item`"""
+    data = {}
+    key = None
+    for line in lines:
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        if stripped.startswith("- ") and key is not None:
+            if not isinstance(data.get(key), list):
+                data[key] = []
+            data[key].append(_parse_value(stripped[2:]))
+        elif ":" in stripped and not line[0].isspace():
+            key, value = stripped.split(":", 1)
+            key = key.strip()
+            data[key] = _parse_value(value) if value.strip() else []
+    return data
+
+
+def frontmatter_tags(frontmatter):
+    """Tags normalizadas (minúsculas, sem `#`) de `tags`/`tag`, em lista ou texto separado por vírgulas"""
+    tags = []
+    for key in ("tags", "tag"):
+        value = (frontmatter or {}).get(key)
+        if isinstance(value, str):
+            value = value.replace(",", " ").split()
+        for tag in value or []:
+            tag = str(tag).strip().lstrip("#").lower()
+            if tag and tag not in tags:
+                tags.append(tag)
+    return tags
+
+
+def iter_note_blocks(lines, frontmatter=None):
+    """Gera (seção, bloco, inicia_seção) a partir das linhas de uma nota
+
+    Blocos são parágrafos ou blocos de código completos; a seção é o caminho de
+    títulos ("Título > Subtítulo"). O frontmatter é removido do texto e, se
+    `frontmatter` for um dict, preenchido com os campos lidos.
+    """
+    headings = []
+    block = []
+    fence = None
+    starts_section = True
+    header = None  # linhas do frontmatter em leitura
+
+    def section():
+        return " > ".join(title for _, title in headings)
+
+    for number, line in enumerate(lines):
+        line = line.rstrip("\n")
+
+        if number == 0 and line.strip() == "---":
+            header = []
+            continue
+        if header is not None:
+            if line.strip() in ("---", "..."):
+                if frontmatter is not None:
+                    frontmatter.update(parse_frontmatter(header))
+                header = None
+            else:
+                header.append(line)
+            continue
+
+        stripped = line.lstrip()
+        if fence is not None:
+            block.append(line)
+            if stripped.startswith(fence):
+                yield section(), "\n".join(block), starts_section
+                block, fence, starts_section = [], None, False
+            continue
+
+        if stripped.startswith(FENCES):
+            if block:
+                yield section(), "\n".join(block), starts_section
+                starts_section = False
+            block, fence = [line], stripped[:3]
+            continue
+
+        if stripped.startswith("#") and stripped.lstrip("#").startswith(" "):
+            if block:
+                yield section(), "\n".join(block), starts_section
+            level = len(stripped) - len(stripped.lstrip("#"))
+            while headings and headings[-1][0] >= level:
+                headings.pop()
+            headings.append((level, stripped.lstrip("#").strip()))
+            block, starts_section = [line], True
+            continue
+
+        if not stripped:
+            if block:
+                yield section(), "\n".join(block), starts_section
+                block, starts_section = [], False
+            continue
+
+        block.append(line)
+
+    if header is not None:
+        # Frontmatter sem fechamento: trata como texto comum
+        block = ["---"] + header
+    if block:
+        yield section(), "\n".join(block), starts_section
+
+
+def _is_anchor(text):
+    """Corte definido pelo conteúdo: estável quando parágrafos anteriores mudam"""
+    return int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16) % ANCHOR_MODULUS == 0
+
+
+def _split_oversized(text):
+    """Divide um bloco maior que CHUNK_SIZE por linhas (janela com sobreposição para linhas longas)"""
+    current = ""
+    for line in text.split("\n"):
+        if len(line) > CHUNK_SIZE:
+            if current:
+                yield current
+                current = ""
+            step = CHUNK_SIZE - CHUNK_OVERLAP
+            for start in range(0, len(line), step):
+                yield line[start:start + CHUNK_SIZE]
+                if start + CHUNK_SIZE >= len(line):
+                    break
+            continue
+        if current and len(current) + len(line) + 1 > CHUNK_SIZE:
+            yield current
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current.strip():
+        yield current
+
+
+def pack_blocks(blocks):
+    """Agrupa blocos em chunks de até CHUNK_SIZE sem atravessar seções; gera (seção, texto)"""
+    current = []
+    size = 0
+    current_section = ""
+
+    for section, text, starts_section in blocks:
+        text = text.strip("\n")
+        if not text.strip():
+            continue
+        if current and (starts_section or section != current_section):
+            yield current_section, "\n\n".join(current)
+            current, size = [], 0
+        current_section = section
+
+        if len(text) > CHUNK_SIZE:
+            if current:
+                yield section, "\n\n".join(current)
+                current, size = [], 0
+            for piece in _split_oversized(text):
+                yield section, piece
+            continue
+
+        if current and size + len(text) + 2 > CHUNK_SIZE:
+            yield section, "\n\n".join(current)
+            current, size = [], 0
+        current.append(text)
+        size += len(text) + (2 if size else 0)
+        if size >= MIN_ANCHOR_SIZE and _is_anchor(text):
+            yield section, "\n\n".join(current)
+            current, size = [], 0
+
+    if current:
+        yield current_section, "\n\n".join(current)
+
+
+def chunk_text(text):
+    """Chunks (somente texto) de uma nota já carregada em memória"""
+    return [chunk for _, chunk in pack_blocks(iter_note_blocks(text.splitlines()))]
+
+
+def read_note(file_path):
+    """Lê uma nota do vault; retorna None se o arquivo não puder ser lido"""
+    try:
+        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read()
+    except Exception as e:
+        logger.warning(f"Erro ao ler {file_path}: {e}")
+        return None
+
+
+def make_chunk(rel_path, file_path, section, text, occurrence=0, frontmatter=None):
+    """Monta o registro de um chunk com ID derivado de nota, seção e conteúdo
+
+    O ID não depende da posição do chunk na nota: inserir ou remover texto em
+    outra seção não altera os IDs dos demais chunks.
+    """
+    chunk_id = hashlib.sha1(
+        f"{rel_path}\0{section}\0{content_hash(text)}\0{occurrence}".encode()
+    ).hexdigest()[:16]
+    metadata = {
+        'source': rel_path,
+        'file_path': file_path,
+        'file_name': os.path.basename(file_path),
+        'section': section,
+    }
+    if frontmatter:
+        metadata['frontmatter'] = frontmatter
+    return {'id': chunk_id, 'text': text, 'metadata': metadata}
+
+
+def iter_note_chunks(rel_path, file_path, lines):
+    """Gera os chunks de uma nota a partir de um iterável de linhas (ex.: o arquivo aberto)"""
+    frontmatter = {}
+    seen = {}
+    for section, text in pack_blocks(iter_note_blocks(lines, frontmatter)):
+        # Chunks idênticos na mesma seção recebem IDs distintos pela ocorrência
+        occurrence = seen.get((section, text), 0)
+        seen[(section, text)] = occurrence + 1
+        yield make_chunk(rel_path, file_path, section, text, occurrence, frontmatter)
+
+
+def iter_vault_chunks(vault_path, file_types=(".md",), shard=None):
+    """Gera os chunks do vault em streaming (uma nota aberta por vez, lida linha a linha)"""
+    for file_path in iter_vault_files(vault_path, file_types, shard):
+        rel_path = os.path.relpath(file_path, vault_path)
+        try:
+            with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+                yield from iter_note_chunks(rel_path, file_path, f)
+        except OSError as e:
+            logger.warning(f"Erro ao ler {file_path}: {e}")
+
+
+# Benchmark em vault sintético
+
+WORDS = ("vault", "leann", "index", "embedding", "docker", "redis", "prometheus", "workflow", "n8n",
+         "obsidian", "query", "chunk", "agent", "monitor", "backup", "deploy", "cache", "latency")
+
+
+def _paragraph(rng, words=60):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(words // 2, words * 2))).capitalize() + "."
+
+
+def _synthetic_note(rng, number):
+    lines = ["---", f"title: Nota {number}", f"tags: [{rng.choice(WORDS)}, {rng.choice(WORDS)}]",
+             f"category: {rng.choice(('projeto', 'referencia', 'diario'))}", "---", "", f"# Nota {number}", ""]
+    for section in range(rng.randint(2, 6)):
+        lines += [f"## Seção {section}", ""]
+        for _ in range(rng.randint(1, 6)):
+            if rng.random() < 0.15:
+                lines += ["```python"] + [f"value_{i} = compute({i})" for i in range(rng.randint(3, 30))] + ["```", ""]
+            else:
+                lines += [_paragraph(rng), ""]
+    return "\n".join(lines) + "\n"
+
+
+def write_synthetic_vault(vault_path, notes, seed=42):
+    rng = random.Random(seed)
+    for number in range(notes):
+        folder = os.path.join(vault_path, f"area-{number % 10}")
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"nota-{number:05d}.md"), 'w', encoding='utf-8') as f:
+            f.write(_synthetic_note(rng, number))
+
+
+def _edit_notes(vault_path, edits, seed=7):
+    """Acrescenta uma frase a um parágrafo no meio de `edits` notas"""
+    rng = random.Random(seed)
+    files = list(iter_vault_files(vault_path))
+    for file_path in rng.sample(files, min(edits, len(files))):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            paragraphs = f.read().split("\n\n")
+        target = rng.randrange(len(paragraphs) // 2, len(paragraphs))
+        paragraphs[target] = paragraphs[target].rstrip() + " Edição pequena."
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write("\n\n".join(paragraphs))
+
+
+def bench(notes, edits):
+    import resource
+
+    vault_path = tempfile.mkdtemp(prefix="leann-chunker-bench-")
+    try:
+        write_synthetic_vault(vault_path, notes)
+        size = sum(os.path.getsize(path) for path in iter_vault_files(vault_path))
+
+        started = time.perf_counter()
+        ids_before = set()
+        count = 0
+        for chunk in iter_vault_chunks(vault_path):
+            ids_before.add(chunk['id'])
+            count += 1
+        elapsed = time.perf_counter() - started
+
+        _edit_notes(vault_path, edits)
+        ids_after = {chunk['id'] for chunk in iter_vault_chunks(vault_path)}
+        kept = len(ids_before & ids_after)
+
+        print(f"Notas: {notes} ({size / 1e6:.1f} MB)")
+        print(f"Chunks: {count} em {elapsed:.2f}s ({count / elapsed:,.0f} chunks/s, {size / 1e6 / elapsed:.1f} MB/s)")
+        print(f"Pico de memória (RSS): {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+        print(f"Estabilidade após {edits} edições: {kept}/{len(ids_before)} IDs mantidos "
+              f"({len(ids_after - ids_before)} chunks novos)")
+    finally:
+        shutil.rmtree(vault_path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunker de notas do vault")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench_parser = subparsers.add_parser("bench", help="Throughput e estabilidade em um vault sintético")
+    bench_parser.add_argument("--notes", type=int, default=5000)
+    bench_parser.add_argument("--edits", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        bench(args.notes, args.edits)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+"""
+LEANN Vector Index
+Exportação dos vetores de cada geração em arquivos mapeáveis em memória, com
+armazenamento quantizado opcional (int8 escalar por linha) e índice IVF
+(centróides k-means + listas invertidas) para a busca em processo do wrapper
+
+No modo int8 a geração guarda só os códigos int8 e a escala de cada linha
+(1/4 do float32); os candidatos são reordenados em precisão total lendo as
+linhas float32 do EmbeddingStore, que é append-only e já está em disco.
+
+Arquivos em <geração>/vectors/:
+    meta.json     dimensão, total, modelo, quantização, caminho do store
+    codes.i8      códigos int8 (n x dim)        [int8]
+    scales.f32    escala de cada linha (n)      [int8]
+    store_rows.u32 linha de cada chunk no store [int8]
+    vectors.f32   vetores float32 (n x dim)     [none]
+    chunks.jsonl  id, texto e metadados por linha
+    chunks.idx    offsets (uint64) de cada linha em chunks.jsonl (+ tamanho final)
+    ivf_centroids.f32 centróides (listas x dim)  [>= IVF_MIN_VECTORS]
+    ivf_offsets.u64   início de cada lista       [>= IVF_MIN_VECTORS]
+    ivf_rows.u32      linhas agrupadas por lista [>= IVF_MIN_VECTORS]
+    notes.json        nota, mtime e tags do frontmatter de cada nota citada
+    note_offsets.u64  início das linhas de cada nota
+    note_rows.u32     linhas agrupadas por nota (pré-filtro por pasta/tag/data)
+
+Os arquivos são abertos somente leitura com mmap: todos os workers do wrapper
+compartilham as mesmas páginas do page cache.
+
+Uso:
+    python3 vector_index.py bench-quant [--vectors N] [--dim D] [--k K]
+    python3 vector_index.py bench-cli <índice> [--queries N] [--k K]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import random
+import argparse
+import subprocess
+
+import numpy as np
+
+from vault_chunker import frontmatter_tags
+
+# Configurações
+VECTORS_DIRNAME = "vectors"
+QUANTIZATION = os.getenv("LEANN_VECTOR_QUANTIZATION", "int8")  # int8 | none
+RESCORE_FACTOR = 4  # candidatos reordenados em float32 = k * RESCORE_FACTOR
+SCAN_BLOCK_ROWS = 16384  # linhas convertidas por vez na varredura int8
+IVF_MIN_VECTORS = 10000  # abaixo disso a varredura completa já é rápida
+IVF_NPROBE = int(os.getenv("LEANN_IVF_NPROBE", "16"))  # listas visitadas por consulta
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64  # vetores de treino por lista
+LEANN_INDEXES_DIR = os.getenv("LEANN_INDEXES_DIR", "/root/.leann/indexes")
+
+_SOURCE_LINE_RE = re.compile(r"^[ \t]*Source:[ \t]*(\S.*?)[ \t]*$", re.MULTILINE)
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def quantize_int8(vectors):
+    """Quantização escalar simétrica por linha: v ~= codes * scale"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def _write_array(path, array):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(np.ascontiguousarray(array).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _assign(vectors, centroids):
+    """Centróide mais próximo (produto interno) de cada vetor, em blocos"""
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), SCAN_BLOCK_ROWS):
+        block = vectors[start:start + SCAN_BLOCK_ROWS]
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def train_ivf(vectors, lists, seed=0):
+    """k-means esférico em uma amostra; retorna (centróides, lista de cada vetor)"""
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), min(len(vectors), lists * KMEANS_SAMPLE_PER_LIST), replace=False)]
+    centroids = sample[rng.choice(len(sample), lists, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assignments = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        empty = np.bincount(assignments, minlength=lists) == 0
+        # Listas vazias recebem um ponto aleatório da amostra
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = _normalize(sums)
+    return centroids, _assign(vectors, centroids)
+
+
+def _note_postings(chunks, vault_path=None):
+    """Notas (fonte, mtime, tags) e as linhas de cada uma; duplicatas colapsadas contam para todas as fontes"""
+    notes = []
+    positions = {}
+    pairs = []
+    for row, chunk in enumerate(chunks):
+        metadata = chunk['metadata']
+        source_frontmatter = metadata.get('source_frontmatter')
+        for source in metadata.get('sources') or [metadata.get('source')]:
+            if source is None:
+                continue
+            if source not in positions:
+                frontmatter = source_frontmatter.get(source) if source_frontmatter else metadata.get('frontmatter')
+                try:
+                    mtime = os.stat(os.path.join(vault_path, source)).st_mtime if vault_path else None
+                except OSError:
+                    mtime = None
+                positions[source] = len(notes)
+                notes.append({'source': source, 'mtime': mtime,
+                              'tags': frontmatter_tags(frontmatter)})
+            pairs.append((positions[source], row))
+
+    pairs.sort()
+    note_ids = np.asarray([note for note, _ in pairs], dtype=np.int64)
+    rows = np.asarray([row for _, row in pairs], dtype=np.uint32)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(note_ids, minlength=len(notes)))]).astype(np.uint64)
+    return notes, offsets, rows
+
+
+def export_vectors(generation_dir, chunks, embeddings, embedding_model, embedding_mode,
+                   store=None, keys=None, quantization=QUANTIZATION, vault_path=None):
+    """Grava os vetores e metadados da geração para o backend de busca em processo"""
+    out_dir = os.path.join(generation_dir, VECTORS_DIRNAME)
+    os.makedirs(out_dir, exist_ok=True)
+    vectors = _normalize(embeddings)
+    meta = {
+        'count': int(vectors.shape[0]),
+        'dim': int(vectors.shape[1]),
+        'embedding_model': embedding_model,
+        'embedding_mode': embedding_mode,
+        'quantization': quantization,
+        'created_at': time.time(),
+    }
+
+    if quantization == "int8" and store is not None and keys is not None:
+        codes, scales = quantize_int8(vectors)
+        _write_array(os.path.join(out_dir, "codes.i8"), codes)
+        _write_array(os.path.join(out_dir, "scales.f32"), scales)
+        _write_array(os.path.join(out_dir, "store_rows.u32"), store.rows_for(keys))
+        meta['store_vectors_path'] = store.vectors_path
+    else:
+        meta['quantization'] = "none"
+        _write_array(os.path.join(out_dir, "vectors.f32"), vectors)
+
+    if len(vectors) >= IVF_MIN_VECTORS:
+        lists = int(np.sqrt(len(vectors)))
+        centroids, assignments = train_ivf(vectors, lists)
+        # Linhas em ordem crescente dentro de cada lista: leituras sequenciais no mmap
+        order = np.argsort(assignments, kind='stable').astype(np.uint32)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=lists))]).astype(np.uint64)
+        _write_array(os.path.join(out_dir, "ivf_centroids.f32"), centroids)
+        _write_array(os.path.join(out_dir, "ivf_offsets.u64"), offsets)
+        _write_array(os.path.join(out_dir, "ivf_rows.u32"), order)
+        meta['ivf_lists'] = lists
+    else:
+        for name in ("ivf_centroids.f32", "ivf_offsets.u64", "ivf_rows.u32"):
+            if os.path.exists(os.path.join(out_dir, name)):
+                os.remove(os.path.join(out_dir, name))
+
+    notes, note_offsets, note_rows = _note_postings(chunks, vault_path)
+    _write_array(os.path.join(out_dir, "note_offsets.u64"), note_offsets)
+    _write_array(os.path.join(out_dir, "note_rows.u32"), note_rows)
+    with open(os.path.join(out_dir, "notes.json"), 'w') as f:
+        json.dump(notes, f)
+    meta['notes'] = len(notes)
+
+    offsets = []
+    tmp = os.path.join(out_dir, "chunks.jsonl.tmp")
+    with open(tmp, 'wb') as f:
+        for chunk in chunks:
+            offsets.append(f.tell())
+            f.write(json.dumps({'id': chunk['id'], 'text': chunk['text'], 'metadata': chunk['metadata']}).encode() + b"\n")
+        offsets.append(f.tell())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(out_dir, "chunks.jsonl"))
+    _write_array(os.path.join(out_dir, "chunks.idx"), np.asarray(offsets, dtype=np.uint64))
+
+    with open(os.path.join(out_dir, "meta.json"), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+class VectorIndex:
+    """Busca k-NN (produto interno em vetores normalizados) sobre uma exportação mapeada
+
+    Todos os arquivos são abertos com np.memmap em modo somente leitura: vários
+    processos compartilham as mesmas páginas do page cache sem cópias. Com IVF
+    só as IVF_NPROBE listas mais próximas da consulta são varridas. Seguro para
+    uso concorrente entre threads (chunks lidos com os.pread).
+    """
+
+    def __init__(self, generation_dir):
+        self.path = os.path.join(generation_dir, VECTORS_DIRNAME)
+        with open(os.path.join(self.path, "meta.json"), 'r') as f:
+            self.meta = json.load(f)
+        self.count = self.meta['count']
+        self.dim = self.meta['dim']
+        self.quantization = self.meta['quantization']
+        shape = (self.count, self.dim)
+
+        if self.quantization == "int8":
+            self.codes = np.memmap(os.path.join(self.path, "codes.i8"), dtype=np.int8, mode='r', shape=shape)
+            self.scales = np.memmap(os.path.join(self.path, "scales.f32"), dtype=np.float32, mode='r')
+            self.store_rows = np.memmap(os.path.join(self.path, "store_rows.u32"), dtype=np.uint32, mode='r')
+            store_path = self.meta['store_vectors_path']
+            store_count = os.path.getsize(store_path) // (self.dim * 4)
+            self.full = np.memmap(store_path, dtype=np.float32, mode='r', shape=(store_count, self.dim))
+        else:
+            self.vectors = np.memmap(os.path.join(self.path, "vectors.f32"), dtype=np.float32, mode='r', shape=shape)
+        self.ivf_lists = self.meta.get('ivf_lists', 0)
+        if self.ivf_lists:
+            self.centroids = np.memmap(os.path.join(self.path, "ivf_centroids.f32"), dtype=np.float32, mode='r',
+                                       shape=(self.ivf_lists, self.dim))
+            self.ivf_offsets = np.memmap(os.path.join(self.path, "ivf_offsets.u64"), dtype=np.uint64, mode='r')
+            self.ivf_rows = np.memmap(os.path.join(self.path, "ivf_rows.u32"), dtype=np.uint32, mode='r')
+        self.offsets = np.memmap(os.path.join(self.path, "chunks.idx"), dtype=np.uint64, mode='r')
+        self._notes = None
+        self._chunks_fd = os.open(os.path.join(self.path, "chunks.jsonl"), os.O_RDONLY)
+
+    def close(self):
+        if self._chunks_fd is not None:
+            os.close(self._chunks_fd)
+            self._chunks_fd = None
+
+    def __del__(self):
+        # Gerações antigas são liberadas pelo GC quando nenhuma busca as usa mais
+        if getattr(self, '_chunks_fd', None) is not None:
+            self.close()
+
+    def memory_bytes(self):
+        """Bytes varridos por consulta (o que precisa ficar residente para buscas rápidas)"""
+        if self.quantization == "int8":
+            return self.codes.nbytes + self.scales.nbytes
+        return self.vectors.nbytes
+
+    def full_vectors(self, rows):
+        """Vetores float32 (normalizados) das linhas pedidas"""
+        if self.quantization == "int8":
+            return _normalize(self.full[self.store_rows[rows]])
+        return np.asarray(self.vectors[rows])
+
+    def _scan(self, query, rows=None):
+        """Scores aproximados (int8) ou exatos (float32) para todas as linhas ou um subconjunto"""
+        if self.quantization != "int8":
+            data = self.vectors if rows is None else self.vectors[rows]
+            return np.asarray(data @ query)
+        if rows is not None:
+            return (self.codes[rows].astype(np.float32) @ query) * self.scales[rows]
+        scores = np.empty(self.count, dtype=np.float32)
+        for start in range(0, self.count, SCAN_BLOCK_ROWS):
+            block = self.codes[start:start + SCAN_BLOCK_ROWS].astype(np.float32)
+            scores[start:start + len(block)] = (block @ query) * self.scales[start:start + len(block)]
+        return scores
+
+    def _rescore(self, query, candidates, k):
+        """Reordena candidatos em precisão total e retorna (linhas, scores) do top-k"""
+        if self.quantization == "int8":
+            exact = self.full_vectors(candidates) @ query
+        else:
+            exact = self._scan(query, candidates)
+        order = np.argsort(-exact)[:k]
+        return candidates[order], exact[order]
+
+    def _probe(self, query, nprobe):
+        """Linhas das nprobe listas IVF mais próximas da consulta"""
+        nprobe = min(nprobe, self.ivf_lists)
+        nearest = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate([
+            self.ivf_rows[int(self.ivf_offsets[c]):int(self.ivf_offsets[c + 1])] for c in nearest
+        ]).astype(np.int64)
+
+    @property
+    def notes(self):
+        """Índice de metadados por nota (carregado no primeiro filtro)"""
+        if self._notes is None:
+            notes_path = os.path.join(self.path, "notes.json")
+            if not os.path.exists(notes_path):
+                raise ValueError("Exportação sem índice de metadados (gerada antes dos filtros)")
+            with open(notes_path, 'r') as f:
+                notes = json.load(f)
+            self.note_offsets = np.memmap(os.path.join(self.path, "note_offsets.u64"), dtype=np.uint64, mode='r')
+            self.note_rows = np.memmap(os.path.join(self.path, "note_rows.u32"), dtype=np.uint32, mode='r')
+            self._notes = notes
+        return self._notes
+
+    def filter_notes(self, path_prefix=None, tags=None, modified_after=None, modified_before=None):
+        """Posições das notas sob a pasta, com todas as tags e com mtime no intervalo"""
+        wanted = {tag.lstrip("#").lower() for tag in tags or []}
+        selected = []
+        for position, note in enumerate(self.notes):
+            if path_prefix and not note['source'].startswith(path_prefix):
+                continue
+            if wanted and not wanted.issubset(note['tags']):
+                continue
+            if modified_after is not None and (note['mtime'] is None or note['mtime'] < modified_after):
+                continue
+            if modified_before is not None and (note['mtime'] is None or note['mtime'] >= modified_before):
+                continue
+            selected.append(position)
+        return selected
+
+    def filter_sources(self, **filters):
+        return [self.notes[position]['source'] for position in self.filter_notes(**filters)]
+
+    def filter_rows(self, **filters):
+        """Linhas (ordenadas, únicas) dos chunks das notas que passam no filtro"""
+        selected = self.filter_notes(**filters)
+        if not selected:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate([
+            self.note_rows[int(self.note_offsets[p]):int(self.note_offsets[p + 1])] for p in selected
+        ])).astype(np.int64)
+
+    def search(self, query, k=5, rescore_factor=RESCORE_FACTOR, nprobe=IVF_NPROBE, rows=None):
+        """Retorna (linhas, scores) do top-k; nprobe=0 força a varredura completa
+
+        `rows` (de filter_rows) restringe a busca antes da varredura: filtros
+        estreitos varrem só as linhas selecionadas, filtros amplos só as listas
+        IVF visitadas que passam no filtro.
+        """
+        query = _normalize(query)
+        if self.ivf_lists and nprobe:
+            probed = self._probe(query, nprobe)
+            if rows is None:
+                rows = probed
+            elif len(rows) > len(probed):
+                narrowed = probed[np.isin(probed, rows)]
+                if len(narrowed) >= k:
+                    rows = narrowed
+        scores = self._scan(query) if rows is None else self._scan(query, rows)
+        if not len(scores):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        candidates = min(len(scores), k * rescore_factor if self.quantization == "int8" else k)
+        top = np.argpartition(-scores, candidates - 1)[:candidates]
+        return self._rescore(query, top if rows is None else rows[top], k)
+
+    def chunk(self, row):
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(os.pread(self._chunks_fd, end - start, start))
+
+    def results(self, rows, scores):
+        """Chunks (id, score, texto e metadados) das linhas retornadas por search"""
+        return [{**self.chunk(row), 'score': float(score)} for row, score in zip(rows, scores)]
+
+
+class QueryEmbedder:
+    """Embedding da consulta com o mesmo modelo/modo usados no build do índice"""
+
+    def __init__(self, embedding_model, embedding_mode):
+        self.embedding_model = embedding_model
+        self.embedding_mode = embedding_mode
+        self._backend = None
+
+    def embed(self, text):
+        if self._backend is None:
+            if self.embedding_mode == "openai":
+                from embedding_scheduler import EmbeddingScheduler
+                self._backend = EmbeddingScheduler(self.embedding_model, concurrency=1)
+            elif self.embedding_mode == "sentence-transformers":
+                from sentence_transformers import SentenceTransformer
+                self._backend = SentenceTransformer(self.embedding_model)
+            else:
+                raise ValueError(f"Modo de embedding sem suporte em processo: {self.embedding_mode}")
+        if self.embedding_mode == "openai":
+            return self._backend.embed_query(text)
+        return self._backend.encode([text], normalize_embeddings=True)[0].astype(np.float32)
+
+
+def _recall(found, truth):
+    return np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)])
+
+
+def bench_quantization(count, dim, k, queries=200, seed=0):
+    """Recall@k e memória do int8 com rescoring contra a busca exata em float32"""
+    import tempfile
+
+    rng = np.random.default_rng(seed)
+    # Vetores agrupados (como embeddings reais), consultas próximas de pontos do conjunto
+    centers = rng.standard_normal((max(16, count // 500), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), count)] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+    vectors = _normalize(vectors)
+    query_vectors = _normalize(vectors[rng.integers(0, count, queries)]
+                               + 0.3 * rng.standard_normal((queries, dim)).astype(np.float32))
+
+    workdir = tempfile.mkdtemp(prefix="leann-quant-bench-")
+    try:
+        class _Store:
+            vectors_path = os.path.join(workdir, "store.f32")
+
+            @staticmethod
+            def rows_for(keys):
+                return np.arange(len(keys), dtype=np.uint32)
+
+        _write_array(_Store.vectors_path, vectors)
+        chunks = [{'id': str(i), 'text': '', 'metadata': {}} for i in range(count)]
+        keys = [str(i) for i in range(count)]
+        export_vectors(os.path.join(workdir, "f32"), chunks, vectors, "bench", "bench", quantization="none")
+        export_vectors(os.path.join(workdir, "i8"), chunks, vectors, "bench", "bench", store=_Store, keys=keys)
+        exact = VectorIndex(os.path.join(workdir, "f32"))
+        quantized = VectorIndex(os.path.join(workdir, "i8"))
+
+        started = time.perf_counter()
+        truth = [exact.search(q, k, nprobe=0)[0] for q in query_vectors]  # varredura completa, sem IVF
+        exact_ms = (time.perf_counter() - started) * 1000 / queries
+        print(f"Vetores: {count} x {dim}, k={k}, {queries} consultas")
+        print(f"float32: {exact.memory_bytes() / 1e6:.1f} MB varridos, {exact_ms:.2f} ms/consulta")
+        print(f"int8:    {quantized.memory_bytes() / 1e6:.1f} MB varridos "
+              f"({1 - quantized.memory_bytes() / exact.memory_bytes():.0%} a menos)")
+        for factor in (1, 2, 4, 10):
+            started = time.perf_counter()
+            found = [quantized.search(q, k, rescore_factor=factor, nprobe=0)[0] for q in query_vectors]
+            elapsed_ms = (time.perf_counter() - started) * 1000 / queries
+            print(f"  rescoring {factor:>2}x: recall@{k} {_recall(found, truth):.3f}, {elapsed_ms:.2f} ms/consulta")
+        if quantized.ivf_lists:
+            print(f"IVF ({quantized.ivf_lists} listas, int8 + rescoring {RESCORE_FACTOR}x):")
+            for nprobe in (4, 8, 16, 32):
+                started = time.perf_counter()
+                found = [quantized.search(q, k, nprobe=nprobe)[0] for q in query_vectors]
+                elapsed_ms = (time.perf_counter() - started) * 1000 / queries
+                print(f"  nprobe {nprobe:>2}: recall@{k} {_recall(found, truth):.3f}, {elapsed_ms:.2f} ms/consulta")
+        exact.close()
+        quantized.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2] * 1000, samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000
+
+
+def bench_cli(index_name, queries, k, seed=0):
+    """Latência e recall da busca em processo contra `leann search` no mesmo índice"""
+    generation_dir = os.path.realpath(os.path.join(LEANN_INDEXES_DIR, index_name))
+    index = VectorIndex(generation_dir)
+    embedder = QueryEmbedder(index.meta['embedding_model'], index.meta['embedding_mode'])
+    rng = random.Random(seed)
+    probes = [index.chunk(rng.randrange(index.count))['text'][:200] for _ in range(queries)]
+    embedder.embed(probes[0])  # aquece modelo/conexão
+
+    cli_times, embed_times, search_times = [], [], []
+    ivf_recall, source_overlap = [], []
+    for probe in probes:
+        started = time.perf_counter()
+        result = subprocess.run(["leann", "search", index_name, probe, "--top-k", str(k)],
+                                capture_output=True, text=True, timeout=120)
+        cli_times.append(time.perf_counter() - started)
+        cli_sources = set(_SOURCE_LINE_RE.findall(result.stdout))
+
+        started = time.perf_counter()
+        query = embedder.embed(probe)
+        embed_times.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        rows, _ = index.search(query, k)
+        search_times.append(time.perf_counter() - started)
+
+        exhaustive, _ = index.search(query, k, nprobe=0)
+        ivf_recall.append(len(set(rows) & set(exhaustive)) / max(1, len(exhaustive)))
+        if cli_sources:
+            sources = {index.chunk(row)['metadata'].get('source') for row in rows}
+            source_overlap.append(len(sources & cli_sources) / len(cli_sources))
+
+    print(f"Índice {index_name}: {index.count} vetores x {index.dim}, quantização {index.quantization}, "
+          f"{index.ivf_lists or 'sem'} listas IVF, {index.memory_bytes() / 1e6:.1f} MB mapeados")
+    print(f"CLI leann search:  p50 {_percentiles(cli_times)[0]:.0f} ms, p95 {_percentiles(cli_times)[1]:.0f} ms")
+    print(f"Em processo:       p50 {_percentiles(search_times)[0]:.1f} ms, p95 {_percentiles(search_times)[1]:.1f} ms "
+          f"(+ embedding da consulta p50 {_percentiles(embed_times)[0]:.0f} ms)")
+    print(f"Recall@{k} IVF vs varredura completa: {np.mean(ivf_recall):.3f}")
+    if source_overlap:
+        print(f"Fontes em comum com a CLI (top-{k}): {np.mean(source_overlap):.1%}")
+    index.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Índice vetorial mapeado em memória")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    quant = subparsers.add_parser("bench-quant", help="Recall@k e memória do int8 contra float32")
+    quant.add_argument("--vectors", type=int, default=50000)
+    quant.add_argument("--dim", type=int, default=1536)
+    quant.add_argument("--k", type=int, default=10)
+    cli = subparsers.add_parser("bench-cli", help="Busca em processo contra `leann search` no mesmo índice")
+    cli.add_argument("index")
+    cli.add_argument("--queries", type=int, default=50)
+    cli.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "bench-quant":
+        bench_quantization(args.vectors, args.dim, args.k)
+    elif args.command == "bench-cli":
+        bench_cli(args.index, args.queries, args.k)
+
+
+if __name__ == "__main__":
+    sys.exit(main())